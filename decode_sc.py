@@ -1,9 +1,21 @@
 import os
+from pathlib import Path
+
+from system.lib.batch import BatchTask, run_batch, walk_files
+from system.lib.image_writer import ImageWriter
+from system.lib.output_sinks import FolderSink, OutputSink, open_output_sink
+from system.lib.sprite_manifest import (
+    create_sprite_manifest,
+    get_region_name,
+    is_stored,
+    write_sprite_manifest,
+)
 from system.lib.swf import SupercellSWF
 
 
-def _save_shap(swf: SupercellSWF, output_folder):
-    os.makedirs(output_folder, exist_ok=True)
+def _save_shap(swf: SupercellSWF, output_folder, writer):
+    manifest = create_sprite_manifest(swf.shapes)
+    write_sprite_manifest(manifest, Path(output_folder), writer)
     shapes_count = len(swf.shapes)
     for shape_index in range(shapes_count):
         shape = swf.shapes[shape_index]
@@ -12,29 +24,34 @@ def _save_shap(swf: SupercellSWF, output_folder):
         regions_count = len(shape.regions)
         for region_index in range(regions_count):
             region = shape.regions[region_index]
+            name = get_region_name(shape.id, region_index)
+            if not is_stored(manifest, name):
+                continue
             rendered_region = region.render(use_original_size=True)
-            rendered_region.save(f"{output_folder}/shape_{shape.id}_{region_index}.png")
+            writer.write(rendered_region, os.path.join(output_folder, name))
 
 
-def decode_sc(input_folder, output_folder):
-    for file in os.listdir(input_folder):
-        if os.path.isdir(f"{input_folder}/{file}"):
-            decode_sc(f"{input_folder}/{file}", f"{output_folder}/{file}")
-        else:
-            if file.endswith("_tex.sc") or not file.endswith(".sc"):
-                continue
-            # print('[*] Processing {}'.format(f.name))
-            swf = SupercellSWF()
-            file_name = os.path.join(input_folder, file)
-            texture_loaded, use_lzham = swf.load(file_name)
-            print(f"texture_loaded={texture_loaded}, use_lzham={use_lzham}")
+def decode_sc(input_folder, output_folder, sink: OutputSink | None = None):
+    tasks = [
+        BatchTask.create(file_path, file_output_folder, _decode_file)
+        for file_path, file_output_folder in walk_files(
+            Path(input_folder),
+            Path(output_folder),
+            lambda file: file.endswith(".sc") and not file.endswith("_tex.sc"),
+        )
+    ]
+    run_batch(tasks, sink or FolderSink())
+
 
-            # 输出文件夹不存在则创建
-            file_folder = os.path.join(output_folder, file)
-            if not os.path.exists(file_folder):
-                os.makedirs(file_folder)
+def _decode_file(file_path: Path, output_folder: Path, sink):
+    # print('[*] Processing {}'.format(f.name))
+    swf = SupercellSWF()
+    texture_loaded, use_lzham = swf.load(file_path)
+    print(f"texture_loaded={texture_loaded}, use_lzham={use_lzham}")
 
-            _save_shap(swf, file_folder)
+    file_folder = os.path.join(output_folder, file_path.name)
+    with ImageWriter(sink=sink) as writer:
+        _save_shap(swf, file_folder, writer)
 
 
 def main():
@@ -42,10 +59,10 @@ def main():
     input_folder = "./apk/clash-of-clans-16-253-20/assets/"
     # input_folder = "./apk/clash-of-clans-15-83-29/assets/"
     output_folder = "./output/"
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
 
-    decode_sc(input_folder, output_folder)
+    # Loose files create their folders, archives need none
+    with open_output_sink(Path(output_folder)) as sink:
+        decode_sc(input_folder, output_folder, sink)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,14 @@
 import os
-import lzma
-import lzham
 import zstandard
 import struct
+from pathlib import Path
 
 from PIL import Image
 from ktx import load_ktx
+from system.lib.batch import BatchTask, run_batch, walk_files
+from system.lib.compression import decompress_sc as decompress_container
+from system.lib.image_writer import ImageWriter
+from system.lib.output_sinks import FolderSink, OutputSink, open_output_sink
 
 def convert_pixel(pixel, type):
     if type == 0 or type == 1:
@@ -39,49 +42,12 @@ def convert_pixel(pixel, type):
         raise Exception("Unknown pixel type {}.".format(type))
 
 def decompress_sc(data):
-    version = None
-    if data[:2] == b'SC':
-        # Skip the header if there's any
-        pre_version = int.from_bytes(data[2: 6], 'big')
+    container = decompress_container(data)
+    if container.backend is not None:
+        print('[*] Detected {} compression !'.format(container.backend.upper()))
+    return container.payload
 
-        if pre_version == 4:
-            version = int.from_bytes(data[6: 10], 'big')
-            hash_length = int.from_bytes(data[10: 14], 'big')
-            end_block_size = int.from_bytes(data[-4:], 'big')
-
-            data = data[14 + hash_length:-end_block_size - 9]
-
-        else:
-            version = pre_version
-            hash_length = int.from_bytes(data[6: 10], 'big')
-            data = data[10 + hash_length:]
-
-    if version in (None, 1, 3):
-        if data[:4] == b'SCLZ':
-            print('[*] Detected LZHAM compression !')
-
-            dict_size = int.from_bytes(data[4:5], 'big')
-            uncompressed_size = int.from_bytes(data[5:9], 'little')
-            decompressed = lzham.decompress(data[9:], uncompressed_size, {'dict_size_log2': dict_size})
-
-        elif data[:4] == bytes.fromhex('28 B5 2F FD'):
-            print('[*] Detected Zstandard compression !')
-            decompressed = zstandard.decompress(data)
-
-        else:
-            print('[*] Detected LZMA compression !')
-            data = data[0:9] + (b'\x00' * 4) + data[9:]
-            decompressor = lzma.LZMADecompressor()
-
-            output = []
-
-            while decompressor.needs_input:
-                output.append(decompressor.decompress(data))
-
-            decompressed = b''.join(output)
-    return decompressed
-
-def save_image(input_folder, output_folder, file_name, decompressed):
+def save_image(input_folder, output_folder, file_name, decompressed, writer):
     i = 0
     picCount = 0
     while len(decompressed[i:]) > 5:
@@ -173,31 +139,35 @@ def save_image(input_folder, output_folder, file_name, decompressed):
             img = load_ktx(decompressed[i:i + fileSize])
             i += fileSize
 
-        # 输出文件夹不存在则创建
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
-        output_file = os.path.join(output_folder, file_name + ('_' * picCount) + '.png')
+        output_file = os.path.join(output_folder, file_name + ('_' * picCount))
         print('[*] Saving {}'.format(output_file))
-        img.save(output_file, 'PNG')
+        writer.write(img, output_file)
         picCount += 1
 
-def decode_sc(input_folder, output_folder):
-    for file in os.listdir(input_folder):
-        if os.path.isdir(f"{input_folder}/{file}"):
-            decode_sc(f"{input_folder}/{file}", f"{output_folder}/{file}")
-        else:
-            if file.endswith("tex.sc"):
-                with open(f"{input_folder}/{file}", 'rb') as f:
-                    print('[*] Processing {}'.format(f.name))
-                    data = f.read()
-                    d_data = decompress_sc(data)
-                    save_image(input_folder, output_folder, file, d_data)
+def decode_sc(input_folder, output_folder, sink: OutputSink | None = None):
+    tasks = [
+        BatchTask.create(file_path, file_output_folder, decode_file)
+        for file_path, file_output_folder in walk_files(
+            Path(input_folder),
+            Path(output_folder),
+            lambda file: file.endswith("tex.sc"),
+        )
+    ]
+    run_batch(tasks, sink or FolderSink())
+
+def decode_file(file_path, output_folder, sink):
+    with open(file_path, 'rb') as f:
+        print('[*] Processing {}'.format(f.name))
+        data = f.read()
+        d_data = decompress_sc(data)
+        with ImageWriter(sink=sink) as writer:
+            save_image(file_path.parent, output_folder, file_path.name, d_data, writer)
 
 def main():
     input_folder = "./apk/clash-of-clans-16-253-20/assets/"
     output_folder = "./sc/"
-    decode_sc(input_folder, output_folder)
+    with open_output_sink(Path(output_folder)) as sink:
+        decode_sc(input_folder, output_folder, sink)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,12 +1,67 @@
+import math
 import struct
 import liblzfse
+import numpy as np
 
 from PIL import Image
 from texture2ddecoder import decode_astc
 
+ASTC_BLOCK_SIZE = 16
+
 
 def load_ktx(data):
     print('[*] load_ktx')
+    image_data, pixelWidth, pixelHeight, block_width, block_height = read_astc_blocks(data)
+
+    decoded_data = decode_astc(image_data, pixelWidth, pixelHeight, block_width, block_height)
+    return Image.frombytes('RGBA', (pixelWidth, pixelHeight), decoded_data, 'raw', ('BGRA'))
+
+
+def load_ktx_region(data, bbox):
+    """Decodes only the ASTC blocks covering the bbox.
+
+    ASTC blocks are independent, so the covered ones are copied into
+    a smaller block grid and decoded as a texture of their own.
+
+    :param data: KTX file data
+    :param bbox: left, top, right, bottom, clipped to the texture
+    :return: decoded part of the texture
+    """
+
+    image_data, pixelWidth, pixelHeight, block_width, block_height = read_astc_blocks(data)
+
+    left, top, right, bottom = bbox
+    left, top = max(left, 0), max(top, 0)
+    right, bottom = min(right, pixelWidth), min(bottom, pixelHeight)
+    if left >= right or top >= bottom:
+        return Image.new('RGBA', (max(right - left, 0), max(bottom - top, 0)))
+
+    blocks_x = math.ceil(pixelWidth / block_width)
+    blocks_y = math.ceil(pixelHeight / block_height)
+    blocks = np.frombuffer(image_data, np.uint8, blocks_x * blocks_y * ASTC_BLOCK_SIZE).reshape(
+        blocks_y, blocks_x, ASTC_BLOCK_SIZE
+    )
+
+    first_x, first_y = left // block_width, top // block_height
+    last_x, last_y = math.ceil(right / block_width), math.ceil(bottom / block_height)
+    region_blocks = blocks[first_y:last_y, first_x:last_x].tobytes()
+
+    region_width = (last_x - first_x) * block_width
+    region_height = (last_y - first_y) * block_height
+    decoded_data = decode_astc(region_blocks, region_width, region_height, block_width, block_height)
+
+    x, y = left - first_x * block_width, top - first_y * block_height
+    return Image.frombytes('RGBA', (region_width, region_height), decoded_data, 'raw', ('BGRA')).crop(
+        (x, y, x + right - left, y + bottom - top)
+    )
+
+
+def read_astc_blocks(data):
+    """Reads the KTX header and returns the ASTC blocks of the first mip level.
+
+    :return: blocks data, pixel width, pixel height, block width, block height
+    """
+
     header = data[:64]
     ktx_data = data[64:]
 
@@ -35,12 +90,12 @@ def load_ktx(data):
     else:
         block_width, block_height = 8, 8
 
-    key_value_data = ktx_data[:bytesOfKeyValueData]
+    key_value_data = bytes(ktx_data[:bytesOfKeyValueData])
     ktx_data = ktx_data[bytesOfKeyValueData:]
 
     if b'Compression_APPLE' in key_value_data:
         if ktx_data[12:15] == b'bvx':
-            image_data = liblzfse.decompress(ktx_data[12:])
+            image_data = liblzfse.decompress(bytes(ktx_data[12:]))
 
         else:
             raise ValueError('Unsupported compression type: {}'.format(
@@ -50,5 +105,4 @@ def load_ktx(data):
     else:
         image_data = ktx_data[4:]
 
-    decoded_data = decode_astc(image_data, pixelWidth, pixelHeight, block_width, block_height)
-    return Image.frombytes('RGBA', (pixelWidth, pixelHeight), decoded_data, 'raw', ('BGRA'))
+    return image_data, pixelWidth, pixelHeight, block_width, block_height
@@ -0,0 +1,154 @@
+from dataclasses import dataclass
+from typing import List, Tuple
+
+
+@dataclass
+class PackedRect:
+    page: int
+    x: int
+    y: int
+
+
+@dataclass
+class _SkylineSegment:
+    x: int
+    y: int
+    width: int
+
+
+class SkylinePacker:
+    """Packs rects into one page with the bottom-left skyline heuristic.
+
+    The skyline is the top outline of placed rects. A rect goes where its
+    top would be the lowest, then the leftmost, so results depend only on
+    the order of insertions.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+
+        self._skyline = [_SkylineSegment(0, 0, width)]
+
+    def insert(self, width: int, height: int) -> Tuple[int, int] | None:
+        """Places a rect and returns its position, None if it does not fit.
+
+        :param width: rect width
+        :param height: rect height
+        :return: left, top
+        """
+
+        best = None
+        for segment_index, segment in enumerate(self._skyline):
+            y = self._get_fit_y(segment_index, width)
+            if y is None or y + height > self.height:
+                continue
+
+            score = y + height, segment.x
+            if best is None or score < best[0]:
+                best = score, segment_index, y
+
+        if best is None:
+            return None
+
+        _, segment_index, y = best
+        x = self._skyline[segment_index].x
+        self._add_segment(segment_index, _SkylineSegment(x, y + height, width))
+        return x, y
+
+    def get_used_size(self) -> Tuple[int, int]:
+        """Returns the width and height actually covered by rects."""
+
+        used_segments = [segment for segment in self._skyline if segment.y > 0]
+        if not used_segments:
+            return 0, 0
+
+        width = max(segment.x + segment.width for segment in used_segments)
+        height = max(segment.y for segment in used_segments)
+        return width, height
+
+    def _get_fit_y(self, segment_index: int, width: int) -> int | None:
+        x = self._skyline[segment_index].x
+        if x + width > self.width:
+            return None
+
+        y = 0
+        width_left = width
+        while width_left > 0:
+            segment = self._skyline[segment_index]
+            y = max(y, segment.y)
+            width_left -= segment.width
+            segment_index += 1
+        return y
+
+    def _add_segment(self, segment_index: int, new_segment: _SkylineSegment) -> None:
+        self._skyline.insert(segment_index, new_segment)
+
+        # Segments under the new one are cut or removed
+        new_right = new_segment.x + new_segment.width
+        next_index = segment_index + 1
+        while next_index < len(self._skyline):
+            segment = self._skyline[next_index]
+            if segment.x >= new_right:
+                break
+
+            overlap = new_right - segment.x
+            if overlap < segment.width:
+                segment.x += overlap
+                segment.width -= overlap
+                break
+
+            del self._skyline[next_index]
+
+        # Neighbours at the same height become one segment
+        merged = [self._skyline[0]]
+        for segment in self._skyline[1:]:
+            if segment.y == merged[-1].y:
+                merged[-1].width += segment.width
+            else:
+                merged.append(segment)
+        self._skyline = merged
+
+
+def pack_rects(
+    sizes: List[Tuple[int, int]], page_size: Tuple[int, int], padding: int = 0
+) -> Tuple[List[PackedRect], List[Tuple[int, int]]]:
+    """Packs rects into as many pages as needed, deterministically.
+
+    Rects are placed from the tallest, ties broken by width and index.
+    Rects bigger than a page get a page of their own size.
+
+    :param sizes: width and height of every rect
+    :param page_size: maximal page width and height
+    :param padding: empty pixels kept after every rect
+    :return: page and position of every rect, used size of every page
+    """
+
+    page_width, page_height = page_size
+
+    order = sorted(
+        range(len(sizes)), key=lambda index: (-sizes[index][1], -sizes[index][0], index)
+    )
+
+    packers: List[SkylinePacker] = []
+    packed: List[PackedRect | None] = [None] * len(sizes)
+    for rect_index in order:
+        width, height = sizes[rect_index]
+        width, height = width + padding, height + padding
+
+        for page_index, packer in enumerate(packers):
+            position = packer.insert(width, height)
+            if position is not None:
+                packed[rect_index] = PackedRect(page_index, *position)
+                break
+        else:
+            packer = SkylinePacker(max(page_width, width), max(page_height, height))
+            packers.append(packer)
+            packed[rect_index] = PackedRect(len(packers) - 1, *packer.insert(width, height))  # type: ignore
+
+    page_sizes = []
+    for packer in packers:
+        used_width, used_height = packer.get_used_size()
+        page_sizes.append((max(used_width - padding, 1), max(used_height - padding, 1)))
+
+    return packed, page_sizes  # type: ignore
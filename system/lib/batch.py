@@ -0,0 +1,212 @@
+import io
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, List, Tuple
+
+from loguru import logger
+
+from system.lib.config import config
+from system.lib.output_sinks import FolderSink, MemorySink, OutputSink
+from system.localization import locale
+
+# Handler of one input, called with the input path, output folder and sink
+BatchHandler = Callable[[Path, Path, OutputSink], None]
+
+NAME_COLUMN_WIDTH = 40
+
+
+@dataclass
+class BatchTask:
+    path: Path
+    output_folder: Path
+    handler: BatchHandler
+    # Bytes of input, larger tasks are started first
+    size: int = 0
+
+    @staticmethod
+    def create(path: Path, output_folder: Path, handler: BatchHandler) -> "BatchTask":
+        return BatchTask(path, output_folder, handler, get_input_size(path))
+
+
+@dataclass
+class BatchResult:
+    name: str
+    size: int
+    elapsed: float
+    # First error logged by the handler, None if it succeeded
+    error: str | None
+    # Console output of the handler, only kept when run in a worker
+    output: str = ""
+
+
+def run_batch(
+    tasks: List[BatchTask], sink: OutputSink, workers: int | None = None
+) -> List[BatchResult]:
+    """Runs tasks in worker processes, the largest inputs first.
+
+    Output of a worker is kept until its task is done and then printed at
+    once, so logs of different files do not interleave. Files written by
+    workers go to disk directly, or come back to the parent to be written
+    to an archive sink. A failed task does not stop the others.
+
+    :param tasks: inputs to handle
+    :param sink: sink for the output files
+    :param workers: number of processes, the configured number if not given
+    :return: results in the order tasks were finished in
+    """
+
+    if workers is None:
+        workers = config.batch_workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+
+    tasks = sorted(tasks, key=lambda task: task.size, reverse=True)
+    logger.info(locale.batch_started % (len(tasks), workers))
+    print()
+
+    started = time.perf_counter()
+    results = []
+    if workers == 1:
+        for task in tasks:
+            results.append(_run_task(task, sink))
+    else:
+        uses_memory_sink = not isinstance(sink, FolderSink)
+        with multiprocessing.Pool(
+            workers, initializer=_init_worker, initargs=(uses_memory_sink,)
+        ) as pool:
+            for result, entries in pool.imap_unordered(_run_worker_task, tasks):
+                for path, data in entries:
+                    sink.write(path, data)
+
+                sys.stdout.write(result.output)
+                sys.stdout.flush()
+                if result.error is not None:
+                    logger.error(locale.batch_failed % (result.name, result.error))
+                results.append(result)
+
+    _print_summary(results, time.perf_counter() - started)
+    return results
+
+
+def walk_files(
+    input_folder: Path, output_folder: Path, predicate: Callable[[str], bool]
+) -> Iterable[Tuple[Path, Path]]:
+    """Finds files in a tree, along with their folders in the output tree.
+
+    :param input_folder: root of the input tree
+    :param output_folder: root of the output tree
+    :param predicate: whether a file name is taken
+    :return: file paths and output folders
+    """
+
+    for folder, _, files in os.walk(input_folder):
+        relative_folder = os.path.relpath(folder, input_folder)
+        for file in sorted(files):
+            if predicate(file):
+                yield Path(folder) / file, output_folder / relative_folder
+
+
+def get_input_size(path: Path) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+
+    size = 0
+    for folder, _, files in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(folder, file)) for file in files)
+    return size
+
+
+def _run_task(task: BatchTask, sink: OutputSink) -> BatchResult:
+    errors = []
+    handler_id = logger.add(errors.append, level="ERROR", format="{message}")
+
+    started = time.perf_counter()
+    try:
+        task.handler(task.path, task.output_folder, sink)
+    except (Exception, SystemExit) as exception:
+        logger.exception(
+            locale.error
+            % (
+                exception.__class__.__module__,
+                exception.__class__.__name__,
+                exception,
+            )
+        )
+    finally:
+        logger.remove(handler_id)
+
+    return BatchResult(
+        task.path.name,
+        task.size,
+        time.perf_counter() - started,
+        errors[0].record["message"] if errors else None,
+    )
+
+
+_worker_uses_memory_sink: bool = False
+
+
+def _init_worker(uses_memory_sink: bool) -> None:
+    global _worker_uses_memory_sink
+
+    _worker_uses_memory_sink = uses_memory_sink
+
+    # Messages go to the output of the current task, the parent logs errors
+    logger.remove()
+    logger.add(
+        lambda message: sys.stdout.write(message),
+        format="<lvl>[{level}] {message}</lvl>",
+        level="INFO",
+    )
+
+
+def _run_worker_task(task: BatchTask) -> Tuple[BatchResult, List[Tuple[str, bytes]]]:
+    sink = MemorySink() if _worker_uses_memory_sink else FolderSink()
+
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result = _run_task(task, sink)
+    result.output = _collapse_progress(output.getvalue())
+
+    return result, sink.entries if isinstance(sink, MemorySink) else []
+
+
+def _collapse_progress(output: str) -> str:
+    """Keeps the last state of progress bars redrawn with carriage returns."""
+
+    return "\n".join(line.rsplit("\r", 1)[-1] for line in output.split("\n"))
+
+
+def _print_summary(results: List[BatchResult], elapsed: float) -> None:
+    columns = locale.batch_columns.split(",")
+    logger.info(
+        f"{columns[0]:<{NAME_COLUMN_WIDTH}} {columns[1]:>10} {columns[2]:>9}  "
+        f"{columns[3]}"
+    )
+    for result in sorted(results, key=lambda result: result.name):
+        name = result.name
+        if len(name) > NAME_COLUMN_WIDTH:
+            name = "..." + name[-NAME_COLUMN_WIDTH + 3 :]
+        status = locale.batch_ok if result.error is None else result.error
+        logger.info(
+            f"{name:<{NAME_COLUMN_WIDTH}} {result.size / 2**20:>10.2f} "
+            f"{result.elapsed:>9.2f}  {status}"
+        )
+
+    total_size = sum(result.size for result in results) / 2**20
+    failed_count = sum(result.error is not None for result in results)
+    logger.info(
+        locale.batch_summary
+        % (
+            len(results),
+            failed_count,
+            total_size,
+            elapsed,
+            total_size / max(elapsed, 1e-9),
+        )
+    )
+    print()
@@ -0,0 +1,219 @@
+from typing import Callable, Dict, TypeAlias
+
+import numpy as np
+from PIL import Image
+
+# Blend modes stored per movie clip bind, numbered as Flash BlendMode
+NORMAL = 0
+NORMAL_ALTERNATIVE = 1
+LAYER = 2
+MULTIPLY = 3
+SCREEN = 4
+LIGHTEN = 5
+DARKEN = 6
+DIFFERENCE = 7
+ADD = 8
+SUBTRACT = 9
+INVERT = 10
+ALPHA = 11
+ERASE = 12
+OVERLAY = 13
+HARDLIGHT = 14
+
+# Kernels get premultiplied float RGBA arrays in 0..1: source, backdrop.
+# Each returns the blended colors and alpha of the backdrop area.
+BlendFunction: TypeAlias = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def to_premultiplied(image: Image.Image) -> np.ndarray:
+    """Converts an image to a premultiplied float32 RGBA array in 0..1.
+
+    :param image: image in any mode
+    :return: (H, W, 4) array
+    """
+
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+
+    pixels = np.asarray(image, dtype=np.float32) / 255
+    pixels[..., :3] *= pixels[..., 3:]
+    return pixels
+
+
+def from_premultiplied(pixels: np.ndarray) -> Image.Image:
+    """Converts a premultiplied RGBA array back to a straight alpha image.
+
+    :param pixels: (H, W, 4) array in 0..1
+    :return: RGBA image
+    """
+
+    alpha = pixels[..., 3:]
+    colors = np.divide(
+        pixels[..., :3], alpha, out=np.zeros_like(pixels[..., :3]), where=alpha > 0
+    )
+
+    straight = np.concatenate((colors, alpha), axis=-1)
+    return Image.fromarray(
+        np.rint(np.clip(straight, 0, 1) * 255).astype(np.uint8), "RGBA"
+    )
+
+
+def blend(
+    backdrop: np.ndarray, source: np.ndarray, x: int, y: int, blend_mode: int
+) -> None:
+    """Blends the source array into the backdrop array in place.
+
+    Parts of the source outside the backdrop are skipped.
+
+    :param backdrop: premultiplied canvas
+    :param source: premultiplied image to draw
+    :param x: left of the source on the canvas
+    :param y: top of the source on the canvas
+    :param blend_mode: blend mode of the source
+    """
+
+    backdrop_height, backdrop_width = backdrop.shape[:2]
+    source_height, source_width = source.shape[:2]
+
+    left, top = max(x, 0), max(y, 0)
+    right = min(x + source_width, backdrop_width)
+    bottom = min(y + source_height, backdrop_height)
+    if left >= right or top >= bottom:
+        return
+
+    source = source[top - y : bottom - y, left - x : right - x]
+    area = backdrop[top:bottom, left:right]
+
+    blend_function = _blend_functions.get(blend_mode, _blend_normal)
+    area[:] = blend_function(source, area)
+
+
+def _separable(
+    source: np.ndarray,
+    backdrop: np.ndarray,
+    mixed_colors: np.ndarray,
+) -> np.ndarray:
+    """Finishes a separable blend mode from its mixed colors.
+
+    :param mixed_colors: premultiplied B(Cb, Cs) * As * Ab
+    """
+
+    source_alpha = source[..., 3:]
+    backdrop_alpha = backdrop[..., 3:]
+
+    colors = (
+        mixed_colors
+        + source[..., :3] * (1 - backdrop_alpha)
+        + backdrop[..., :3] * (1 - source_alpha)
+    )
+    alpha = source_alpha + backdrop_alpha - source_alpha * backdrop_alpha
+    return np.concatenate((colors, alpha), axis=-1)
+
+
+def _blend_normal(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return source + backdrop * (1 - source[..., 3:])
+
+
+def _blend_multiply(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return _separable(source, backdrop, source[..., :3] * backdrop[..., :3])
+
+
+def _blend_screen(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return source + backdrop - source * backdrop
+
+
+def _blend_lighten(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return _separable(
+        source,
+        backdrop,
+        np.maximum(
+            source[..., :3] * backdrop[..., 3:], backdrop[..., :3] * source[..., 3:]
+        ),
+    )
+
+
+def _blend_darken(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return _separable(
+        source,
+        backdrop,
+        np.minimum(
+            source[..., :3] * backdrop[..., 3:], backdrop[..., :3] * source[..., 3:]
+        ),
+    )
+
+
+def _blend_difference(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return _separable(
+        source,
+        backdrop,
+        np.abs(
+            source[..., :3] * backdrop[..., 3:] - backdrop[..., :3] * source[..., 3:]
+        ),
+    )
+
+
+def _blend_add(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return np.minimum(source + backdrop, 1)
+
+
+def _blend_subtract(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    result = _blend_normal(source, backdrop)
+    result[..., :3] = np.maximum(backdrop[..., :3] - source[..., :3], 0)
+    return result
+
+
+def _blend_invert(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    source_alpha = source[..., 3:]
+
+    result = backdrop.copy()
+    result[..., :3] = (backdrop[..., 3:] - backdrop[..., :3]) * source_alpha + backdrop[
+        ..., :3
+    ] * (1 - source_alpha)
+    return result
+
+
+def _blend_alpha(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return backdrop * source[..., 3:]
+
+
+def _blend_erase(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return backdrop * (1 - source[..., 3:])
+
+
+def _hard_light(top: np.ndarray, bottom: np.ndarray) -> np.ndarray:
+    top_colors, top_alpha = top[..., :3], top[..., 3:]
+    bottom_colors, bottom_alpha = bottom[..., :3], bottom[..., 3:]
+
+    return np.where(
+        2 * top_colors <= top_alpha,
+        2 * top_colors * bottom_colors,
+        top_alpha * bottom_alpha
+        - 2 * (bottom_alpha - bottom_colors) * (top_alpha - top_colors),
+    )
+
+
+def _blend_overlay(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return _separable(source, backdrop, _hard_light(backdrop, source))
+
+
+def _blend_hardlight(source: np.ndarray, backdrop: np.ndarray) -> np.ndarray:
+    return _separable(source, backdrop, _hard_light(source, backdrop))
+
+
+_blend_functions: Dict[int, BlendFunction] = {
+    NORMAL: _blend_normal,
+    NORMAL_ALTERNATIVE: _blend_normal,
+    LAYER: _blend_normal,
+    MULTIPLY: _blend_multiply,
+    SCREEN: _blend_screen,
+    LIGHTEN: _blend_lighten,
+    DARKEN: _blend_darken,
+    DIFFERENCE: _blend_difference,
+    ADD: _blend_add,
+    SUBTRACT: _blend_subtract,
+    INVERT: _blend_invert,
+    ALPHA: _blend_alpha,
+    ERASE: _blend_erase,
+    OVERLAY: _blend_overlay,
+    HARDLIGHT: _blend_hardlight,
+}
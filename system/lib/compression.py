@@ -0,0 +1,375 @@
+import lzma
+import os
+import struct
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import List
+
+from loguru import logger
+
+import lzham
+import zstandard
+
+from system.lib.config import config
+from system.localization import locale
+
+ZSTD = "zstd"
+LZMA = "lzma"
+LZHAM = "lzham"
+
+# Defaults of sc_compression, kept for files of the same size
+DEFAULT_ZSTD_LEVEL = 3
+DEFAULT_DICT_SIZE_LOG2 = 18
+LZMA_HEADER_SIZE = 13
+LZMA_PROPERTIES_SIZE = 5
+# Properties and the 4 byte payload size SC files keep in place of 8 bytes
+LZMA_SC_HEADER_SIZE = 9
+SCLZ_HEADER_SIZE = 9
+LZHAM_MAX_HELPER_THREADS = 64
+LZHAM_MAX_LEVEL = 4
+
+FAST_LEVELS = {ZSTD: 1, LZMA: 0, LZHAM: 0}
+
+SC_MAGIC = b"SC"
+SCLZ_MAGIC = b"SCLZ"
+SIG_MAGIC = b"Sig:"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+METADATA_MAGIC = b"START"
+SIG_HEADER_SIZE = 68
+# Versions with a little endian metadata table in place of the hash
+METADATA_TABLE_VERSIONS = (0x05000000, 0x06000000)
+
+# Payload part benchmarked by the tuner and the levels it tries
+TUNING_SAMPLE_SIZE = 1 << 20
+TUNING_LEVELS = {ZSTD: [1, 3, 9, 19], LZMA: [None, 9], LZHAM: [0, 2, 4]}
+
+
+@dataclass
+class CompressionSettings:
+    backend: str
+    level: int | None = None
+    # None for the backend default
+    dict_size_log2: int | None = None
+    # -1 for all cores, 0 to compress on the calling thread
+    threads: int = 0
+
+    @property
+    def file_version(self) -> int:
+        """SC header version, 3 marks Zstandard data."""
+
+        return 3 if self.backend == ZSTD else 1
+
+    def describe(self) -> str:
+        parts = [self.backend.upper()]
+        if self.level is not None:
+            parts.append(f"level {self.level}")
+        if self.dict_size_log2 is not None:
+            parts.append(f"dict 2^{self.dict_size_log2}")
+        if self.threads:
+            parts.append(f"threads {self.threads}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        """Settings stored in the .xcod, threads depend on the machine."""
+
+        return {
+            "backend": self.backend,
+            "level": self.level,
+            "dict_size_log2": self.dict_size_log2,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "CompressionSettings":
+        return CompressionSettings(
+            data["backend"],
+            data.get("level"),
+            data.get("dict_size_log2"),
+            config.compression_threads,
+        )
+
+
+def get_compression_settings(
+    use_lzham: bool, backend: str | None = None
+) -> CompressionSettings:
+    """Returns the configured settings for a file.
+
+    Without a configured backend, files are compressed with LZHAM if they
+    were and with Zstandard otherwise.
+
+    :param use_lzham: file was compressed with LZHAM
+    :param backend: backend the file must keep, the configured one if None
+    :return: settings
+    """
+
+    backend = backend or config.compression_backend or (LZHAM if use_lzham else ZSTD)
+    if backend not in FAST_LEVELS:
+        raise ValueError(f"Unknown compression backend: {backend}")
+
+    level = config.compression_level
+    if level is None and config.fast_compression:
+        level = FAST_LEVELS[backend]
+
+    return CompressionSettings(
+        backend,
+        level,
+        config.compression_dict_size_log2 or None,
+        config.compression_threads,
+    )
+
+
+def tune_compression(
+    sample: bytes, payload_size: int, time_budget: float
+) -> CompressionSettings:
+    """Picks the settings with the smallest output within a time budget.
+
+    Every candidate compresses the sample, its size and time are scaled to
+    the whole payload. A configured backend limits candidates to its
+    levels. If none fits the budget, the fastest one is picked.
+
+    :param sample: start of the payload
+    :param payload_size: size of the whole payload
+    :param time_budget: seconds the whole payload may take to compress
+    :return: picked settings
+    """
+
+    backends = [config.compression_backend] if config.compression_backend else []
+    if not backends:
+        backends = list(TUNING_LEVELS)
+
+    scale = payload_size / max(len(sample), 1)
+    results = []
+    for backend in backends:
+        for level in TUNING_LEVELS[backend]:
+            settings = CompressionSettings(
+                backend,
+                level,
+                config.compression_dict_size_log2 or None,
+                config.compression_threads,
+            )
+
+            started = time.perf_counter()
+            compressor = create_compressor(settings, len(sample))
+            size = len(compressor.compress(sample)) + len(compressor.flush())
+            elapsed = time.perf_counter() - started
+            results.append((size * scale, elapsed * scale, settings))
+
+    fitting = [result for result in results if result[1] <= time_budget]
+    if fitting:
+        size, elapsed, settings = min(fitting, key=lambda result: result[0])
+    else:
+        size, elapsed, settings = min(results, key=lambda result: result[1])
+
+    logger.info(locale.compression_tuned % (settings.describe(), size, elapsed))
+    return settings
+
+
+@dataclass
+class ScContainer:
+    payload: bytes
+    # None for payloads stored as they are
+    backend: str | None
+    # None for files without the SC header
+    version: int | None = None
+    # Trailer after the compressed data, START not included
+    metadata: memoryview | None = None
+    # Whether the header has version 4 in front of the real version
+    has_metadata_header: bool = False
+    # Dictionary size of LZMA and LZHAM data, None for other backends
+    dict_size_log2: int | None = None
+
+
+def decompress_sc(data: bytes | memoryview) -> ScContainer:
+    """Decompresses a .sc file, with or without the SC header.
+
+    Headers and metadata trailers are parsed by offset on a memoryview, so
+    the file is not copied before it is decompressed. LZHAM is the only
+    backend that takes a copy of the compressed data, pylzham needs bytes.
+
+    :param data: file contents
+    :return: payload, backend and metadata of the file
+    """
+
+    view = memoryview(data)
+    version = None
+    metadata = None
+    has_metadata_header = False
+    dict_size_log2 = None
+
+    if view[: len(SIG_MAGIC)] == SIG_MAGIC:
+        view = view[SIG_HEADER_SIZE:]
+
+    if view[: len(SC_MAGIC)] == SC_MAGIC and view[: len(SCLZ_MAGIC)] != SCLZ_MAGIC:
+        (version,) = struct.unpack_from(">I", view, 2)
+        offset = 6
+        if version == 4:
+            has_metadata_header = True
+            # START, the metadata and its size follow the compressed data
+            (version,) = struct.unpack_from(">I", view, offset)
+            (metadata_size,) = struct.unpack_from(">I", view, len(view) - 4)
+            offset += 4
+            metadata_offset = len(view) - 4 - metadata_size
+            metadata = view[metadata_offset:-4]
+            view = view[: metadata_offset - len(METADATA_MAGIC)]
+
+        if version in METADATA_TABLE_VERSIONS:
+            if version == METADATA_TABLE_VERSIONS[1]:
+                offset += 2
+            (table_size,) = struct.unpack_from("<I", view, offset)
+            offset += 4 + table_size
+        else:
+            (hash_size,) = struct.unpack_from(">I", view, offset)
+            offset += 4 + hash_size
+        view = view[offset:]
+
+    trailer = b""
+    if view[: len(SCLZ_MAGIC)] == SCLZ_MAGIC:
+        backend = LZHAM
+        dict_size_log2, payload_size = struct.unpack_from("<BI", view, 4)
+        payload = lzham.decompress(
+            bytes(view[SCLZ_HEADER_SIZE:]),
+            payload_size,
+            {"dict_size_log2": dict_size_log2},
+        )
+    elif view[: len(ZSTD_MAGIC)] == ZSTD_MAGIC:
+        backend = ZSTD
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        payload = decompressor.decompress(view)
+        trailer = decompressor.unused_data
+    elif version is not None or _is_lzma(view):
+        backend = LZMA
+        (dict_size,) = struct.unpack_from("<I", view, 1)
+        dict_size_log2 = dict_size.bit_length() - 1
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_ALONE)
+        # The alone header keeps the size in 8 bytes, SC files in 4
+        payload = decompressor.decompress(
+            bytes(view[:LZMA_SC_HEADER_SIZE]) + bytes(4)
+        ) + decompressor.decompress(view[LZMA_SC_HEADER_SIZE:])
+        trailer = decompressor.unused_data
+    else:
+        return ScContainer(bytes(view), None)
+
+    if metadata is None and trailer.startswith(METADATA_MAGIC):
+        metadata = memoryview(trailer)[len(METADATA_MAGIC) :]
+    return ScContainer(
+        payload, backend, version, metadata, has_metadata_header, dict_size_log2
+    )
+
+
+def _is_lzma(view: memoryview) -> bool:
+    # Dictionary sizes of SC files leave the two bytes after properties empty
+    return len(view) > LZMA_SC_HEADER_SIZE and view[1] == 0 and view[2] == 0
+
+
+class StreamCompressor(ABC):
+    """Compresses a payload of known size part by part into an SC body."""
+
+    @abstractmethod
+    def compress(self, data: bytes | memoryview) -> bytes:
+        pass
+
+    @abstractmethod
+    def flush(self) -> bytes:
+        pass
+
+
+def create_compressor(
+    settings: CompressionSettings, payload_size: int
+) -> StreamCompressor:
+    if settings.backend == ZSTD:
+        return _ZstdCompressor(settings, payload_size)
+    elif settings.backend == LZMA:
+        return _LzmaCompressor(settings, payload_size)
+    return _LzhamCompressor(settings, payload_size)
+
+
+class _ZstdCompressor(StreamCompressor):
+    def __init__(self, settings: CompressionSettings, payload_size: int):
+        parameters = zstandard.ZstdCompressionParameters.from_level(
+            DEFAULT_ZSTD_LEVEL if settings.level is None else settings.level,
+            window_log=settings.dict_size_log2 or 0,
+            threads=settings.threads,
+        )
+        self._compressor = zstandard.ZstdCompressor(
+            compression_params=parameters
+        ).compressobj(payload_size)
+
+    def compress(self, data: bytes | memoryview) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _LzmaCompressor(StreamCompressor):
+    """LZMA alone stream, its 8 byte size replaced with a 4 byte one.
+
+    The format has no threaded encoder, settings threads are ignored.
+    """
+
+    def __init__(self, settings: CompressionSettings, payload_size: int):
+        lzma_filter = {
+            "id": lzma.FILTER_LZMA1,
+            "dict_size": 1 << (settings.dict_size_log2 or DEFAULT_DICT_SIZE_LOG2),
+        }
+        if settings.level is None:
+            lzma_filter.update(lc=3, lp=0, pb=2, mode=lzma.MODE_NORMAL)
+        else:
+            lzma_filter["preset"] = settings.level
+
+        self._compressor = lzma.LZMACompressor(lzma.FORMAT_ALONE, filters=[lzma_filter])
+        self._payload_size = payload_size
+        self._header = b""
+
+    def compress(self, data: bytes | memoryview) -> bytes:
+        return self._fix_header(self._compressor.compress(data))
+
+    def flush(self) -> bytes:
+        return self._fix_header(self._compressor.flush())
+
+    def _fix_header(self, compressed: bytes) -> bytes:
+        if len(self._header) >= LZMA_HEADER_SIZE:
+            return compressed
+
+        self._header += compressed
+        if len(self._header) < LZMA_HEADER_SIZE:
+            return b""
+
+        return (
+            self._header[:LZMA_PROPERTIES_SIZE]
+            + struct.pack("<I", self._payload_size)
+            + self._header[LZMA_HEADER_SIZE:]
+        )
+
+
+class _LzhamCompressor(StreamCompressor):
+    """SCLZ block, pylzham has no streaming compressor, so parts are kept."""
+
+    def __init__(self, settings: CompressionSettings, payload_size: int):
+        self._filters = {
+            "dict_size_log2": settings.dict_size_log2 or DEFAULT_DICT_SIZE_LOG2
+        }
+        if settings.level is not None:
+            self._filters["level"] = min(settings.level, LZHAM_MAX_LEVEL)
+        if settings.threads:
+            threads = settings.threads
+            if threads < 0:
+                threads = os.cpu_count() or 1
+            # Helper threads work along with the calling one
+            self._filters["max_helper_threads"] = min(
+                threads - 1, LZHAM_MAX_HELPER_THREADS
+            )
+
+        self._payload_size = payload_size
+        self._parts: List[bytes] = []
+
+    def compress(self, data: bytes | memoryview) -> bytes:
+        self._parts.append(bytes(data))
+        return b""
+
+    def flush(self) -> bytes:
+        payload = b"".join(self._parts)
+        self._parts.clear()
+        return struct.pack(
+            "<4sBI", b"SCLZ", self._filters["dict_size_log2"], self._payload_size
+        ) + lzham.compress(payload, self._filters)
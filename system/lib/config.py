@@ -16,6 +16,25 @@ class Config:
             "has_update",
             "last_update",
             "auto_update",
+            "image_format",
+            "png_compress_level",
+            "png_optimize",
+            "output_archive",
+            "pack_sprite_atlases",
+            "cut_sprites_workers",
+            "render_movie_clips",
+            "movie_clips_apng",
+            "repack_sheets",
+            "incremental_encode",
+            "resize_sheets",
+            "compression_backend",
+            "compression_level",
+            "compression_dict_size_log2",
+            "compression_threads",
+            "fast_compression",
+            "compression_auto_tune",
+            "compression_time_budget",
+            "batch_workers",
         )
 
         self.initialized: bool = False
@@ -24,6 +43,42 @@ class Config:
         self.has_update: bool = False
         self.last_update: int = -1
         self.auto_update: bool = False
+        # Output of decoded textures and sprites, see system.lib.image_output
+        self.image_format: str = "png"
+        self.png_compress_level: int = 6
+        self.png_optimize: bool = False
+        # "zip" or "tar" to write a run into one archive, see output_sinks
+        self.output_archive: str = ""
+        # Sprites also packed into atlases with JSON, see features.sprite_atlases
+        self.pack_sprite_atlases: bool = False
+        # Processes cutting sprites of one file, 0 for one per core. Files
+        # decoded in a batch are cut on one process, see features.cut_sprites
+        self.cut_sprites_workers: int = 1
+        # Movie clip timelines exported along with sprites, as sprite sheets
+        # with JSON frame tables or as APNG, see features.movie_clips
+        self.render_movie_clips: bool = False
+        self.movie_clips_apng: bool = False
+        # Encoded sheets packed tightly, see features.repack_sheets
+        self.repack_sheets: bool = False
+        # Only changed sprites are placed again, see features.encode_cache
+        self.incremental_encode: bool = True
+        # Sheets of other size than in the .xcod are resized to it when
+        # encoded, files of a batch are encoded with no one to ask
+        self.resize_sheets: bool = True
+        # Output compression, see system.lib.compression. An empty backend
+        # keeps the one of the input file, None and 0 keep codec defaults
+        self.compression_backend: str = ""
+        self.compression_level: int | None = None
+        self.compression_dict_size_log2: int = 0
+        self.compression_threads: int = 0
+        self.fast_compression: bool = False
+        # Codec picked per file by benchmarking a payload sample, the pick
+        # is stored in the .xcod. Budget is in seconds of compression time
+        self.compression_auto_tune: bool = False
+        self.compression_time_budget: float = 10.0
+        # Processes handling files of a batch, see system.lib.batch. 0 for
+        # one per core
+        self.batch_workers: int = 0
 
         self.load()
 
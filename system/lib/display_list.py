@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from system.lib.blending import NORMAL, NORMAL_ALTERNATIVE
+from system.lib.matrices.color_transform import (
+    COLOR_TRANSFORM_SIZE,
+    IDENTITY_COLOR_TRANSFORM,
+    multiply_color_transforms,
+)
+from system.lib.matrices.matrix2x3 import Matrix2x3, multiply_matrices
+from system.lib.rendering import Sides, transform_sides_array
+
+
+@dataclass
+class DisplayList:
+    """Shapes drawn by one movie clip frame, nesting already resolved.
+
+    Rows are in drawing order. Matrices and color transforms are composed
+    from the movie clip down to every shape, so nothing has to walk binds,
+    matrix banks or child timelines again.
+    """
+
+    shape_ids: np.ndarray  # (K,) shape ids
+    matrices: np.ndarray  # (K, 2, 3) shape to movie clip matrices
+    color_transforms: np.ndarray  # (K, 7) color transform rows
+    blends: np.ndarray  # (K,) blend modes
+    local_sides: np.ndarray  # (K, 4) shape sides before the matrices
+
+    def __len__(self) -> int:
+        return len(self.shape_ids)
+
+    def transform(
+        self,
+        matrix: Optional[Matrix2x3] = None,
+        color_transform: Optional[np.ndarray] = None,
+        blend_mode: int = NORMAL,
+    ) -> "DisplayList":
+        """Places the whole list inside a parent in one batch.
+
+        :param matrix: parent matrix, identity if None
+        :param color_transform: parent color transform row, identity if None
+        :param blend_mode: parent blend mode, kept for rows drawn normally
+        :return: new display list
+        """
+
+        matrices = self.matrices
+        if matrix is not None:
+            matrices = multiply_matrices(matrix.to_array()[np.newaxis], matrices)
+
+        color_transforms = self.color_transforms
+        if color_transform is not None:
+            color_transforms = multiply_color_transforms(
+                color_transform[np.newaxis], color_transforms
+            )
+
+        blends = self.blends
+        if blend_mode > NORMAL_ALTERNATIVE:
+            blends = np.where(blends > NORMAL_ALTERNATIVE, blends, blend_mode).astype(
+                np.uint8
+            )
+
+        return DisplayList(
+            self.shape_ids, matrices, color_transforms, blends, self.local_sides
+        )
+
+    def get_sides_array(self) -> np.ndarray:
+        """Returns (K, 4) sides of every shape after its matrix."""
+
+        return transform_sides_array(self.local_sides, self.matrices)
+
+    def get_sides(self) -> Sides | None:
+        """Returns sides of all shapes, None if the list is empty."""
+
+        if len(self) == 0:
+            return None
+
+        sides = self.get_sides_array()
+        left, top = sides[:, :2].min(axis=0).tolist()
+        right, bottom = sides[:, 2:].max(axis=0).tolist()
+        return left, top, right, bottom
+
+
+def create_display_list(
+    shape_ids: List[int],
+    matrices: np.ndarray,
+    color_transforms: np.ndarray,
+    blends: List[int],
+    local_sides: List[Sides],
+) -> DisplayList:
+    return DisplayList(
+        np.array(shape_ids, dtype=np.int32),
+        matrices.reshape(-1, 2, 3),
+        color_transforms.reshape(-1, COLOR_TRANSFORM_SIZE).astype(np.float32),
+        np.array(blends, dtype=np.uint8),
+        np.array(local_sides, dtype=float).reshape(-1, 4),
+    )
+
+
+def concatenate_display_lists(display_lists: List[DisplayList]) -> DisplayList:
+    if not display_lists:
+        return EMPTY_DISPLAY_LIST
+
+    return DisplayList(
+        np.concatenate([display_list.shape_ids for display_list in display_lists]),
+        np.concatenate([display_list.matrices for display_list in display_lists]),
+        np.concatenate(
+            [display_list.color_transforms for display_list in display_lists]
+        ),
+        np.concatenate([display_list.blends for display_list in display_lists]),
+        np.concatenate([display_list.local_sides for display_list in display_lists]),
+    )
+
+
+def is_identity_color_transform(color_transform: np.ndarray) -> bool:
+    return bool(np.array_equal(color_transform, IDENTITY_COLOR_TRANSFORM))
+
+
+EMPTY_DISPLAY_LIST = create_display_list(
+    [], np.empty((0, 2, 3)), np.empty((0, COLOR_TRANSFORM_SIZE)), [], []
+)
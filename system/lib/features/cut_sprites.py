@@ -1,61 +1,105 @@
+import multiprocessing
 import os
 from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image
 
 from system.lib.console import Console
+from system.lib.features.movie_clips import export_movie_clips
+from system.lib.features.sprite_atlases import save_sprite_atlases
+from system.lib.image_writer import ImageWriter
+from system.lib.output_sinks import FolderSink, MemorySink
+from system.lib.objects import Shape, SWFTexture
+from system.lib.shared_images import (
+    SharedImageInfo,
+    attach_images,
+    release_images,
+    share_images,
+)
+from system.lib.sprite_manifest import (
+    SpriteManifest,
+    create_sprite_manifest,
+    get_region_name,
+    is_stored,
+    write_sprite_manifest,
+)
 from system.lib.swf import SupercellSWF
 from system.localization import locale
 
+CHUNKS_PER_WORKER = 4
+
+
+def render_objects(
+    swf: SupercellSWF,
+    output_folder: Path,
+    render_movie_clips: bool = False,
+    use_apng: bool = False,
+    workers: int = 1,
+    writer: ImageWriter | None = None,
+    pack_atlases: bool = False,
+):
+    """Renders shapes and cuts region sprites, writing their info to the xcod.
+
+    :param swf: loaded file to render
+    :param output_folder: folder for rendered objects
+    :param render_movie_clips: whether movie clips are rendered too
+    :param use_apng: whether movie clips are saved as APNG instead of
+        sprite sheets
+    :param workers: number of processes rendering shapes
+    :param writer: writer of the output files, a new one if not given
+    :param pack_atlases: whether sprites are also packed into atlases with
+        JSON coordinates, region files are still written for encoding
+    """
+
+    shapes_writer = writer or ImageWriter()
 
-def render_objects(swf: SupercellSWF, output_folder: Path):
-    os.makedirs(output_folder / "overwrite", exist_ok=True)
-    os.makedirs(output_folder / "shapes", exist_ok=True)
-    os.makedirs(output_folder / "movie_clips", exist_ok=True)
-
-    # TODO: Too slow, fix it
-    # movie_clips_skipped = 0
-    # movie_clip_count = len(swf.movie_clips)
-    # for movie_clip_index in range(movie_clip_count):
-    #     movie_clip = swf.movie_clips[movie_clip_index]
-    #
-    #     rendered_movie_clip = movie_clip.render(swf)
-    #     if sum(rendered_movie_clip.size) >= 2:
-    #         clip_name = movie_clip.export_name or movie_clip.id
-    #         rendered_movie_clip.save(f"{export_folder}/movie_clips/{clip_name}.png")
-    #     else:
-    #         # For debug:
-    #         # logger.warning(f'MovieClip {movie_clip.id} cannot be rendered.')
-    #         movie_clips_skipped += 1
-    #
-    #     Console.progress_bar(
-    #         "Rendering movie clips (%d/%d). Skipped count: %d"
-    #         % (movie_clip_index + 1, movie_clip_count, movie_clips_skipped),
-    #         movie_clip_index,
-    #         movie_clip_count,
-    #     )
+    # Folder for edited sprites to encode with, archives are not encoded
+    if isinstance(shapes_writer.sink, FolderSink):
+        os.makedirs(output_folder / "overwrite", exist_ok=True)
+
+    if render_movie_clips:
+        export_movie_clips(swf, output_folder / "movie_clips", use_apng, shapes_writer)
 
     print()
 
     shapes_count = len(swf.shapes)
     swf.xcod_writer.write_uint16(shapes_count)
 
-    for shape_index in range(shapes_count):
-        shape = swf.shapes[shape_index]
+    # Regions with identical sprites share one file
+    manifest = create_sprite_manifest(swf.shapes)
+    write_sprite_manifest(manifest, output_folder, shapes_writer)
+
+    # Daemonic processes, like batch workers, can not start a pool
+    if multiprocessing.current_process().daemon:
+        workers = 1
 
-        Console.progress_bar(
-            locale.cut_sprites_process % (shape_index + 1, shapes_count),
-            shape_index,
-            shapes_count,
+    sprites: Dict[str, Image.Image] | None = {} if pack_atlases else None
+    if workers > 1:
+        _render_shapes_parallel(
+            swf, output_folder, workers, manifest, shapes_writer, sprites
         )
+    else:
+        for shape_index in range(shapes_count):
+            Console.progress_bar(
+                locale.cut_sprites_process % (shape_index + 1, shapes_count),
+                shape_index,
+                shapes_count,
+            )
 
-        rendered_shape = shape.render()
-        rendered_shape.save(f"{output_folder}/shapes/{shape.id}.png")
+            _render_shape(
+                swf.shapes[shape_index],
+                output_folder,
+                manifest,
+                shapes_writer,
+                sprites,
+            )
 
-        regions_count = len(shape.regions)
-        for region_index in range(regions_count):
-            region = shape.regions[region_index]
+    if sprites is not None:
+        save_sprite_atlases(sprites, output_folder / "atlases", shapes_writer, manifest)
 
-            rendered_region = region.render(use_original_size=True)
-            rendered_region.save(f"{output_folder}/shape_{shape.id}_{region_index}.png")
+    if writer is None:
+        shapes_writer.close()
 
     for shape_index in range(shapes_count):
         shape = swf.shapes[shape_index]
@@ -74,3 +118,138 @@ def render_objects(swf: SupercellSWF, output_folder: Path):
                 swf.xcod_writer.write_uint16(int(region.get_v(i)))
             swf.xcod_writer.write_ubyte(1 if region.is_mirrored else 0)
             swf.xcod_writer.write_byte(region.rotation // 90)
+
+
+def _render_shape(
+    shape: Shape,
+    output_folder: Path,
+    manifest: SpriteManifest,
+    writer: ImageWriter,
+    sprites: Dict[str, Image.Image] | None = None,
+) -> None:
+    rendered_shape = shape.render()
+    writer.write(rendered_shape, output_folder / "shapes" / str(shape.id))
+
+    regions_count = len(shape.regions)
+    for region_index in range(regions_count):
+        region = shape.regions[region_index]
+
+        name = get_region_name(shape.id, region_index)
+        if not is_stored(manifest, name):
+            continue
+
+        rendered_region = region.render(use_original_size=True)
+        writer.write(rendered_region, output_folder / name)
+        if sprites is not None:
+            sprites[name] = rendered_region
+
+
+def _render_shapes_parallel(
+    swf: SupercellSWF,
+    output_folder: Path,
+    workers: int,
+    manifest: SpriteManifest,
+    writer: ImageWriter,
+    sprites: Dict[str, Image.Image] | None,
+) -> None:
+    """Renders shapes in worker processes sharing the decoded textures.
+
+    Textures are copied into shared memory once, workers get only shape
+    index ranges to render and encode. Workers write loose files on their
+    own, files for an archive come back to be written by the writer, so
+    they end up in its sink. Sprites to pack come back as images too.
+    """
+
+    shapes_count = len(swf.shapes)
+    chunk_size = max(1, shapes_count // (workers * CHUNKS_PER_WORKER))
+    chunks = [
+        (start, min(start + chunk_size, shapes_count))
+        for start in range(0, shapes_count, chunk_size)
+    ]
+
+    blocks, infos = share_images([texture.image for texture in swf.textures])
+    try:
+        with multiprocessing.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(
+                infos,
+                swf.shapes,
+                output_folder,
+                manifest,
+                sprites is not None,
+                isinstance(writer.sink, FolderSink),
+            ),
+        ) as pool:
+            shapes_rendered = 0
+            for rendered_count, entries, rendered_sprites in pool.imap_unordered(
+                _render_shape_range, chunks
+            ):
+                for path, data in entries:
+                    writer.write_data(path, data)
+                if sprites is not None:
+                    sprites.update(rendered_sprites)
+
+                shapes_rendered += rendered_count
+                Console.progress_bar(
+                    locale.cut_sprites_process % (shapes_rendered, shapes_count),
+                    shapes_rendered - 1,
+                    shapes_count,
+                )
+    finally:
+        release_images(blocks, unlink=True)
+
+
+_worker_shapes: List[Shape] = []
+_worker_output_folder: Path = Path()
+_worker_manifest: SpriteManifest = {}
+_worker_blocks: list = []
+_worker_packs_atlases: bool = False
+_worker_writes_files: bool = False
+
+
+def _init_worker(
+    infos: List[SharedImageInfo],
+    shapes: List[Shape],
+    output_folder: Path,
+    manifest: SpriteManifest,
+    packs_atlases: bool,
+    writes_files: bool,
+) -> None:
+    global _worker_shapes, _worker_output_folder, _worker_manifest, _worker_blocks
+    global _worker_packs_atlases, _worker_writes_files
+
+    _worker_blocks, images = attach_images(infos)
+
+    textures = []
+    for image in images:
+        texture = SWFTexture()
+        texture.width, texture.height = image.size
+        texture.image = image
+        textures.append(texture)
+
+    for shape in shapes:
+        for region in shape.regions:
+            region.texture = textures[region.texture_index]
+
+    _worker_shapes = shapes
+    _worker_output_folder = output_folder
+    _worker_manifest = manifest
+    _worker_packs_atlases = packs_atlases
+    _worker_writes_files = writes_files
+
+
+def _render_shape_range(
+    shape_range: Tuple[int, int],
+) -> Tuple[int, List[Tuple[str, bytes]], Dict[str, Image.Image]]:
+    start, end = shape_range
+
+    sink = FolderSink() if _worker_writes_files else MemorySink()
+    sprites: Dict[str, Image.Image] | None = {} if _worker_packs_atlases else None
+    with ImageWriter(sink=sink) as writer:
+        for shape in _worker_shapes[start:end]:
+            _render_shape(
+                shape, _worker_output_folder, _worker_manifest, writer, sprites
+            )
+    entries = sink.entries if isinstance(sink, MemorySink) else []
+    return end - start, entries, sprites or {}
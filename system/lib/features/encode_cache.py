@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, Set, Tuple, TypeAlias
+
+import numpy as np
+from PIL import Image
+
+from system.lib.features.sc import EncodedSheet
+
+CACHE_FOLDER_NAME = ".encode_cache"
+HASH_CHUNK_SIZE = 1 << 20
+
+# Shape index and region index in the .xcod
+RegionKey: TypeAlias = Tuple[int, int]
+
+
+class EncodeCache:
+    """Remembers what an In-Sprites folder was encoded from.
+
+    The manifest lies next to the .xcod as <name>.cache.json. It keeps the
+    size, mtime and hash of every sprite file and the file each region was
+    placed from. Placed sheets and their encoded tags are kept in the
+    .encode_cache folder.
+
+    The whole cache is dropped when its key changes, the key covers
+    everything else the sheets depend on.
+    """
+
+    def __init__(self, folder: Path, name: str, key: str):
+        self._folder = folder
+        self._manifest_path = folder / f"{name}.cache.json"
+        self._cache_folder = folder / CACHE_FOLDER_NAME
+        self.key = key
+
+        self._files: Dict[str, dict] = {}
+        self._regions: Dict[str, str] = {}
+        self._placed_sheets: Set[int] = set()
+        self.is_valid = self._load()
+
+    def get_changed_regions(
+        self, sprite_paths: Dict[RegionKey, Path]
+    ) -> Set[RegionKey] | None:
+        """Finds regions placed from other sprites than in the last run.
+
+        Files of the same size and mtime are taken as unchanged, others
+        are hashed, so touched but equal files are not placed again.
+
+        :param sprite_paths: sprite file of every placed region
+        :return: changed regions, None if everything has to be placed
+        """
+
+        old_files, old_regions = self._files, self._regions
+        self._files = {}
+        self._regions = {}
+        changed_files = set()
+
+        for path in set(sprite_paths.values()):
+            name = self._get_relative_name(path)
+            stat = os.stat(path)
+            stamp = old_files.get(name)
+            if stamp is None or (stamp["size"], stamp["mtime_ns"]) != (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                file_hash = get_file_hash(path)
+                if stamp is None or stamp["hash"] != file_hash:
+                    changed_files.add(name)
+                stamp = {"hash": file_hash}
+            self._files[name] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": stamp["hash"],
+            }
+
+        for key, path in sprite_paths.items():
+            self._regions[_get_region_id(key)] = self._get_relative_name(path)
+
+        if not self.is_valid:
+            return None
+
+        changed = set()
+        for region_id in old_regions.keys() | self._regions.keys():
+            name = self._regions.get(region_id)
+            if name != old_regions.get(region_id) or name in changed_files:
+                shape_index, region_index = region_id.split(":")
+                changed.add((int(shape_index), int(region_index)))
+        return changed
+
+    def load_sheet(self, sheet_index: int) -> Path | None:
+        """Returns the sheet placed in the last run, memory-mapped when opened."""
+
+        path = self._get_sheet_path(sheet_index)
+        if not self.is_valid or not os.path.exists(path):
+            return None
+        return path
+
+    def save_sheet(self, sheet_index: int, sheet: Image.Image) -> None:
+        os.makedirs(self._cache_folder, exist_ok=True)
+        self._placed_sheets.add(sheet_index)
+
+        encoded_path = self._get_encoded_sheet_path(sheet_index)
+        if os.path.exists(encoded_path):
+            os.remove(encoded_path)
+        np.save(self._get_sheet_path(sheet_index), np.asarray(sheet))
+
+    def get_encoded_sheet(self, sheet_index: int) -> EncodedSheet | None:
+        """Returns the sheet tag of the last run if the sheet was not placed again."""
+
+        path = self._get_encoded_sheet_path(sheet_index)
+        if (
+            not self.is_valid
+            or sheet_index in self._placed_sheets
+            or not os.path.exists(path)
+        ):
+            return None
+        return EncodedSheet(path)
+
+    def save_encoded_sheet(self, sheet_index: int, data: bytes) -> None:
+        os.makedirs(self._cache_folder, exist_ok=True)
+        with open(self._get_encoded_sheet_path(sheet_index), "wb") as file:
+            file.write(data)
+
+    def save(self) -> None:
+        with open(self._manifest_path, "w") as manifest_file:
+            json.dump(
+                {"key": self.key, "files": self._files, "regions": self._regions},
+                manifest_file,
+                indent=4,
+            )
+        self.is_valid = True
+
+    def _load(self) -> bool:
+        if not os.path.exists(self._manifest_path):
+            return False
+
+        with open(self._manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+        if manifest.get("key") != self.key:
+            # Sheets were placed from other data, none of them can be reused
+            os.remove(self._manifest_path)
+            shutil.rmtree(self._cache_folder, ignore_errors=True)
+            return False
+
+        self._files = manifest["files"]
+        self._regions = manifest["regions"]
+        return True
+
+    def _get_relative_name(self, path: Path) -> str:
+        return Path(path).relative_to(self._folder).as_posix()
+
+    def _get_sheet_path(self, sheet_index: int) -> Path:
+        return self._cache_folder / f"sheet_{sheet_index}.npy"
+
+    def _get_encoded_sheet_path(self, sheet_index: int) -> Path:
+        return self._cache_folder / f"sheet_{sheet_index}.bin"
+
+
+def get_cache_key(*paths: Path, **options) -> str:
+    """Hashes files and options the cached sheets depend on.
+
+    :param paths: files to hash, missing files are hashed as absent
+    :param options: other values, must be JSON serializable
+    :return: hex digest
+    """
+
+    key = hashlib.md5(json.dumps(options, sort_keys=True).encode())
+    for path in paths:
+        key.update(get_file_hash(path).encode() if os.path.exists(path) else b"-")
+    return key.hexdigest()
+
+
+def get_file_stamps(paths: Iterable[Path]) -> list:
+    """Returns names, sizes and mtimes of files, cheaper to compare than hashes."""
+
+    stamps = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        stamps.append((Path(path).name, stat.st_size, stat.st_mtime_ns))
+    return stamps
+
+
+def get_file_hash(path: Path | str) -> str:
+    file_hash = hashlib.md5()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _get_region_id(key: RegionKey) -> str:
+    return f"{key[0]}:{key[1]}"
@@ -1,59 +1,205 @@
 import os
 import lzma
-import lzham
 import zstandard
 import struct
+import time
+from hashlib import md5
 
 from loguru import logger
-from sc_compression import compress, decompress
-from sc_compression.signatures import Signatures
 
+from system.lib.compression import (
+    LZHAM,
+    TUNING_SAMPLE_SIZE,
+    CompressionSettings,
+    create_compressor,
+    decompress_sc,
+    get_compression_settings,
+    tune_compression,
+)
 from system.localization import locale
 
 from ktx import load_ktx
 
+# Dictionary size sc_compression uses for LZHAM
+LZHAM_DICT_SIZE_LOG2 = 18
+
 
 def write_sc(output_filename: str | os.PathLike, buffer: bytes, use_lzham: bool):
-    with open(output_filename, "wb") as file_out:
+    with ScStreamWriter(output_filename, len(buffer), use_lzham) as sc_writer:
+        sc_writer.write(buffer)
+
+
+class ScStreamWriter:
+    """Compresses a .sc payload into a file part by part.
+
+    Writes an SC header with the payload MD5, then the payload compressed
+    with the configured backend, see system.lib.compression. The payload
+    size must be known up front, the hash is filled in on close.
+
+    With a time budget and no settings, the start of the payload is kept
+    until the codec is tuned on it, the header version is filled in then.
+
+    The file is written next to the output and moved over it on close, so
+    a failed write leaves the previous file as it was.
+
+    Files rewritten in place keep their container: header version, the
+    version 4 header and the START metadata trailer are written as given.
+
+    LZHAM has no streaming compressor, so its payload is kept until close.
+    Size, ratio and compression time are logged on close.
+    """
+
+    def __init__(
+        self,
+        output_filename: str | os.PathLike,
+        payload_size: int,
+        use_lzham: bool,
+        settings: CompressionSettings | None = None,
+        time_budget: float | None = None,
+        version: int | None = None,
+        metadata: bytes | memoryview | None = None,
+        metadata_header: bool = False,
+    ):
+        if settings is None and time_budget is None:
+            settings = get_compression_settings(use_lzham)
+
+        self._output_filename = output_filename
+        self._temp_filename = f"{output_filename}.tmp"
+        self._file = open(self._temp_filename, "wb")
+        self._payload_size = payload_size
+        self._time_budget = time_budget
+        self._hash = md5()
+        self._written = 0
+        self._compression_time = 0.0
+        self._sample = bytearray()
+        self._version = version
+        self._metadata = metadata
+        self._metadata_header = metadata_header
+
+        self._file.write(b"SC")
+        if metadata_header:
+            self._file.write(struct.pack(">I", 4))
+        self._version_offset = self._file.tell()
+        self._file.write(struct.pack(">II", 0, self._hash.digest_size))
+        self._hash_offset = self._file.tell()
+        self._file.write(bytes(self._hash.digest_size))
         logger.info(locale.header_done)
 
-        if use_lzham:
-            logger.info(locale.compressing_with % "LZHAM")
-            # Why is this here? It's included in the compression module
-            # file_out.write(struct.pack("<4sBI", b"SCLZ", 18, len(buffer)))
-            compressed = compress(buffer, Signatures.SCLZ)
+        self._settings = None
+        self._compressor = None
+        if settings is not None:
+            self._start_compressor(settings)
 
-            file_out.write(compressed)
-        else:
-            logger.info(locale.compressing_with % "LZMA")
-            compressed = compress(buffer, Signatures.SC, 3)
-            file_out.write(compressed)
+    @property
+    def settings(self) -> CompressionSettings | None:
+        """Settings the payload is compressed with, None until tuned."""
+
+        return self._settings
+
+    def write(self, data: bytes | memoryview) -> None:
+        self._hash.update(data)
+        self._written += len(data)
+
+        if self._compressor is None:
+            self._sample += data
+            if len(self._sample) < min(TUNING_SAMPLE_SIZE, self._payload_size):
+                return
+
+            data = bytes(self._sample)
+            self._sample.clear()
+            self._start_compressor(
+                tune_compression(
+                    data[:TUNING_SAMPLE_SIZE], self._payload_size, self._time_budget
+                )
+            )
+
+        started = time.perf_counter()
+        compressed = self._compressor.compress(data)
+        self._compression_time += time.perf_counter() - started
+        self._file.write(compressed)
+
+    def close(self) -> None:
+        try:
+            file_size = self._finish()
+        except BaseException:
+            self._discard()
+            raise
+
+        os.replace(self._temp_filename, self._output_filename)
         logger.info(locale.compression_done)
-    print()
+        logger.info(
+            locale.compression_stats
+            % (
+                os.path.basename(self._output_filename),
+                self._payload_size,
+                file_size,
+                file_size / max(self._payload_size, 1) * 100,
+                self._compression_time,
+            )
+        )
+        print()
 
+    def _finish(self) -> int:
+        if self._written != self._payload_size or self._compressor is None:
+            raise ValueError(
+                f"Payload size mismatch: {self._written} != {self._payload_size}"
+            )
 
-def open_sc(input_filename: str) -> tuple[bytes, bool]:
-    use_lzham = False
+        started = time.perf_counter()
+        compressed = self._compressor.flush()
+        self._compression_time += time.perf_counter() - started
+        self._file.write(compressed)
+
+        if self._metadata is not None:
+            self._file.write(b"START")
+            self._file.write(self._metadata)
+            if self._metadata_header:
+                self._file.write(struct.pack(">I", len(self._metadata)))
+
+        file_size = self._file.tell()
+        self._file.seek(self._version_offset)
+        version = self._version or self._settings.file_version
+        self._file.write(struct.pack(">I", version))
+        self._file.seek(self._hash_offset)
+        self._file.write(self._hash.digest())
+        self._file.close()
+        return file_size
+
+    def _discard(self) -> None:
+        # A partial file would pass for an encoded one
+        self._file.close()
+        if os.path.exists(self._temp_filename):
+            os.remove(self._temp_filename)
 
+    def _start_compressor(self, settings: CompressionSettings) -> None:
+        logger.info(locale.compressing_with % settings.describe())
+        self._settings = settings
+        self._compressor = create_compressor(settings, self._payload_size)
+
+    def __enter__(self) -> "ScStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+
+def open_sc(input_filename: str) -> tuple[bytes, bool]:
     with open(input_filename, "rb") as f:
         file_data = f.read()
-        f.close()
 
     try:
-        if b"START" in file_data:
-            file_data = file_data[: file_data.index(b"START")]
-        decompressed_data, signature = decompress(file_data)
-
-        if signature.name != Signatures.NONE:
-            logger.info(locale.detected_comp % signature.name.upper())
-
-        if signature == Signatures.SCLZ:
-            use_lzham = True
-    except TypeError:
+        container = decompress_sc(file_data)
+    except (lzma.LZMAError, zstandard.ZstdError, struct.error):
         logger.info(locale.decompression_error)
         exit(1)
 
-    return decompressed_data, use_lzham
+    if container.backend is not None:
+        logger.info(locale.detected_comp % container.backend.upper())
+
+    return container.payload, container.backend == LZHAM
 
 def convert_pixel(pixel, type):
     if type == 0 or type == 1:
@@ -87,47 +233,10 @@ def convert_pixel(pixel, type):
         raise Exception("Unknown pixel type {}.".format(type))
 
 def decompress_tex(data):
-    version = None
-    if data[:2] == b'SC':
-        # Skip the header if there's any
-        pre_version = int.from_bytes(data[2: 6], 'big')
-
-        if pre_version == 4:
-            version = int.from_bytes(data[6: 10], 'big')
-            hash_length = int.from_bytes(data[10: 14], 'big')
-            end_block_size = int.from_bytes(data[-4:], 'big')
-
-            data = data[14 + hash_length:-end_block_size - 9]
-
-        else:
-            version = pre_version
-            hash_length = int.from_bytes(data[6: 10], 'big')
-            data = data[10 + hash_length:]
-
-    if version in (None, 1, 3):
-        if data[:4] == b'SCLZ':
-            print('[*] Detected LZHAM compression !')
-
-            dict_size = int.from_bytes(data[4:5], 'big')
-            uncompressed_size = int.from_bytes(data[5:9], 'little')
-            decompressed = lzham.decompress(data[9:], uncompressed_size, {'dict_size_log2': dict_size})
-
-        elif data[:4] == bytes.fromhex('28 B5 2F FD'):
-            print('[*] Detected Zstandard compression !')
-            decompressed = zstandard.decompress(data)
-
-        else:
-            print('[*] Detected LZMA compression !')
-            data = data[0:9] + (b'\x00' * 4) + data[9:]
-            decompressor = lzma.LZMADecompressor()
-
-            output = []
-
-            while decompressor.needs_input:
-                output.append(decompressor.decompress(data))
-
-            decompressed = b''.join(output)
-    return decompressed
+    container = decompress_sc(data)
+    if container.backend is not None:
+        logger.info(locale.detected_comp % container.backend.upper())
+    return container.payload
 
 
 def open_tex_sc(input_filename: str) -> tuple[bytes, bool]:
@@ -139,7 +248,7 @@ def open_tex_sc(input_filename: str) -> tuple[bytes, bool]:
     try:
         decompressed_data = decompress_tex(file_data)
         use_lzham = False
-    except TypeError:
+    except (lzma.LZMAError, zstandard.ZstdError, struct.error):
         print('[*] Decompression error !')
         exit(1)
 
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+from system.lib.features.sc import EncodedSheet, Sheet
+from system.lib.image_output import load_image
+from system.lib.image_writer import ImageWriter
+from system.lib.objects import SWFTexture
+from system.lib.xcod import FileInfo
+from system.localization import locale
+
+KTX_MANIFEST_FILENAME = "ktx_sheets.json"
+TAG_EXTENSION = "sctag"
+
+# Raw pixels changed KTX sheets are encoded with
+FALLBACK_FILE_TYPE = 1
+FALLBACK_PIXEL_TYPE = 0
+
+
+def write_ktx_tags(
+    textures: List[SWFTexture],
+    names: List[str],
+    folder: Path,
+    writer: ImageWriter,
+) -> None:
+    """Writes the original tags of KTX textures next to their images.
+
+    The manifest maps sheet indices to the tag file and a hash of the
+    decoded pixels, to tell on encode if the image was changed.
+
+    :param textures: decoded textures
+    :param names: image names of the textures, without extension
+    :param folder: folder the images are written to
+    :param writer: writer the images are written with
+    """
+
+    manifest = {}
+    for sheet_index, texture in enumerate(textures):
+        if texture.tag_data is None:
+            continue
+
+        tag_filename = f"{names[sheet_index]}.{TAG_EXTENSION}"
+        writer.write_data(folder / tag_filename, bytes(texture.tag_data))
+        manifest[str(sheet_index)] = {
+            "tag": tag_filename,
+            "pixel_hash": get_pixel_hash(texture.image),
+        }
+
+    if manifest:
+        writer.write_data(
+            folder / KTX_MANIFEST_FILENAME, json.dumps(manifest, indent=4).encode()
+        )
+
+
+def splice_ktx_sheets(
+    file_info: FileInfo, folder: Path, sheets: List[Sheet]
+) -> List[Sheet]:
+    """Replaces unchanged KTX sheets with their original tags.
+
+    Changed KTX sheets can not be encoded to ASTC again, their sheet info
+    is switched to raw RGBA8 pixels instead.
+
+    :param file_info: parsed .xcod info, changed for re-encoded sheets
+    :param folder: folder with the KTX manifest
+    :param sheets: sheets to encode
+    :return: sheets with original tags in place of unchanged KTX sheets
+    """
+
+    manifest = _load_ktx_manifest(folder)
+
+    spliced_sheets = list(sheets)
+    for sheet_index, sheet in enumerate(sheets):
+        entry = manifest.get(str(sheet_index))
+        if entry is None or isinstance(sheet, EncodedSheet):
+            continue
+
+        image = sheet if isinstance(sheet, Image.Image) else load_image(sheet)
+        tag_path = folder / entry["tag"]
+        if os.path.exists(tag_path) and get_pixel_hash(image) == entry["pixel_hash"]:
+            spliced_sheets[sheet_index] = EncodedSheet(tag_path)
+            continue
+
+        logger.warning(locale.ktx_sheet_changed % sheet_index)
+        sheet_info = file_info.sheets[sheet_index]
+        sheet_info.file_type = FALLBACK_FILE_TYPE
+        sheet_info.pixel_type = FALLBACK_PIXEL_TYPE
+    return spliced_sheets
+
+
+def get_pixel_hash(image: Image.Image) -> str:
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return hashlib.md5(np.ascontiguousarray(np.asarray(image))).hexdigest()
+
+
+def _load_ktx_manifest(folder: Path) -> Dict[str, dict]:
+    manifest_path = folder / KTX_MANIFEST_FILENAME
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
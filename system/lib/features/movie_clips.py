@@ -0,0 +1,188 @@
+import io
+import json
+from math import ceil, sqrt
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+from system.lib.console import Console
+from system.lib.helper import get_size
+from system.lib.image_output import PNG
+from system.lib.image_writer import ImageWriter
+from system.lib.objects import MovieClip
+from system.lib.objects.movie_clip import RenderCache
+from system.lib.rendering import render_movie_clip
+from system.lib.swf import SupercellSWF
+from system.localization import locale
+
+
+def export_movie_clips(
+    swf: SupercellSWF,
+    output_folder: Path,
+    use_apng: bool = False,
+    writer: ImageWriter | None = None,
+) -> None:
+    clips_writer = writer or ImageWriter()
+
+    movie_clips_skipped = 0
+    movie_clip_count = len(swf.movie_clips)
+    for movie_clip_index, movie_clip in enumerate(swf.movie_clips):
+        Console.progress_bar(
+            locale.render_movie_clips_process
+            % (movie_clip_index + 1, movie_clip_count, movie_clips_skipped),
+            movie_clip_index,
+            movie_clip_count,
+        )
+
+        if use_apng:
+            exported = save_apng(swf, movie_clip, output_folder, clips_writer)
+        else:
+            exported = save_sprite_sheet(swf, movie_clip, output_folder, clips_writer)
+
+        if not exported:
+            movie_clips_skipped += 1
+
+    if writer is None:
+        clips_writer.close()
+
+
+def render_unique_frames(
+    swf: SupercellSWF, movie_clip: MovieClip
+) -> Tuple[List[Image.Image], List[int]]:
+    """Renders every distinct frame of the timeline once.
+
+    Frames with identical display lists share one image, and shapes with
+    the same world matrix are rendered once for the whole timeline.
+
+    :param swf: file the movie clip belongs to
+    :param movie_clip: movie clip to render, frames share the timeline sides
+    :return: unique frame images, image index for every frame
+    """
+
+    cache: RenderCache = {}
+
+    images: List[Image.Image] = []
+    frame_table: List[int] = []
+    unique_frames: Dict[Tuple[bytes, ...], int] = {}
+    for frame_index in range(len(movie_clip.frames)):
+        display_list = movie_clip.get_display_list(swf, frame_index)
+        frame_key = (
+            display_list.shape_ids.tobytes(),
+            display_list.matrices.tobytes(),
+            display_list.color_transforms.tobytes(),
+            display_list.blends.tobytes(),
+        )
+        if frame_key not in unique_frames:
+            unique_frames[frame_key] = len(images)
+            rendered_frame, _ = render_movie_clip(
+                swf, movie_clip, frame_index=frame_index, cache=cache
+            )
+            images.append(rendered_frame)
+
+        frame_table.append(unique_frames[frame_key])
+
+    return images, frame_table
+
+
+def save_sprite_sheet(
+    swf: SupercellSWF, movie_clip: MovieClip, output_folder: Path, writer: ImageWriter
+) -> bool:
+    sides = movie_clip.get_sides(swf)
+    if not _is_renderable(movie_clip, sides):
+        return False
+
+    images, frame_table = render_unique_frames(swf, movie_clip)
+    width, height = images[0].size
+
+    columns = ceil(sqrt(len(images)))
+    rows = ceil(len(images) / columns)
+
+    sheet = Image.new("RGBA", (columns * width, rows * height))
+    sprites = []
+    for image_index, image in enumerate(images):
+        x = image_index % columns * width
+        y = image_index // columns * height
+
+        sheet.paste(image, (x, y))
+        sprites.append({"x": x, "y": y})
+
+    left, top, _, _ = sides
+    clip_name = _get_clip_name(movie_clip)
+    # The frame table refers to the sheet, so it is always a PNG
+    writer.write(sheet, output_folder / clip_name, PNG)
+    frame_table_info = {
+        "image": f"{clip_name}.png",
+        "fps": movie_clip.fps,
+        "size": [width, height],
+        "origin": [-left, -top],
+        "sprites": sprites,
+        "frames": frame_table,
+        "labels": _get_labels(movie_clip),
+    }
+    writer.write_data(
+        output_folder / f"{clip_name}.json",
+        json.dumps(frame_table_info, indent=4).encode(),
+    )
+
+    return True
+
+
+def save_apng(
+    swf: SupercellSWF, movie_clip: MovieClip, output_folder: Path, writer: ImageWriter
+) -> bool:
+    sides = movie_clip.get_sides(swf)
+    if not _is_renderable(movie_clip, sides):
+        return False
+
+    images, frame_table = render_unique_frames(swf, movie_clip)
+    frame_duration = 1000 / (movie_clip.fps or 30)
+
+    # Consecutive repeats of the same image become one longer APNG frame
+    frames: List[Image.Image] = []
+    durations: List[float] = []
+    for frame_index, image_index in enumerate(frame_table):
+        if frame_index > 0 and frame_table[frame_index - 1] == image_index:
+            durations[-1] += frame_duration
+            continue
+
+        frames.append(images[image_index])
+        durations.append(frame_duration)
+
+    clip_name = _get_clip_name(movie_clip)
+    buffer = io.BytesIO()
+    frames[0].save(
+        buffer,
+        "PNG",
+        save_all=True,
+        append_images=frames[1:],
+        duration=durations,
+        loop=0,
+        default_image=False,
+    )
+    writer.write_data(output_folder / f"{clip_name}.png", buffer.getvalue())
+
+    return True
+
+
+def _is_renderable(
+    movie_clip: MovieClip, sides: Tuple[float, float, float, float]
+) -> bool:
+    if not movie_clip.frames:
+        return False
+
+    width, height = get_size(*sides)
+    return ceil(width) + ceil(height) >= 2
+
+
+def _get_clip_name(movie_clip: MovieClip) -> str:
+    return movie_clip.export_name or str(movie_clip.id)
+
+
+def _get_labels(movie_clip: MovieClip) -> Dict[str, int]:
+    labels = {}
+    for frame_index, frame in enumerate(movie_clip.frames):
+        label = frame.get_label()
+        if label and label not in labels:
+            labels[label] = frame_index
+    return labels
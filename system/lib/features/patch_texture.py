@@ -0,0 +1,141 @@
+import os
+import struct
+from dataclasses import replace
+from typing import Tuple
+
+from loguru import logger
+from PIL import Image
+
+from system.lib.compression import (
+    LZHAM,
+    METADATA_TABLE_VERSIONS,
+    ScContainer,
+    decompress_sc,
+    get_compression_settings,
+)
+from system.lib.features.files import ScStreamWriter
+from system.lib.features.ktx_passthrough import (
+    FALLBACK_FILE_TYPE,
+    FALLBACK_PIXEL_TYPE,
+)
+from system.lib.features.sc import encode_sheet
+from system.lib.images import get_format_by_pixel_type
+from system.lib.swf import SupercellSWF
+from system.localization import locale
+
+KTX_TAG = 45
+TAG_HEADER_SIZE = 5
+
+
+def patch_texture(
+    path: str | os.PathLike, sheet_index: int, image: Image.Image
+) -> None:
+    """Replaces one sheet of a _tex.sc file in place.
+
+    The new sheet is encoded with the tag and pixel type of the old one,
+    KTX sheets are encoded as raw RGBA8. All other tags are copied as they
+    are, without decoding them. The file keeps its compression backend,
+    header version and metadata.
+
+    :param path: _tex.sc file to patch
+    :param sheet_index: index of the sheet to replace
+    :param image: new sheet, of the same size as the old one
+    """
+
+    with open(path, "rb") as file:
+        container = decompress_sc(file.read())
+    payload = container.payload
+    start, end = _find_texture_tag(payload, sheet_index)
+
+    file_type, pixel_type, size = _read_texture_header(payload, start)
+    if image.size != size:
+        raise ValueError(locale.illegal_size % (*size, *image.size))
+
+    if file_type == KTX_TAG:
+        logger.warning(locale.ktx_sheet_changed % sheet_index)
+        file_type, pixel_type = FALLBACK_FILE_TYPE, FALLBACK_PIXEL_TYPE
+
+    encoded = encode_sheet(
+        image.convert(get_format_by_pixel_type(pixel_type)), file_type, pixel_type
+    )
+
+    payload_view = memoryview(payload)
+    payload_size = len(payload) - (end - start) + len(encoded)
+    if container.backend is not None:
+        # The writer replaces the file only once it is complete
+        with _create_writer(str(path), payload_size, container) as sc_writer:
+            sc_writer.write(payload_view[:start])
+            sc_writer.write(encoded)
+            sc_writer.write(payload_view[end:])
+        return
+
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(payload_view[:start])
+            file.write(encoded)
+            file.write(payload_view[end:])
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+
+
+def _create_writer(
+    path: str, payload_size: int, container: ScContainer
+) -> ScStreamWriter:
+    settings = get_compression_settings(container.backend == LZHAM, container.backend)
+    if container.dict_size_log2 is not None:
+        settings = replace(settings, dict_size_log2=container.dict_size_log2)
+
+    # Metadata tables of newer versions are not written, a hash is
+    version = container.version
+    if version in METADATA_TABLE_VERSIONS:
+        version = None
+
+    return ScStreamWriter(
+        path,
+        payload_size,
+        container.backend == LZHAM,
+        settings,
+        version=version,
+        metadata=container.metadata,
+        metadata_header=container.has_metadata_header,
+    )
+
+
+def _find_texture_tag(payload: bytes, sheet_index: int) -> Tuple[int, int]:
+    """Finds a texture tag by walking the tag headers of a _tex.sc payload.
+
+    :param payload: decompressed file
+    :param sheet_index: index among the texture tags
+    :return: tag start and end offsets
+    """
+
+    texture_index = 0
+    offset = 0
+    while offset + TAG_HEADER_SIZE <= len(payload):
+        tag, length = struct.unpack_from("<BI", payload, offset)
+        if tag == 0:
+            break
+
+        end = offset + TAG_HEADER_SIZE + length
+        if tag in SupercellSWF.TEXTURES_TAGS or tag == KTX_TAG:
+            if texture_index == sheet_index:
+                return offset, end
+            texture_index += 1
+        offset = end
+
+    raise IndexError(f"Sheet {sheet_index} not found, file has {texture_index}")
+
+
+def _read_texture_header(payload: bytes, start: int) -> Tuple[int, int, tuple]:
+    file_type = payload[start]
+    header_offset = start + TAG_HEADER_SIZE
+    if file_type == KTX_TAG:
+        # KTX data size comes first
+        header_offset += 4
+
+    pixel_type, width, height = struct.unpack_from("<BHH", payload, header_offset)
+    return file_type, pixel_type, (width, height)
@@ -1,98 +1,285 @@
 import os
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
 
+import numpy as np
 from PIL import Image, ImageDraw
 
 from system.lib import Console
+from system.lib.features.encode_cache import EncodeCache, RegionKey
 from system.lib.helper import get_sides, get_size
 from system.lib.images import get_format_by_pixel_type
-from system.lib.xcod import FileInfo
+from system.lib.image_output import is_image_file, load_image
+from system.lib.sprite_manifest import get_region_name, load_sprite_manifest
+from system.lib.xcod import FileInfo, RegionInfo
 from system.localization import locale
 
 MASK_COLOR = 255
 
+Rect = Tuple[int, int, int, int]
+
 
 def place_sprites(
-    file_info: FileInfo, folder: Path, overwrite: bool = False
-) -> List[Image.Image]:
-    files_to_overwrite = os.listdir(folder / ("overwrite" if overwrite else ""))
-    texture_files = os.listdir(folder / "textures")
+    file_info: FileInfo,
+    folder: Path,
+    overwrite: bool = False,
+    cache: EncodeCache | None = None,
+) -> List[Image.Image | Path]:
+    """Places the sprites of a folder onto its sheets.
+
+    With a cache, only the boxes of regions whose sprites changed since
+    the last run are placed again, from all regions covering them.
+    Untouched sheets are returned as paths to their cached copies.
+
+    :param file_info: parsed .xcod info
+    :param folder: folder with sprites and textures
+    :param overwrite: place the overwrite folder sprites onto the textures
+    :param cache: cache of the last run
+    :return: sheet images or paths to them
+    """
+
+    sprites_folder = folder / ("overwrite" if overwrite else "")
+    files_to_overwrite = {
+        os.path.splitext(file)[0]: file
+        for file in os.listdir(sprites_folder)
+        if is_image_file(file)
+    }
+    texture_files = sorted(
+        file for file in os.listdir(folder / "textures") if is_image_file(file)
+    )
+    manifest = load_sprite_manifest(folder)
+
+    # Sprites shared by several regions are stored once, unless
+    # one of them was given its own file
+    sprite_paths: Dict[RegionKey, Path] = {}
+    for shape_index, shape_info in enumerate(file_info.shapes):
+        for region_index in range(len(shape_info.regions)):
+            name = get_region_name(shape_info.id, region_index)
+            if name not in files_to_overwrite:
+                name = manifest.get(name, name)
+            if name in files_to_overwrite:
+                sprite_paths[(shape_index, region_index)] = (
+                    sprites_folder / files_to_overwrite[name]
+                )
+
+    changed_regions = None
+    if cache is not None:
+        changed_regions = cache.get_changed_regions(sprite_paths)
 
-    sheets = []
+    # Boxes to place again on every sheet, None for the whole sheet
+    dirty_rects: Dict[int, List[Rect] | None] = {}
+    sheets: List[Image.Image | Path] = []
     for i in range(len(file_info.sheets)):
-        sheet_info = file_info.sheets[i]
+        cached_sheet = None
+        if cache is not None and changed_regions is not None:
+            cached_sheet = cache.load_sheet(i)
 
-        sheets.append(
-            Image.open(f"{folder}/textures/{texture_files[i]}")
+        if cached_sheet is None:
+            dirty_rects[i] = None
+        sheets.append(cached_sheet)
+
+    for shape_index, region_index in sorted(changed_regions or ()):
+        region_info = file_info.shapes[shape_index].regions[region_index]
+        rects = dirty_rects.setdefault(region_info.texture_id, [])
+        if rects is not None:
+            rects.append(_get_region_bbox(region_info.points))
+
+    sheet_regions = _get_sheet_regions(file_info, sprite_paths)
+    for texture_id, rects in sorted(dirty_rects.items()):
+        sheet_info = file_info.sheets[texture_id]
+        base_sheet = (
+            load_image(folder / "textures" / texture_files[texture_id])
             if overwrite
             else Image.new(
                 get_format_by_pixel_type(sheet_info.pixel_type), sheet_info.size
             )
         )
+        regions = sheet_regions.get(texture_id, [])
+        label_map = _create_label_map(base_sheet.size, regions)
 
-    shapes_count = len(file_info.shapes)
-    for shape_index, shape_info in enumerate(file_info.shapes):
-        Console.progress_bar(
-            locale.place_sprites_process % (shape_index + 1, shapes_count),
-            shape_index,
-            shapes_count,
-        )
+        if rects is None:
+            sheet = base_sheet
+            rects = [(0, 0, sheet.width, sheet.height)]
+        else:
+            sheet = load_image(sheets[texture_id])
 
-        for region_index, region_info in enumerate(shape_info.regions):
-            texture_size = (
-                sheets[region_info.texture_id].width,
-                sheets[region_info.texture_id].height,
+        for rect_index, rect in enumerate(rects):
+            Console.progress_bar(
+                locale.place_sprites_process % (texture_id + 1, len(sheets)),
+                rect_index,
+                len(rects),
             )
 
-            filename = f"shape_{shape_info.id}_{region_index}.png"
-            if filename not in files_to_overwrite:
-                continue
-
-            img_mask = Image.new("L", texture_size, 0)
-            ImageDraw.Draw(img_mask).polygon(region_info.points, fill=MASK_COLOR)
-            bbox = img_mask.getbbox()
-
-            if not bbox:
-                min_x = min(i[0] for i in region_info.points)
-                min_y = min(i[1] for i in region_info.points)
-                max_x = max(i[0] for i in region_info.points)
-                max_y = max(i[1] for i in region_info.points)
-
-                if max_y - min_y != 0:
-                    for _y in range(max_y - min_y):
-                        img_mask.putpixel((max_x - 1, min_y + _y - 1), MASK_COLOR)
-
-                elif max_x - min_x != 0:
-                    for _x in range(max_x - min_x):
-                        img_mask.putpixel((min_x + _x - 1, max_y - 1), MASK_COLOR)
-                else:
-                    img_mask.putpixel((max_x - 1, max_y - 1), MASK_COLOR)
-
-            left, top, right, bottom = get_sides(region_info.points)
-            if left == right:
-                right += 1
-            if top == bottom:
-                bottom += 1
-
-            width, height = get_size(left, top, right, bottom)
-            left = int(left)
-            top = int(top)
-
-            bbox = int(left), int(top), int(right), int(bottom)
-
-            tmp_region = Image.open(
-                f'{folder}{"/overwrite" if overwrite else ""}/{filename}'
-            ).convert("RGBA")
-            if region_info.is_mirrored:
-                tmp_region = tmp_region.transpose(Image.FLIP_LEFT_RIGHT)
-            tmp_region = tmp_region.rotate(region_info.rotation, expand=True)
-            tmp_region = tmp_region.resize((width, height), Image.ANTIALIAS)
-
-            sheets[region_info.texture_id].paste(
-                Image.new("RGBA", (width, height)), (left, top), img_mask.crop(bbox)
-            )
-            sheets[region_info.texture_id].paste(tmp_region, (left, top), tmp_region)
-    print()
+            canvas = sheet if sheet is base_sheet else base_sheet.crop(rect)
+            for label, (key, region_info) in enumerate(regions, 1):
+                bbox = _get_region_bbox(region_info.points)
+                if not _intersects(bbox, rect):
+                    continue
+
+                _place_region(
+                    canvas,
+                    rect,
+                    region_info,
+                    _get_region_mask(label_map, label, bbox),
+                    sprite_paths[key],
+                )
+
+            if canvas is not sheet:
+                sheet.paste(canvas, rect[:2])
+        print()
+
+        sheets[texture_id] = sheet
+        if cache is not None:
+            cache.save_sheet(texture_id, sheet)
 
     return sheets
+
+
+def _place_region(
+    canvas: Image.Image,
+    canvas_rect: Rect,
+    region_info: RegionInfo,
+    mask: Image.Image,
+    sprite_path: Path,
+) -> None:
+    left, top, right, bottom = _get_region_bbox(region_info.points)
+    width, height = get_size(left, top, right, bottom)
+    position = left - canvas_rect[0], top - canvas_rect[1]
+
+    tmp_region = load_image(sprite_path).convert("RGBA")
+    if region_info.is_mirrored:
+        tmp_region = tmp_region.transpose(Image.FLIP_LEFT_RIGHT)
+    tmp_region = tmp_region.rotate(region_info.rotation, expand=True)
+    tmp_region = tmp_region.resize((width, height), Image.ANTIALIAS)
+
+    canvas.paste(Image.new("RGBA", (width, height)), position, mask)
+    canvas.paste(tmp_region, position, tmp_region)
+
+
+def _get_sheet_regions(
+    file_info: FileInfo, sprite_paths: Dict[RegionKey, Path]
+) -> Dict[int, List[Tuple[RegionKey, RegionInfo]]]:
+    """Groups the placed regions by sheet, in placing order."""
+
+    regions: Dict[int, List[Tuple[RegionKey, RegionInfo]]] = {}
+    for shape_index, shape_info in enumerate(file_info.shapes):
+        for region_index, region_info in enumerate(shape_info.regions):
+            key = (shape_index, region_index)
+            if key in sprite_paths:
+                regions.setdefault(region_info.texture_id, []).append(
+                    (key, region_info)
+                )
+    return regions
+
+
+def _create_label_map(
+    size: Tuple[int, int], regions: List[Tuple[RegionKey, RegionInfo]]
+) -> np.ndarray:
+    """Rasterizes the placed regions of a sheet into one label map.
+
+    Regions are labeled by their position in the list, starting with 1.
+    They are drawn in placing order, so where masks overlap the label
+    belongs to the region pasted last, which clears those pixels anyway.
+
+    :param size: sheet size
+    :param regions: regions placed on the sheet
+    :return: label map
+    """
+
+    dtype = np.uint16 if len(regions) < 0xFFFF else np.uint32
+    label_map = np.zeros((size[1], size[0]), dtype)
+    for label, (_, region_info) in enumerate(regions, 1):
+        _draw_region(label_map, label, region_info.points)
+    return label_map
+
+
+def _draw_region(
+    label_map: np.ndarray, label: int, points: List[Tuple[int, int]]
+) -> None:
+    """Labels the region pixels that its paste clears.
+
+    Only pixels inside the texture and the region bbox are labeled,
+    others would not be cleared by the region and stay with earlier ones.
+    """
+
+    height, width = label_map.shape
+    min_x, min_y, max_x, max_y = (int(side) for side in get_sides(points))
+
+    # Degenerate lines are written one pixel up and left of the points
+    origin_x, origin_y = min_x - 1, min_y - 1
+    polygon = Image.new("L", (max_x - origin_x + 1, max_y - origin_y + 1), 0)
+    ImageDraw.Draw(polygon).polygon(
+        [(x - origin_x, y - origin_y) for x, y in points], fill=MASK_COLOR
+    )
+    polygon_mask = np.asarray(polygon) != 0
+
+    visible_rect = _clip_rect((min_x, min_y, max_x + 1, max_y + 1), width, height)
+    if (
+        visible_rect is None
+        or not _view(polygon_mask, visible_rect, origin_x, origin_y).any()
+    ):
+        polygon_mask = np.zeros_like(polygon_mask)
+        if max_y - min_y != 0:
+            line = max_x - 1, min_y - 1, max_x, max_y - 1
+        elif max_x - min_x != 0:
+            line = min_x - 1, max_y - 1, max_x - 1, max_y
+        else:
+            line = max_x - 1, max_y - 1, max_x, max_y
+        _view(polygon_mask, line, origin_x, origin_y)[:] = True
+
+    rect = _clip_rect(_get_region_bbox(points), width, height)
+    if rect is not None:
+        _view(label_map, rect)[_view(polygon_mask, rect, origin_x, origin_y)] = label
+
+
+def _get_region_mask(label_map: np.ndarray, label: int, bbox: Rect) -> Image.Image:
+    """Takes the mask of a region from a bounding box view of the label map.
+
+    Parts of the box outside the sheet are left empty, as with Image.crop.
+
+    :param label_map: label map of the region sheet
+    :param label: region label
+    :param bbox: left, top, right, bottom of the region
+    :return: L mask of the bounding box size
+    """
+
+    left, top, right, bottom = bbox
+    mask = np.zeros((bottom - top, right - left), np.uint8)
+
+    rect = _clip_rect(bbox, label_map.shape[1], label_map.shape[0])
+    if rect is not None:
+        _view(mask, rect, left, top)[_view(label_map, rect) == label] = MASK_COLOR
+
+    return Image.fromarray(mask, "L")
+
+
+def _get_region_bbox(points: List[Tuple[int, int]]) -> Rect:
+    left, top, right, bottom = (int(side) for side in get_sides(points))
+    if left == right:
+        right += 1
+    if top == bottom:
+        bottom += 1
+    return left, top, right, bottom
+
+
+def _view(array: np.ndarray, rect: Rect, x: int = 0, y: int = 0) -> np.ndarray:
+    left, top, right, bottom = rect
+    return array[top - y : bottom - y, left - x : right - x]
+
+
+def _intersects(rect: Rect, other: Rect) -> bool:
+    return (
+        rect[0] < other[2]
+        and other[0] < rect[2]
+        and rect[1] < other[3]
+        and other[1] < rect[3]
+    )
+
+
+def _clip_rect(rect: Rect, width: int, height: int) -> Rect | None:
+    left, top, right, bottom = rect
+    left, top = max(left, 0), max(top, 0)
+    right, bottom = min(right, width), min(bottom, height)
+    if left >= right or top >= bottom:
+        return None
+    return left, top, right, bottom
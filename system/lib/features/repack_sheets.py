@@ -0,0 +1,293 @@
+import struct
+from math import ceil
+from typing import List, Tuple, TypeAlias
+
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+from system.bytestream import Reader
+from system.lib.atlas_packing import pack_rects
+from system.lib.helper import get_sides
+from system.lib.xcod import FileInfo
+from system.localization import locale
+
+REPACK_PADDING = 2
+
+TEXTURES_TAGS = (1, 16, 19, 24, 27, 28, 29)
+SHAPES_TAGS = (2, 18)
+REGIONS_TAGS = (4, 17, 22)
+
+# Pixel offset every region was moved by, by shape and region index
+RegionOffsets: TypeAlias = List[List[Tuple[int, int]]]
+
+
+def repack_sheets(
+    file_info: FileInfo, sheets: List[Image.Image]
+) -> Tuple[List[Image.Image], RegionOffsets]:
+    """Packs the regions of every sheet tightly, making the sheets smaller.
+
+    Regions with overlapping bounds are moved together, so pixels they
+    share stay shared. Sheets keep their regions and pixel types, and
+    stay as they are if packing does not make them smaller.
+
+    Region points and sheet sizes of the file info are updated in place.
+
+    :param file_info: info of the file, with regions
+    :param sheets: sheets with sprites placed at their original points
+    :return: repacked sheets, offsets of regions
+    """
+
+    offsets: RegionOffsets = [
+        [(0, 0)] * len(shape_info.regions) for shape_info in file_info.shapes
+    ]
+
+    repacked_sheets = []
+    for sheet_index, sheet in enumerate(sheets):
+        region_indices = [
+            (shape_index, region_index)
+            for shape_index, shape_info in enumerate(file_info.shapes)
+            for region_index, region_info in enumerate(shape_info.regions)
+            if region_info.texture_id == sheet_index
+        ]
+        if not region_indices:
+            repacked_sheets.append(sheet)
+            continue
+
+        region_bounds = np.array(
+            [
+                _get_region_bounds(file_info, *indices, sheet.size)
+                for indices in region_indices
+            ]
+        )
+        groups, group_bounds = _group_overlapping(region_bounds)
+
+        group_sizes = [
+            (int(right - left), int(bottom - top))
+            for left, top, right, bottom in group_bounds
+        ]
+        packed_rects, page_sizes = pack_rects(group_sizes, sheet.size, REPACK_PADDING)
+
+        # Padding goes around the sheet edges too, a zero UV is read as
+        # the second pixel
+        page_width, page_height = page_sizes[0]
+        new_size = page_width + REPACK_PADDING * 2, page_height + REPACK_PADDING * 2
+        if (
+            len(page_sizes) > 1
+            or new_size[0] > sheet.width
+            or new_size[1] > sheet.height
+            or new_size[0] * new_size[1] >= sheet.width * sheet.height
+        ):
+            repacked_sheets.append(sheet)
+            continue
+
+        logger.info(locale.repacking_sheet % (sheet_index, *sheet.size, *new_size))
+
+        repacked_sheet = Image.new(sheet.mode, new_size)
+        group_offsets = []
+        for (left, top, right, bottom), packed_rect in zip(group_bounds, packed_rects):
+            x = packed_rect.x + REPACK_PADDING
+            y = packed_rect.y + REPACK_PADDING
+            repacked_sheet.paste(
+                sheet.crop((int(left), int(top), int(right), int(bottom))), (x, y)
+            )
+            group_offsets.append((x - int(left), y - int(top)))
+
+        for (shape_index, region_index), group in zip(region_indices, groups):
+            offset_x, offset_y = group_offsets[group]
+            offsets[shape_index][region_index] = offset_x, offset_y
+
+            region_info = file_info.shapes[shape_index].regions[region_index]
+            region_info.points = [
+                (x + offset_x, y + offset_y) for x, y in region_info.points
+            ]
+
+        file_info.sheets[sheet_index].size = new_size
+        repacked_sheets.append(repacked_sheet)
+
+    return repacked_sheets, offsets
+
+
+def patch_region_uvs(
+    data: bytes,
+    offsets: RegionOffsets,
+    old_sizes: List[Tuple[int, int]],
+    new_sizes: List[Tuple[int, int]],
+) -> bytes:
+    """Moves region UVs of a decompressed .sc file to the repacked sheets.
+
+    UVs are stored relative to sheet sizes, so every UV of a sheet
+    changes even if its region was not moved. Sheet sizes the file
+    declares are changed too.
+
+    :param data: decompressed file with shapes
+    :param offsets: pixel offsets of regions, by shape and region index
+    :param old_sizes: sheet sizes the file was made for
+    :param new_sizes: sizes of the repacked sheets
+    :return: patched file
+    """
+
+    patched = bytearray(data)
+    reader = Reader(data)
+    _skip_header(reader)
+
+    shape_index = 0
+    sheet_index = 0
+    while True:
+        tag = reader.read_char()
+        length = reader.read_uint()
+
+        if tag == 0:
+            break
+
+        if tag in TEXTURES_TAGS and sheet_index < len(new_sizes):
+            # Pixel type goes before the size
+            struct.pack_into("<HH", patched, reader.tell() + 1, *new_sizes[sheet_index])
+            sheet_index += 1
+
+        if tag not in SHAPES_TAGS:
+            reader.read(length)
+            continue
+
+        reader.read_ushort()  # id
+        reader.read_ushort()  # regions_count
+        if tag == 18:
+            reader.read_ushort()  # point_count
+
+        region_index = 0
+        while True:
+            region_tag = reader.read_char()
+            region_length = reader.read_uint()
+
+            if region_tag == 0:
+                break
+
+            if region_tag not in REGIONS_TAGS:
+                reader.read(region_length)
+                continue
+
+            texture_index = reader.read_uchar()
+            points_count = 4 if region_tag == 4 else reader.read_uchar()
+            reader.read(points_count * 8)  # xy points
+
+            offset_x, offset_y = offsets[shape_index][region_index]
+            old_width, old_height = old_sizes[texture_index]
+            new_width, new_height = new_sizes[texture_index]
+            for _ in range(points_count):
+                position = reader.tell()
+                u, v = reader.read_ushort(), reader.read_ushort()
+                struct.pack_into(
+                    "<HH",
+                    patched,
+                    position,
+                    _move_uv(u, old_width, new_width, offset_x),
+                    _move_uv(v, old_height, new_height, offset_y),
+                )
+
+            region_index += 1
+        shape_index += 1
+
+    return bytes(patched)
+
+
+def _get_region_bounds(
+    file_info: FileInfo,
+    shape_index: int,
+    region_index: int,
+    sheet_size: Tuple[int, int],
+) -> Tuple[int, int, int, int]:
+    points = file_info.shapes[shape_index].regions[region_index].points
+    left, top, right, bottom = map(int, get_sides(points))
+
+    # Polygons cover pixels at their right and bottom edges too
+    return (
+        max(left, 0),
+        max(top, 0),
+        min(right + 1, sheet_size[0]),
+        min(bottom + 1, sheet_size[1]),
+    )
+
+
+def _group_overlapping(bounds: np.ndarray) -> Tuple[List[int], np.ndarray]:
+    """Groups bounds that overlap, directly or through bounds of a group.
+
+    :param bounds: left, top, right, bottom of every rect
+    :return: group of every rect, bounds of every group
+    """
+
+    groups = list(range(len(bounds)))
+    group_bounds = bounds.copy()
+
+    while True:
+        merged_groups = _merge_overlapping(group_bounds)
+        if len(merged_groups) == len(group_bounds):
+            return groups, group_bounds
+
+        group_bounds = np.array(
+            [
+                [
+                    group_bounds[members, 0].min(),
+                    group_bounds[members, 1].min(),
+                    group_bounds[members, 2].max(),
+                    group_bounds[members, 3].max(),
+                ]
+                for members in merged_groups
+            ]
+        )
+
+        new_groups = [0] * sum(map(len, merged_groups))
+        for new_group, members in enumerate(merged_groups):
+            for member in members:
+                new_groups[member] = new_group
+        groups = [new_groups[group] for group in groups]
+
+
+def _merge_overlapping(bounds: np.ndarray) -> List[List[int]]:
+    parents = list(range(len(bounds)))
+
+    def find(index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    left, top, right, bottom = bounds.T
+    for index, (rect_left, rect_top, rect_right, rect_bottom) in enumerate(bounds):
+        overlapping = np.flatnonzero(
+            (left[index + 1 :] < rect_right)
+            & (right[index + 1 :] > rect_left)
+            & (top[index + 1 :] < rect_bottom)
+            & (bottom[index + 1 :] > rect_top)
+        )
+        for other_index in overlapping + index + 1:
+            parents[find(int(other_index))] = find(index)
+
+    members: dict = {}
+    for index in range(len(bounds)):
+        members.setdefault(find(index), []).append(index)
+    return list(members.values())
+
+
+def _move_uv(value: int, old_size: int, new_size: int, offset: int) -> int:
+    # Pixels are moved as Region.load rounds them, then the value is
+    # picked in the middle of the new pixel to be read back the same
+    position = value * old_size / 0xFFFF
+    pixel = ceil(position)
+    if int(position) == pixel:
+        pixel += 1
+
+    value = int((pixel + offset - 0.5) * 0xFFFF / new_size)
+    return min(max(value, 0), 0xFFFF)
+
+
+def _skip_header(reader: Reader) -> None:
+    for _ in range(6):
+        reader.read_ushort()  # object and matrix bank counts
+    reader.read_uint()
+    reader.read_char()
+
+    export_count = reader.read_ushort()
+    for _ in range(export_count):
+        reader.read_ushort()  # id
+    for _ in range(export_count):
+        reader.read_string()
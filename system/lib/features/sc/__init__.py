@@ -1,59 +1,181 @@
+import os
 import struct
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Callable, List, Sequence, Tuple, TypeAlias
 
 from loguru import logger
 from PIL import Image
 
 from system.bytestream import Writer
-from system.lib.console import Console
-from system.lib.features.files import write_sc
+from system.lib.compression import CompressionSettings
+from system.lib.config import config
+from system.lib.features.files import ScStreamWriter
 from system.lib.images import get_byte_count_by_pixel_type, save_texture, split_image
+from system.lib.image_output import load_image
 from system.lib.xcod import FileInfo
 from system.localization import locale
 
+SHEET_HEADER_SIZE = struct.calcsize("<BIBHH")
+END_TAG_SIZE = 5
+COPY_CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class EncodedSheet:
+    """Sheet tag encoded earlier, header included, written as it is."""
+
+    path: Path
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+
+Sheet: TypeAlias = Image.Image | Path | EncodedSheet
+
 
 def compile_sc(
     output_folder: Path,
     file_info: FileInfo,
-    sheets: List[Image.Image],
-):
+    sheets: Sequence[Sheet],
+    on_sheet_encoded: Callable[[int, bytes], None] | None = None,
+    resize: bool = True,
+) -> CompressionSettings:
+    """Encodes sheets and streams them into a compressed _tex.sc file.
+
+    Sheets given as paths are opened one at a time when they are encoded,
+    so only one of them is in memory, along with the compressor state.
+
+    Compression settings stored in the .xcod are reused, without them the
+    codec is tuned on the payload if auto tuning is enabled.
+
+    :param output_folder: folder to write the file to
+    :param file_info: parsed .xcod info
+    :param sheets: sheet images, paths to them or already encoded sheets
+    :param on_sheet_encoded: called with the index and tag of encoded sheets
+    :param resize: whether sheets of other size than in the .xcod are
+        resized to it
+    :return: settings the file was compressed with
+    """
+
+    sizes = _get_sheet_sizes(file_info, sheets, resize)
+    payload_size = END_TAG_SIZE
+    for sheet, sheet_info, (width, height) in zip(sheets, file_info.sheets, sizes):
+        if isinstance(sheet, EncodedSheet):
+            payload_size += sheet.size
+        else:
+            pixel_size = get_byte_count_by_pixel_type(sheet_info.pixel_type)
+            payload_size += SHEET_HEADER_SIZE + width * height * pixel_size
+
+    settings = None
+    time_budget = None
+    if file_info.compression is not None:
+        settings = CompressionSettings.from_dict(file_info.compression)
+    elif config.compression_auto_tune:
+        time_budget = config.compression_time_budget
+
+    with ScStreamWriter(
+        output_folder / f"{file_info.name}.sc",
+        payload_size,
+        file_info.use_lzham,
+        settings,
+        time_budget,
+    ) as sc_writer:
+        for picture_index in range(len(sheets)):
+            if isinstance(sheets[picture_index], EncodedSheet):
+                _copy_encoded_sheet(sheets[picture_index], sc_writer)
+                continue
+
+            sheet_info = file_info.sheets[picture_index]
+            sheet = _open_sheet(sheets[picture_index])
+
+            file_type = sheet_info.file_type
+            pixel_type = sheet_info.pixel_type
+
+            if sheet.size != sizes[picture_index]:
+                logger.info(locale.resizing)
+                sheet = sheet.resize(sizes[picture_index], Image.ANTIALIAS)
+
+            logger.info(
+                locale.about_sc
+                % (file_info.name, picture_index, pixel_type, *sheet.size)
+            )
+
+            encoded = encode_sheet(sheet, file_type, pixel_type)
+            sc_writer.write(encoded)
+            if on_sheet_encoded is not None:
+                on_sheet_encoded(picture_index, encoded)
+            print()
+
+        sc_writer.write(bytes(END_TAG_SIZE))
+    return sc_writer.settings
+
+
+def encode_sheet(sheet: Image.Image, file_type: int, pixel_type: int) -> bytes:
+    """Encodes a sheet into a texture tag, header included.
+
+    :param sheet: sheet image
+    :param file_type: texture tag, 27 and 28 are split into 32x32 chunks
+    :param pixel_type: pixel type to encode with
+    :return: encoded tag
+    """
+
+    width, height = sheet.size
+    pixel_size = get_byte_count_by_pixel_type(pixel_type)
+
+    file_size = width * height * pixel_size + 5
+
     sc = Writer()
+    sc.write(struct.pack("<BIBHH", file_type, file_size, pixel_type, width, height))
+
+    if file_type in (27, 28):
+        if sheet.readonly:
+            sheet = sheet.copy()
+        split_image(sheet)
+
+    save_texture(sc, sheet, pixel_type)
+    return sc.getvalue()
+
 
+def _get_sheet_sizes(
+    file_info: FileInfo, sheets: Sequence[Sheet], resize: bool
+) -> List[Tuple[int, int]]:
+    """Returns the size each sheet is encoded with.
+
+    Sheets of unexpected size are resized if asked to. Settled before
+    encoding, as the payload size is written ahead of the compressed data.
+    """
+
+    sizes = []
     for picture_index in range(len(sheets)):
         sheet_info = file_info.sheets[picture_index]
         sheet = sheets[picture_index]
+        if isinstance(sheet, EncodedSheet):
+            sizes.append(sheet_info.size)
+            continue
 
-        file_type = sheet_info.file_type
-        pixel_type = sheet_info.pixel_type
-
-        if sheet.size != sheet_info.size:
+        size = _open_sheet(sheet).size
+        if size != sheet_info.size:
             logger.info(
                 locale.illegal_size
-                % (sheet_info.width, sheet_info.height, sheet.width, sheet.height)
+                % (sheet_info.width, sheet_info.height, size[0], size[1])
             )
 
-            if Console.question(locale.resize_qu):
-                logger.info(locale.resizing)
-                sheet = sheet.resize(sheet_info.size, Image.ANTIALIAS)
-
-        width, height = sheet.size
-        pixel_size = get_byte_count_by_pixel_type(pixel_type)
-
-        file_size = width * height * pixel_size + 5
-
-        logger.info(
-            locale.about_sc % (file_info.name, picture_index, pixel_type, width, height)
-        )
+            if resize:
+                size = sheet_info.size
 
-        sc.write(struct.pack("<BIBHH", file_type, file_size, pixel_type, width, height))
+        sizes.append(size)
+    return sizes
 
-        if file_type in (27, 28):
-            split_image(sheet)
 
-        save_texture(sc, sheet, pixel_type)
-        print()
+def _open_sheet(sheet: Image.Image | Path) -> Image.Image:
+    if isinstance(sheet, Path):
+        return load_image(sheet)
+    return sheet
 
-    sc.write(bytes(5))
 
-    write_sc(output_folder / f"{file_info.name}.sc", sc.getvalue(), file_info.use_lzham)
+def _copy_encoded_sheet(sheet: EncodedSheet, sc_writer: ScStreamWriter) -> None:
+    with open(sheet.path, "rb") as file:
+        for chunk in iter(lambda: file.read(COPY_CHUNK_SIZE), b""):
+            sc_writer.write(chunk)
@@ -4,7 +4,13 @@ from pathlib import Path
 
 from loguru import logger
 
+from system.bytestream import Writer
+from system.lib.batch import BatchTask, run_batch
+from system.lib.config import config
 from system.lib.features.cut_sprites import render_objects
+from system.lib.features.ktx_passthrough import write_ktx_tags
+from system.lib.image_writer import ImageWriter
+from system.lib.output_sinks import FolderSink, OutputSink, open_output_sink
 from system.lib.swf import SupercellSWF
 from system.localization import locale
 
@@ -17,106 +23,152 @@ def decode_textures_only():
     input_folder = IN_COMPRESSED_PATH
     output_folder = OUT_DECOMPRESSED
 
-    files = os.listdir(input_folder)
-    for file in files:
-        if not file.endswith("_tex.sc"):
-            continue
+    tasks = [
+        BatchTask.create(input_folder / file, output_folder, _decode_textures)
+        for file in os.listdir(input_folder)
+        if file.endswith("_tex.sc")
+    ]
+    with open_output_sink(output_folder) as sink:
+        run_batch(tasks, sink)
 
-        swf = SupercellSWF()
-        base_name = os.path.basename(file).rsplit(".", 1)[0]
-        try:
-            texture_loaded, use_lzham = swf.load(f"{input_folder / file}")
-            if not texture_loaded:
-                logger.error(locale.not_found % f"{base_name}_tex.sc")
-                continue
 
-            base_name = get_file_basename(swf)
+def _decode_textures(file_path: Path, output_folder: Path, sink: OutputSink) -> None:
+    swf = SupercellSWF()
+    base_name = os.path.basename(file_path).rsplit(".", 1)[0]
+    try:
+        texture_loaded, use_lzham = swf.load(f"{file_path}")
+        if not texture_loaded:
+            logger.error(locale.not_found % f"{base_name}_tex.sc")
+            return
 
-            objects_output_folder = _create_objects_output_folder(
-                output_folder, base_name
-            )
+        base_name = get_file_basename(swf)
+
+        objects_output_folder = _create_objects_output_folder(
+            output_folder, base_name, sink
+        )
 
+        with ImageWriter(sink=sink) as writer:
             _save_meta_file(
-                swf, objects_output_folder, base_name.rstrip("_"), use_lzham
+                swf, objects_output_folder, base_name.rstrip("_"), use_lzham, writer
             )
-            _save_textures(swf, objects_output_folder, base_name)
-        except Exception as exception:
-            logger.exception(
-                locale.error
-                % (
-                    exception.__class__.__module__,
-                    exception.__class__.__name__,
-                    exception,
-                )
+            _save_textures(swf, objects_output_folder, base_name, writer)
+    except Exception as exception:
+        logger.exception(
+            locale.error
+            % (
+                exception.__class__.__module__,
+                exception.__class__.__name__,
+                exception,
             )
+        )
 
-        print()
+    print()
 
 
 def decode_and_render_objects():
     input_folder = IN_COMPRESSED_PATH
     output_folder = OUT_SPRITES_PATH
-    files = os.listdir(input_folder)
+    tasks = [
+        BatchTask.create(input_folder / file, output_folder, _decode_and_render_objects)
+        for file in os.listdir(input_folder)
+        if not file.endswith("_tex.sc")
+    ]
+    with open_output_sink(output_folder) as sink:
+        run_batch(tasks, sink)
 
-    for file in files:
-        if file.endswith("_tex.sc"):
-            continue
 
-        try:
-            base_name = os.path.basename(file).rsplit(".", 1)[0]
-
-            swf = SupercellSWF()
-            texture_loaded, use_lzham = swf.load(input_folder / file)
-            if not texture_loaded:
-                logger.error(locale.not_found % f"{base_name}_tex.sc")
-                continue
-
-            base_name = get_file_basename(swf)
+def _decode_and_render_objects(
+    file_path: Path, output_folder: Path, sink: OutputSink
+) -> None:
+    try:
+        base_name = os.path.basename(file_path).rsplit(".", 1)[0]
 
-            objects_output_folder = _create_objects_output_folder(
-                output_folder, base_name
+        swf = SupercellSWF()
+        texture_loaded, use_lzham = swf.load(file_path)
+        if not texture_loaded:
+            logger.error(locale.not_found % f"{base_name}_tex.sc")
+            return
+
+        base_name = get_file_basename(swf)
+
+        objects_output_folder = _create_objects_output_folder(
+            output_folder, base_name, sink
+        )
+
+        with ImageWriter(sink=sink) as writer:
+            _save_textures(swf, objects_output_folder / "textures", base_name, writer)
+            render_objects(
+                swf,
+                objects_output_folder,
+                render_movie_clips=config.render_movie_clips,
+                use_apng=config.movie_clips_apng,
+                workers=config.cut_sprites_workers or os.cpu_count() or 1,
+                writer=writer,
+                pack_atlases=config.pack_sprite_atlases,
             )
-
-            _save_textures(swf, objects_output_folder / "textures", base_name)
-            render_objects(swf, objects_output_folder)
-            _save_meta_file(swf, objects_output_folder, base_name, use_lzham)
-        except Exception as exception:
-            logger.exception(
-                locale.error
-                % (
-                    exception.__class__.__module__,
-                    exception.__class__.__name__,
-                    exception,
-                )
+            _save_meta_file(swf, objects_output_folder, base_name, use_lzham, writer)
+    except Exception as exception:
+        logger.exception(
+            locale.error
+            % (
+                exception.__class__.__module__,
+                exception.__class__.__name__,
+                exception,
             )
+        )
 
-        print()
+    print()
 
 
 def get_file_basename(swf: SupercellSWF):
     return os.path.basename(swf.filename).rsplit(".", 1)[0]
 
 
-def _create_objects_output_folder(output_folder: Path, base_name: str) -> Path:
+def _create_objects_output_folder(
+    output_folder: Path, base_name: str, sink: OutputSink
+) -> Path:
     objects_output_folder = output_folder / base_name
+    # Archives keep their own layout, nothing is created on disk
+    if not isinstance(sink, FolderSink):
+        return objects_output_folder
+
     if os.path.isdir(objects_output_folder):
         shutil.rmtree(objects_output_folder)
     os.mkdir(objects_output_folder)
     return objects_output_folder
 
 
-def _save_textures(swf: SupercellSWF, textures_output: Path, base_name: str) -> None:
-    os.makedirs(textures_output, exist_ok=True)
+def _save_textures(
+    swf: SupercellSWF, textures_output: Path, base_name: str, writer: ImageWriter
+) -> None:
+    filenames = []
     for img_index in range(len(swf.textures)):
         filename = base_name + "_" * img_index
-        swf.textures[img_index].image.save(textures_output / f"{filename}.png")
+        writer.write(swf.textures[img_index].image, textures_output / filename)
+        filenames.append(filename)
+
+    write_ktx_tags(swf.textures, filenames, textures_output, writer)
 
 
 def _save_meta_file(
-    swf: SupercellSWF, objects_output_folder: Path, base_name: str, use_lzham: bool
+    swf: SupercellSWF,
+    objects_output_folder: Path,
+    base_name: str,
+    use_lzham: bool,
+    writer: ImageWriter,
 ) -> None:
-    with open(objects_output_folder / f"{base_name}.xcod", "wb") as xcod_file:
-        xcod_file.write(b"XCOD")
-        xcod_file.write(bool.to_bytes(use_lzham, 1, "big"))
-        xcod_file.write(int.to_bytes(len(swf.textures), 1, "big"))
-        xcod_file.write(swf.xcod_writer.getvalue())
+    sheets_info = Writer("big")
+    for texture in swf.textures:
+        sheets_info.write_ubyte(texture.file_type)
+        sheets_info.write_ubyte(texture.pixel_type)
+        sheets_info.write_uint16(texture.width)
+        sheets_info.write_uint16(texture.height)
+
+    writer.write_data(
+        objects_output_folder / f"{base_name}.xcod",
+        b"XCOD"
+        + bool.to_bytes(use_lzham, 1, "big")
+        + int.to_bytes(len(swf.textures), 1, "big")
+        + sheets_info.getvalue()
+        + swf.xcod_writer.getvalue(),
+    )
@@ -1,12 +1,28 @@
+import functools
 import os
 from pathlib import Path
 
 from loguru import logger
 from PIL import Image
 
+from system.lib.batch import BatchTask, run_batch
+from system.lib.compression import CompressionSettings
+from system.lib.config import config
+from system.lib.features.encode_cache import (
+    EncodeCache,
+    get_cache_key,
+    get_file_stamps,
+)
+from system.lib.features.files import open_sc, write_sc
+from system.lib.features.ktx_passthrough import splice_ktx_sheets
 from system.lib.features.place_sprites import place_sprites
+from system.lib.features.repack_sheets import patch_region_uvs, repack_sheets
 from system.lib.features.sc import compile_sc
-from system.lib.xcod import parse_info
+from system.lib.features.sc.decode import IN_COMPRESSED_PATH
+from system.lib.image_output import is_image_file, load_image
+from system.lib.output_sinks import FolderSink, OutputSink
+from system.lib.sprite_manifest import MANIFEST_FILENAME
+from system.lib.xcod import FileInfo, parse_info, write_compression_info
 from system.localization import locale
 
 OUT_COMPRESSED_PATH = Path("./SC/Out-Compressed")
@@ -18,38 +34,167 @@ def encode_textures_only():
     input_folder = IN_DECOMPRESSED_PATH
     output_folder = OUT_COMPRESSED_PATH
 
-    for folder in os.listdir(input_folder):
-        textures_input_folder = input_folder / folder
-
-        if not os.path.isdir(textures_input_folder):
-            continue
-
-        xcod_path = _ensure_metadata_exists(textures_input_folder, folder)
-        if xcod_path is None:
-            continue
-
-        file_info = parse_info(xcod_path, False)
-        sheets = _load_sheets(textures_input_folder)
-        compile_sc(output_folder, file_info, sheets)
+    # Workers have no console to ask on, so resizing is settled here
+    handler = functools.partial(_encode_textures, resize=config.resize_sheets)
+    tasks = [
+        BatchTask.create(input_folder / folder, output_folder, handler)
+        for folder in os.listdir(input_folder)
+        if os.path.isdir(input_folder / folder)
+    ]
+    run_batch(tasks, FolderSink())
+
+
+def _encode_textures(
+    textures_input_folder: Path,
+    output_folder: Path,
+    sink: OutputSink,
+    resize: bool = True,
+) -> None:
+    xcod_path = _ensure_metadata_exists(
+        textures_input_folder, textures_input_folder.name
+    )
+    if xcod_path is None:
+        return
+
+    file_info = parse_info(xcod_path, False)
+    sheets = _load_sheets(textures_input_folder)
+    sheets = splice_ktx_sheets(file_info, textures_input_folder, sheets)
+    settings = compile_sc(output_folder, file_info, sheets, resize=resize)
+    _save_tuned_compression(file_info, xcod_path, settings)
 
 
 def collect_objects_and_encode(overwrite: bool = False) -> None:
     input_folder = IN_SPRITES_PATH
     output_folder = OUT_COMPRESSED_PATH
 
-    for folder in os.listdir(input_folder):
-        objects_input_folder = input_folder / folder
-
-        if not os.path.isdir(objects_input_folder):
-            continue
-
-        xcod_path = _ensure_metadata_exists(objects_input_folder, folder)
-        if xcod_path is None:
-            continue
-
-        file_info = parse_info(xcod_path, True)
-        sheets = place_sprites(file_info, objects_input_folder, overwrite)
-        compile_sc(output_folder, file_info, sheets)
+    # A partial of a module function can be sent to worker processes
+    # Workers have no console to ask on, so resizing is settled here
+    handler = functools.partial(
+        _collect_objects_and_encode,
+        overwrite=overwrite,
+        resize=config.resize_sheets,
+    )
+    tasks = [
+        BatchTask.create(input_folder / folder, output_folder, handler)
+        for folder in os.listdir(input_folder)
+        if os.path.isdir(input_folder / folder)
+    ]
+    run_batch(tasks, FolderSink())
+
+
+def _collect_objects_and_encode(
+    objects_input_folder: Path,
+    output_folder: Path,
+    sink: OutputSink,
+    overwrite: bool = False,
+    resize: bool = True,
+) -> None:
+    xcod_path = _ensure_metadata_exists(objects_input_folder, objects_input_folder.name)
+    if xcod_path is None:
+        return
+
+    file_info = parse_info(xcod_path, True)
+    cache = None
+    if config.incremental_encode:
+        cache = _open_encode_cache(objects_input_folder, xcod_path, overwrite)
+
+    sheets = place_sprites(file_info, objects_input_folder, overwrite, cache)
+    on_sheet_encoded = None
+    if config.repack_sheets:
+        sheets = _repack_sheets(
+            file_info,
+            [
+                sheet if isinstance(sheet, Image.Image) else load_image(sheet)
+                for sheet in sheets
+            ],
+            output_folder,
+        )
+    elif cache is not None:
+        # Sheets that were not placed again keep their encoded tags
+        sheets = [cache.get_encoded_sheet(i) or sheet for i, sheet in enumerate(sheets)]
+        on_sheet_encoded = cache.save_encoded_sheet
+
+    sheets = splice_ktx_sheets(file_info, objects_input_folder / "textures", sheets)
+    settings = compile_sc(output_folder, file_info, sheets, on_sheet_encoded, resize)
+    xcod_changed = _save_tuned_compression(file_info, xcod_path, settings)
+
+    if cache is not None:
+        if xcod_changed:
+            # Sheets do not depend on the stored settings
+            cache.key = _get_encode_cache_key(
+                objects_input_folder, xcod_path, overwrite
+            )
+        cache.save()
+
+
+def _repack_sheets(
+    file_info: FileInfo, sheets: list[Image.Image], output_folder: Path
+) -> list[Image.Image]:
+    """Repacks sheets and writes the file with shapes, its UVs moved along.
+
+    Shapes are read from the compressed file the sprites were decoded
+    from. Sheets are left as they are if it cannot be found, or if
+    shapes are stored along with the sheets.
+    """
+
+    shapes_file_name = f"{file_info.name.removesuffix('_tex')}.sc"
+    shapes_file_path = IN_COMPRESSED_PATH / shapes_file_name
+    if shapes_file_name == f"{file_info.name}.sc" or not os.path.exists(
+        shapes_file_path
+    ):
+        logger.error(locale.not_found % shapes_file_name)
+        return sheets
+
+    old_sizes = [sheet_info.size for sheet_info in file_info.sheets]
+    sheets, offsets = repack_sheets(file_info, sheets)
+    new_sizes = [sheet_info.size for sheet_info in file_info.sheets]
+
+    decompressed, use_lzham = open_sc(str(shapes_file_path))
+    write_sc(
+        output_folder / shapes_file_name,
+        patch_region_uvs(decompressed, offsets, old_sizes, new_sizes),
+        use_lzham,
+    )
+    return sheets
+
+
+def _save_tuned_compression(
+    file_info: FileInfo, xcod_path: Path, settings: CompressionSettings
+) -> bool:
+    """Stores tuned settings in the .xcod, so later encodes reuse them.
+
+    :return: whether the .xcod was changed
+    """
+
+    if file_info.compression is not None or not config.compression_auto_tune:
+        return False
+
+    file_info.compression = settings.to_dict()
+    write_compression_info(xcod_path, file_info.compression)
+    return True
+
+
+def _open_encode_cache(
+    input_folder: Path, xcod_path: Path, overwrite: bool
+) -> EncodeCache:
+    key = _get_encode_cache_key(input_folder, xcod_path, overwrite)
+    return EncodeCache(input_folder, xcod_path.stem, key)
+
+
+def _get_encode_cache_key(input_folder: Path, xcod_path: Path, overwrite: bool) -> str:
+    texture_stamps = []
+    if overwrite:
+        textures_folder = input_folder / "textures"
+        texture_stamps = get_file_stamps(
+            textures_folder / file for file in os.listdir(textures_folder)
+        )
+
+    return get_cache_key(
+        xcod_path,
+        input_folder / MANIFEST_FILENAME,
+        overwrite=overwrite,
+        textures=texture_stamps,
+    )
 
 
 def _ensure_metadata_exists(input_folder: Path, file: str) -> Path | None:
@@ -64,13 +209,13 @@ def _ensure_metadata_exists(input_folder: Path, file: str) -> Path | None:
     return metadata_file_path
 
 
-def _load_sheets(input_folder: Path) -> list[Image.Image]:
+def _load_sheets(input_folder: Path) -> list[Path]:
     files = []
     for i in os.listdir(input_folder):
-        if i.endswith(".png"):
+        if is_image_file(i):
             files.append(i)
     files.sort()
 
     if not files:
         raise RuntimeError(locale.dir_empty % input_folder.name)
-    return [Image.open(input_folder / file) for file in files]
+    return [input_folder / file for file in files]
@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+from system.lib.atlas_packing import pack_rects
+from system.lib.image_output import get_image_format, get_image_path
+from system.lib.image_writer import ImageWriter
+from system.lib.sprite_manifest import SpriteManifest
+
+ATLAS_SIZE = 2048
+ATLAS_PADDING = 2
+
+
+def save_sprite_atlases(
+    sprites: Dict[str, Image.Image],
+    output_folder: Path,
+    writer: ImageWriter,
+    manifest: SpriteManifest | None = None,
+    name: str = "atlas",
+) -> None:
+    """Packs trimmed sprites into atlases with TexturePacker-style JSON.
+
+    Every atlas gets a JSON in the hash format: frame rects, rotation,
+    trim offsets and source sizes by sprite name. Output is the same for
+    the same sprites, whatever order they are given in.
+
+    Sprites the manifest maps to another one get frames of their own,
+    pointing at the packed copy of that sprite.
+
+    :param sprites: sprite images by name
+    :param output_folder: folder for atlases and their JSON
+    :param writer: writer of the output files
+    :param manifest: sprite names mapped to the names of packed sprites
+    :param name: base name of atlas files
+    """
+
+    names = sorted(sprites)
+    trim_boxes = [_get_trim_box(sprites[sprite_name]) for sprite_name in names]
+    sizes = [(right - left, bottom - top) for left, top, right, bottom in trim_boxes]
+
+    packed_rects, page_sizes = pack_rects(
+        sizes, (ATLAS_SIZE, ATLAS_SIZE), ATLAS_PADDING
+    )
+
+    pages = [Image.new("RGBA", page_size) for page_size in page_sizes]
+    frames: List[Dict[str, dict]] = [{} for _ in pages]
+    for sprite_name, trim_box, packed_rect in zip(names, trim_boxes, packed_rects):
+        sprite = sprites[sprite_name]
+        pages[packed_rect.page].paste(
+            sprite.crop(trim_box), (packed_rect.x, packed_rect.y)
+        )
+
+        left, top, right, bottom = trim_box
+        frames[packed_rect.page][sprite_name] = {
+            "frame": _get_rect(
+                packed_rect.x, packed_rect.y, right - left, bottom - top
+            ),
+            "rotated": False,
+            "trimmed": trim_box != (0, 0, *sprite.size),
+            "spriteSourceSize": _get_rect(left, top, right - left, bottom - top),
+            "sourceSize": {"w": sprite.width, "h": sprite.height},
+        }
+
+    if manifest is not None:
+        pages_by_name = {
+            sprite_name: packed_rect.page
+            for sprite_name, packed_rect in zip(names, packed_rects)
+        }
+        for sprite_name, stored_name in sorted(manifest.items()):
+            if sprite_name == stored_name or stored_name not in pages_by_name:
+                continue
+
+            page_frames = frames[pages_by_name[stored_name]]
+            page_frames[sprite_name] = page_frames[stored_name]
+
+    image_format = get_image_format()
+    for page_index, page in enumerate(pages):
+        page_name = f"{name}_{page_index}"
+        image_path = get_image_path(output_folder / page_name, image_format)
+
+        writer.write(page, output_folder / page_name, image_format)
+        writer.write_data(
+            output_folder / f"{page_name}.json",
+            json.dumps(
+                {
+                    "frames": frames[page_index],
+                    "meta": {
+                        "image": image_path.name,
+                        "format": "RGBA8888",
+                        "size": {"w": page.width, "h": page.height},
+                        "scale": "1",
+                    },
+                },
+                indent=4,
+            ).encode(),
+        )
+
+
+def _get_trim_box(sprite: Image.Image) -> Tuple[int, int, int, int]:
+    if sprite.mode != "RGBA":
+        sprite = sprite.convert("RGBA")
+
+    trim_box = sprite.getchannel("A").getbbox()
+    if trim_box is None:
+        return 0, 0, 1, 1
+    return trim_box
+
+
+def _get_rect(x: int, y: int, width: int, height: int) -> Dict[str, int]:
+    return {"x": x, "y": y, "w": width, "h": height}
@@ -1,8 +1,10 @@
-from typing import List, Tuple, TypeAlias
+from typing import TYPE_CHECKING, List, Tuple, TypeAlias, Union
 
-from system.lib.objects.point import Point
+if TYPE_CHECKING:
+    # Objects import the helper, so points are imported only where used
+    from system.lib.objects.point import Point
 
-PointType: TypeAlias = Tuple[float, float] | Tuple[int, int] | Point
+PointType: TypeAlias = Union[Tuple[float, float], Tuple[int, int], "Point"]
 
 
 def get_size(left: float, top: float, right: float, bottom: float) -> Tuple[int, int]:
@@ -18,7 +20,7 @@ def get_size(left: float, top: float, right: float, bottom: float) -> Tuple[int,
 
 
 def get_sides(
-    points: List[Tuple[float, float]] | List[Tuple[int, int]] | List[Point]
+    points: Union[List[Tuple[float, float]], List[Tuple[int, int]], List["Point"]]
 ) -> Tuple[float, float, float, float]:
     """Calculates and returns rect sides.
 
@@ -26,6 +28,8 @@ def get_sides(
     :return: left, top, right, bottom
     """
 
+    from system.lib.objects.point import Point
+
     if len(points) > 0:
         point: PointType = points[0]
         if isinstance(point, Point):
@@ -0,0 +1,154 @@
+import io
+import os
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Tuple, TypeAlias
+
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+from system.lib.config import config
+from system.localization import locale
+
+PNG = "png"
+WEBP = "webp"
+QOI = "qoi"
+NPY = "npy"
+
+SaveFunction: TypeAlias = Callable[[Image.Image, BinaryIO], None]
+LoadFunction: TypeAlias = Callable[[str], Image.Image]
+
+
+def get_image_format() -> str:
+    """Returns the configured output format, PNG if it is unknown or unusable."""
+
+    image_format = config.image_format
+    if image_format not in _save_functions:
+        return PNG
+
+    if image_format == QOI and not _has_qoi():
+        logger.warning(locale.install_to_unlock % "qoi")
+        config.image_format = PNG
+        return PNG
+    return image_format
+
+
+def save_image(
+    image: Image.Image, path: Path | str, image_format: str | None = None
+) -> Path:
+    """Saves an image in the configured format, adding its extension.
+
+    :param image: image to save
+    :param path: output path without extension
+    :param image_format: format to use instead of the configured one
+    :return: path of the written file
+    """
+
+    if image_format is None:
+        image_format = get_image_format()
+
+    output_path = get_image_path(path, image_format)
+    with open(output_path, "wb") as file:
+        _save_functions[image_format](image, file)
+    return output_path
+
+
+def encode_image(
+    image: Image.Image, path: Path | str, image_format: str | None = None
+) -> Tuple[Path, bytes]:
+    """Encodes an image like save_image does, but keeps it in memory.
+
+    :param image: image to encode
+    :param path: output path without extension
+    :param image_format: format to use instead of the configured one
+    :return: output path with extension, encoded image
+    """
+
+    if image_format is None:
+        image_format = get_image_format()
+
+    buffer = io.BytesIO()
+    _save_functions[image_format](image, buffer)
+    return get_image_path(path, image_format), buffer.getvalue()
+
+
+def get_image_path(path: Path | str, image_format: str) -> Path:
+    return Path(f"{path}.{image_format}")
+
+
+def load_image(path: Path | str) -> Image.Image:
+    """Opens an image written by save_image, or any image Pillow can read.
+
+    :param path: image path with extension
+    :return: image, .npy dumps are memory-mapped instead of read
+    """
+
+    extension = os.path.splitext(path)[1][1:].lower()
+    if extension in _load_functions:
+        return _load_functions[extension](str(path))
+    return Image.open(path)
+
+
+def is_image_file(filename: str) -> bool:
+    extension = os.path.splitext(filename)[1][1:].lower()
+    return extension in _save_functions
+
+
+def _save_png(image: Image.Image, file: BinaryIO) -> None:
+    image.save(
+        file,
+        "PNG",
+        compress_level=config.png_compress_level,
+        optimize=config.png_optimize,
+    )
+
+
+def _save_webp(image: Image.Image, file: BinaryIO) -> None:
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    image.save(file, "WEBP", lossless=True)
+
+
+def _save_qoi(image: Image.Image, file: BinaryIO) -> None:
+    import qoi
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    file.write(qoi.encode(np.ascontiguousarray(np.asarray(image))))
+
+
+def _save_npy(image: Image.Image, file: BinaryIO) -> None:
+    np.save(file, np.asarray(image))
+
+
+def _load_qoi(path: str) -> Image.Image:
+    import qoi
+
+    return Image.fromarray(qoi.read(path))
+
+
+def _load_npy(path: str) -> Image.Image:
+    return Image.fromarray(np.load(path, mmap_mode="r"))
+
+
+def _has_qoi() -> bool:
+    try:
+        import qoi
+
+        del qoi
+    except ImportError:
+        return False
+    return True
+
+
+_save_functions: Dict[str, SaveFunction] = {
+    PNG: _save_png,
+    WEBP: _save_webp,
+    QOI: _save_qoi,
+    NPY: _save_npy,
+}
+
+_load_functions: Dict[str, LoadFunction] = {
+    QOI: _load_qoi,
+    NPY: _load_npy,
+}
@@ -0,0 +1,121 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+from PIL import Image
+
+from system.lib.image_output import encode_image
+from system.lib.output_sinks import FolderSink, OutputSink
+
+# Images waiting to be written per writer thread, bounds memory use
+PENDING_PER_THREAD = 2
+
+
+class ImageWriter:
+    """Encodes and writes images on background threads.
+
+    Image encoders release the GIL, so decoding goes on while images are
+    written. Writing blocks once too many images are pending, and errors
+    of background writes are raised by flush.
+
+    Images must not be changed after they are given to the writer.
+    Files go to the given sink, loose files on disk by default.
+    """
+
+    def __init__(self, threads: int | None = None, sink: OutputSink | None = None):
+        if threads is None:
+            threads = min(os.cpu_count() or 1, 8)
+
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="ImageWriter")
+        self._slots = threading.BoundedSemaphore(threads * PENDING_PER_THREAD)
+        self._futures: List[Future] = []
+        self._sink = sink or FolderSink()
+        self._has_failed = False
+
+    @property
+    def sink(self) -> OutputSink:
+        return self._sink
+
+    def write(
+        self, image: Image.Image, path: Path | str, image_format: str | None = None
+    ) -> None:
+        """Queues an image for saving, see image_output.save_image.
+
+        :param image: image to save
+        :param path: output path without extension
+        :param image_format: format to use instead of the configured one
+        """
+
+        self._submit(self._write_image, image, path, image_format)
+
+    def write_data(self, path: Path | str, data: bytes) -> None:
+        """Queues already encoded file data, like metadata files.
+
+        :param path: output path
+        :param data: file contents
+        """
+
+        self._submit(self._sink.write, path, data)
+
+    def _submit(self, function, *args) -> None:
+        if self._has_failed:
+            self.flush()
+
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(self._on_written)
+        self._futures.append(future)
+
+    def _write_image(
+        self, image: Image.Image, path: Path | str, image_format: str | None
+    ) -> None:
+        output_path, data = encode_image(image, path, image_format)
+        self._sink.write(output_path, data)
+
+    def flush(self) -> None:
+        """Waits until all queued images are written.
+
+        :raises Exception: the first error of a background write
+        """
+
+        futures, self._futures = self._futures, []
+        self._has_failed = False
+
+        error = None
+        for future in futures:
+            exception = future.exception()
+            if error is None:
+                error = exception
+
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self) -> "ImageWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+
+        # An error is already propagating, background errors are dropped
+        self._executor.shutdown(cancel_futures=True)
+
+    def _on_written(self, future: Future) -> None:
+        self._slots.release()
+
+        if not future.cancelled() and future.exception() is not None:
+            self._has_failed = True
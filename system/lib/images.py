@@ -1,5 +1,7 @@
 import math
+from typing import Tuple
 
+import numpy as np
 import PIL.PyAccess
 from PIL import Image
 
@@ -7,6 +9,7 @@ from system.bytestream import Reader, Writer
 from system.lib.console import Console
 from system.lib.pixel_utils import (
     get_channel_count_by_pixel_type,
+    get_decode_function,
     get_read_function,
     get_write_function,
 )
@@ -138,6 +141,65 @@ def load_texture(reader: Reader, pixel_type: int, img: Image.Image) -> None:
                 point = curr
 
 
+def decode_texture_region(
+    data: bytes | memoryview,
+    pixel_type: int,
+    size: Tuple[int, int],
+    bbox: Tuple[int, int, int, int],
+    is_tiled: bool = False,
+) -> Image.Image:
+    """Decodes only the pixels of a texture inside the bbox.
+
+    Raw pixels have fixed offsets, so only bytes of the covered rows,
+    or of the covered 32x32 chunks for tiled textures, are touched.
+
+    :param data: raw pixel data of the whole texture
+    :param pixel_type: pixel type of the texture
+    :param size: texture width and height
+    :param bbox: left, top, right, bottom, clipped to the texture
+    :param is_tiled: pixels are stored in 32x32 chunks, tags 27, 28 and 29
+    :return: decoded part of the texture
+    """
+
+    decode_pixels = get_decode_function(pixel_type)
+    if decode_pixels is None:
+        raise Exception(locale.unknown_pixel_type % pixel_type)
+
+    width, height = size
+    left, top, right, bottom = bbox
+    left, top = max(left, 0), max(top, 0)
+    right, bottom = min(right, width), min(bottom, height)
+
+    image_mode = get_format_by_pixel_type(pixel_type)
+    if left >= right or top >= bottom:
+        return Image.new(image_mode, (max(right - left, 0), max(bottom - top, 0)))
+
+    byte_count = get_byte_count_by_pixel_type(pixel_type)
+    pixels = np.frombuffer(data, np.uint8, width * height * byte_count).reshape(
+        -1, byte_count
+    )
+
+    xs = np.arange(left, right)
+    ys = np.arange(top, bottom)[:, np.newaxis]
+    if is_tiled:
+        chunk_widths = np.minimum(CHUNK_SIZE, width - xs // CHUNK_SIZE * CHUNK_SIZE)
+        chunk_heights = np.minimum(CHUNK_SIZE, height - ys // CHUNK_SIZE * CHUNK_SIZE)
+        pixel_indices = (
+            ys // CHUNK_SIZE * CHUNK_SIZE * width
+            + xs // CHUNK_SIZE * CHUNK_SIZE * chunk_heights
+            + ys % CHUNK_SIZE * chunk_widths
+            + xs % CHUNK_SIZE
+        )
+    else:
+        pixel_indices = ys * width + xs
+
+    channels = decode_pixels(pixels[pixel_indices.ravel()])
+    channels = np.ascontiguousarray(channels).reshape(bottom - top, right - left, -1)
+    if image_mode == "L":
+        channels = channels[:, :, 0]
+    return Image.fromarray(channels, image_mode)
+
+
 def save_texture(writer: Writer, img: Image.Image, pixel_type: int):
     write_pixel = get_write_function(pixel_type)
     if write_pixel is None:
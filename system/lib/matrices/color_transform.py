@@ -1,2 +1,91 @@
-class ColorTransform:
-    pass
+import numpy as np
+
+from system.bytestream import Reader
+
+# Columns of a color transform row
+RED_MULTIPLIER = 0
+GREEN_MULTIPLIER = 1
+BLUE_MULTIPLIER = 2
+RED_ADDITION = 3
+GREEN_ADDITION = 4
+BLUE_ADDITION = 5
+ALPHA_MULTIPLIER = 6
+
+COLOR_TRANSFORM_SIZE = 7
+
+IDENTITY_COLOR_TRANSFORM = np.array([1, 1, 1, 0, 0, 0, 1], dtype=np.float32)
+
+
+def load_color_transform(reader: Reader) -> np.ndarray:
+    """Reads a color transform tag into a row of the color transform array.
+
+    Multipliers are stored as 0..255 and become 0..1, additions stay 0..255.
+
+    :param reader: reader positioned at the tag data
+    :return: color transform row
+    """
+
+    red_addition = reader.read_uchar()
+    green_addition = reader.read_uchar()
+    blue_addition = reader.read_uchar()
+    alpha_multiplier = reader.read_uchar()
+    red_multiplier = reader.read_uchar()
+    green_multiplier = reader.read_uchar()
+    blue_multiplier = reader.read_uchar()
+
+    return np.array(
+        [
+            red_multiplier / 255,
+            green_multiplier / 255,
+            blue_multiplier / 255,
+            red_addition,
+            green_addition,
+            blue_addition,
+            alpha_multiplier / 255,
+        ],
+        dtype=np.float32,
+    )
+
+
+def apply_color_transform(
+    pixels: np.ndarray, color_transform: np.ndarray
+) -> np.ndarray:
+    """Multiplies and offsets the channels of a premultiplied RGBA array.
+
+    :param pixels: (H, W, 4) premultiplied array in 0..1
+    :param color_transform: color transform row
+    :return: transformed array
+    """
+
+    alpha = pixels[..., 3:] * color_transform[ALPHA_MULTIPLIER]
+
+    colors = pixels[..., :3] * color_transform[RED_MULTIPLIER : BLUE_MULTIPLIER + 1]
+    colors += pixels[..., 3:] * (
+        color_transform[RED_ADDITION : BLUE_ADDITION + 1] / 255
+    )
+    colors *= color_transform[ALPHA_MULTIPLIER]
+
+    return np.concatenate((np.minimum(colors, alpha), alpha), axis=-1)
+
+
+def multiply_color_transforms(outer: np.ndarray, inner: np.ndarray) -> np.ndarray:
+    """Composes color transform rows pairwise.
+
+    Clamping between the two transforms is not kept, which only matters
+    for additions pushing channels past 255 before being multiplied back.
+
+    :param outer: (K, 7) transforms applied last
+    :param inner: (K, 7) transforms applied first
+    :return: (K, 7) composed transforms
+    """
+
+    colors = slice(RED_MULTIPLIER, BLUE_MULTIPLIER + 1)
+    additions = slice(RED_ADDITION, BLUE_ADDITION + 1)
+
+    result = np.empty(np.broadcast_shapes(outer.shape, inner.shape), dtype=np.float32)
+    result[:, colors] = inner[:, colors] * outer[:, colors]
+    result[:, additions] = inner[:, additions] * outer[:, colors] + outer[:, additions]
+    result[:, ALPHA_MULTIPLIER] = (
+        inner[:, ALPHA_MULTIPLIER] * outer[:, ALPHA_MULTIPLIER]
+    )
+    return result
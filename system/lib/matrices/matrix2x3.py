@@ -1,3 +1,5 @@
+import numpy as np
+
 from system.bytestream import Reader
 
 DEFAULT_MULTIPLIER = 1024
@@ -34,3 +36,50 @@ class Matrix2x3:
 
     def apply_y(self, x: float, y: float):
         return y * self.scale_y + x * self.shear_x + self.y
+
+    def multiply(self, matrix: "Matrix2x3") -> "Matrix2x3":
+        """Composes two matrices without changing them.
+
+        :param matrix: matrix applied before this one
+        :return: matrix equal to applying the given matrix, then this one
+        """
+
+        result = Matrix2x3()
+        result.scale_x = self.scale_x * matrix.scale_x + self.shear_y * matrix.shear_x
+        result.shear_y = self.scale_x * matrix.shear_y + self.shear_y * matrix.scale_y
+        result.shear_x = self.shear_x * matrix.scale_x + self.scale_y * matrix.shear_x
+        result.scale_y = self.shear_x * matrix.shear_y + self.scale_y * matrix.scale_y
+        result.x = self.apply_x(matrix.x, matrix.y)
+        result.y = self.apply_y(matrix.x, matrix.y)
+        return result
+
+    def to_tuple(self) -> tuple[float, float, float, float, float, float]:
+        return self.scale_x, self.shear_x, self.shear_y, self.scale_y, self.x, self.y
+
+    def to_array(self) -> np.ndarray:
+        return np.array(
+            [[self.scale_x, self.shear_y, self.x], [self.shear_x, self.scale_y, self.y]]
+        )
+
+    @staticmethod
+    def from_array(matrix_array: np.ndarray) -> "Matrix2x3":
+        (scale_x, shear_y, x), (shear_x, scale_y, y) = matrix_array.tolist()
+
+        matrix = Matrix2x3()
+        matrix.scale_x, matrix.shear_y, matrix.x = scale_x, shear_y, x
+        matrix.shear_x, matrix.scale_y, matrix.y = shear_x, scale_y, y
+        return matrix
+
+
+def multiply_matrices(parents: np.ndarray, children: np.ndarray) -> np.ndarray:
+    """Composes matrices pairwise, the batch version of Matrix2x3.multiply.
+
+    :param parents: (K, 2, 3) matrices applied last
+    :param children: (K, 2, 3) matrices applied first
+    :return: (K, 2, 3) composed matrices
+    """
+
+    result = np.empty(np.broadcast_shapes(parents.shape, children.shape))
+    result[:, :, :2] = parents[:, :, :2] @ children[:, :, :2]
+    result[:, :, 2:] = parents[:, :, :2] @ children[:, :, 2:] + parents[:, :, 2:]
+    return result
@@ -1,25 +1,65 @@
 from typing import List
 
-from system.lib.matrices.color_transform import ColorTransform
+import numpy as np
+
+from system.bytestream import Reader
+from system.lib.matrices.color_transform import (
+    COLOR_TRANSFORM_SIZE,
+    IDENTITY_COLOR_TRANSFORM,
+    load_color_transform,
+)
 from system.lib.matrices.matrix2x3 import Matrix2x3
 
 
 class MatrixBank:
     def __init__(self):
         self.matrices: List[Matrix2x3] = []
-        self.color_transforms: List[ColorTransform] = []
+        self.color_transforms: np.ndarray = np.empty((0, COLOR_TRANSFORM_SIZE))
+
+        self._matrices_array: np.ndarray | None = None
+        self._color_transforms_array: np.ndarray | None = None
 
     def init(self, matrix_count: int, color_transform_count: int):
         self.matrices = []
         for i in range(matrix_count):
             self.matrices.append(Matrix2x3())
 
-        self.color_transforms = []
-        for i in range(color_transform_count):
-            self.color_transforms.append(ColorTransform())
+        self.color_transforms = np.tile(
+            IDENTITY_COLOR_TRANSFORM, (color_transform_count, 1)
+        )
 
     def get_matrix(self, index: int) -> Matrix2x3:
         return self.matrices[index]
 
-    def get_color_transform(self, index: int) -> ColorTransform:
+    def get_matrices_array(self) -> np.ndarray:
+        """Returns all matrices as an (N + 1, 2, 3) array, built on first use.
+
+        The last matrix is identity, so it can be taken by index N where
+        movie clips use 65535 to say there is no matrix.
+        """
+
+        if self._matrices_array is None:
+            matrices_array = np.empty((len(self.matrices) + 1, 2, 3))
+            for matrix_index, matrix in enumerate(self.matrices):
+                matrices_array[matrix_index] = matrix.to_array()
+            matrices_array[-1] = [[1, 0, 0], [0, 1, 0]]
+            self._matrices_array = matrices_array
+        return self._matrices_array
+
+    def get_color_transforms_array(self) -> np.ndarray:
+        """Returns all color transforms as an (N + 1, 7) array, identity last.
+
+        Built on first use, like get_matrices_array.
+        """
+
+        if self._color_transforms_array is None:
+            self._color_transforms_array = np.vstack(
+                (self.color_transforms, IDENTITY_COLOR_TRANSFORM)
+            ).astype(np.float32)
+        return self._color_transforms_array
+
+    def load_color_transform(self, index: int, reader: Reader) -> None:
+        self.color_transforms[index] = load_color_transform(reader)
+
+    def get_color_transform(self, index: int) -> np.ndarray:
         return self.color_transforms[index]
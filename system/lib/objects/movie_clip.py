@@ -1,16 +1,41 @@
 from math import ceil
-from typing import TYPE_CHECKING, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple, TypeAlias
 
+import numpy as np
 from PIL import Image
 
 from system.bytestream import Reader
+from system.lib.blending import (
+    NORMAL,
+    NORMAL_ALTERNATIVE,
+    blend,
+    from_premultiplied,
+    to_premultiplied,
+)
+from system.lib.display_list import (
+    EMPTY_DISPLAY_LIST,
+    DisplayList,
+    concatenate_display_lists,
+    create_display_list,
+    is_identity_color_transform,
+)
 from system.lib.helper import get_size
+from system.lib.matrices.color_transform import (
+    IDENTITY_COLOR_TRANSFORM,
+    apply_color_transform,
+    multiply_color_transforms,
+)
+from system.lib.matrices.matrix2x3 import Matrix2x3, multiply_matrices
 from system.lib.matrices.matrix_bank import MatrixBank
 from system.lib.objects.shape import Shape
+from system.lib.rendering import render_movie_clip, render_shape, transform_sides
 
 if TYPE_CHECKING:
     from system.lib.swf import SupercellSWF
 
+# Premultiplied rendered shapes and their positions
+RenderCache: TypeAlias = Dict[tuple, Tuple[np.ndarray, Tuple[float, float]]]
+
 
 class MovieClipFrame:
     def __init__(self):
@@ -26,6 +51,9 @@ class MovieClipFrame:
     def get_elements_count(self) -> int:
         return self._elements_count
 
+    def get_label(self) -> str | None:
+        return self._label
+
     def set_elements(self, elements: List[Tuple[int, int, int]]) -> None:
         self._elements = elements
 
@@ -50,6 +78,11 @@ class MovieClip:
         self.binds: List[int] = []
         self.matrix_bank_index: int = 0
 
+        self._display_lists: List[DisplayList] | None = None
+        self._sides: Tuple[float, float, float, float] = (0, 0, 0, 0)
+        # Display lists hold no cut cycles, so other movie clips reuse them
+        self._is_acyclic: bool = False
+
     def load(self, swf: "SupercellSWF", tag: int):
         self.id = swf.reader.read_ushort()
 
@@ -109,65 +142,268 @@ class MovieClip:
             else:
                 swf.reader.read(frame_length)
 
-    def render(self, swf: "SupercellSWF", matrix=None) -> Image.Image:
-        matrix_bank = swf.get_matrix_bank(self.matrix_bank_index)
-
-        # TODO: make it faster
-        left, top, right, bottom = self.get_sides(swf)
+    def render(
+        self, swf: "SupercellSWF", matrix: Optional[Matrix2x3] = None
+    ) -> Image.Image:
+        rendered_frame, _ = render_movie_clip(swf, self, matrix)
+        return rendered_frame
+
+    def render_frame(
+        self,
+        swf: "SupercellSWF",
+        frame_index: int,
+        sides: Tuple[float, float, float, float],
+        cache: RenderCache | None = None,
+        matrix: Optional[Matrix2x3] = None,
+    ) -> Image.Image:
+        """Renders one frame of the timeline on a canvas of the given sides.
+
+        Shapes are drawn straight from the flattened display list of the
+        frame, nested movie clips are not rendered separately.
+
+        :param swf: file the movie clip belongs to
+        :param frame_index: index of the frame to render
+        :param sides: canvas sides, usually the sides of the whole timeline
+        :param cache: rendered shapes by shape id and world matrix, shared
+            between frames
+        :param matrix: world matrix of the movie clip, identity if None
+        :return: rendered frame
+        """
+
+        if cache is None:
+            cache = {}
+
+        left, top, right, bottom = sides
 
         width, height = get_size(left, top, right, bottom)
-        size = ceil(width), ceil(height)
-        image = Image.new("RGBA", size)
-
-        frame = self.frames[0]
-        for child_index, matrix_index, _ in frame.get_elements():
-            if matrix_index != 65535:
-                matrix = matrix_bank.get_matrix(matrix_index)
-            else:
-                matrix = None
-
-            display_object = swf.get_display_object(self.binds[child_index])
-            if isinstance(display_object, Shape):
-                rendered_shape = display_object.render(matrix)
-
-                # TODO: fix position
-                position = display_object.get_position()
-                x = int(abs(left) + position[0])
-                y = int(abs(top) + position[1])
-
-                image.paste(rendered_shape, (x, y), rendered_shape)
-
-        return image
+        canvas = np.zeros((ceil(height), ceil(width), 4), dtype=np.float32)
+
+        display_list = self.get_display_list(swf, frame_index).transform(matrix)
+        for shape_id, shape_matrix, color_transform, blend_mode in zip(
+            display_list.shape_ids.tolist(),
+            display_list.matrices,
+            display_list.color_transforms,
+            display_list.blends.tolist(),
+        ):
+            key = shape_id, tuple(shape_matrix.ravel().tolist())
+            if key not in cache:
+                shape = swf.get_display_object(shape_id)
+                rendered_shape, (shape_left, shape_top, _, _) = render_shape(
+                    shape, Matrix2x3.from_array(shape_matrix)  # type: ignore
+                )
+                cache[key] = to_premultiplied(rendered_shape), (shape_left, shape_top)
+
+            shape_pixels, (shape_left, shape_top) = cache[key]
+            if not is_identity_color_transform(color_transform):
+                shape_pixels = apply_color_transform(shape_pixels, color_transform)
+
+            blend(
+                canvas,
+                shape_pixels,
+                int(shape_left - left),
+                int(shape_top - top),
+                blend_mode,
+            )
+
+        return from_premultiplied(canvas)
+
+    def get_display_list(self, swf: "SupercellSWF", frame_index: int) -> DisplayList:
+        """Returns shapes of the frame with matrices relative to this movie clip.
+
+        :param swf: file the movie clip belongs to
+        :param frame_index: index of the frame
+        :return: flattened display list
+        """
+
+        return self._get_display_lists(swf)[frame_index]
+
+    def get_sides(
+        self, swf: "SupercellSWF", matrix: Optional[Matrix2x3] = None
+    ) -> Tuple[float, float, float, float]:
+        """Returns sides of the whole timeline, nested movie clips included.
+
+        :param swf: file the movie clip belongs to
+        :param matrix: world matrix of the movie clip, identity if None
+        :return: left, top, right, bottom
+        """
+
+        self._get_display_lists(swf)
+        return transform_sides(self._sides, matrix)
+
+    def _get_display_lists(self, swf: "SupercellSWF") -> List[DisplayList]:
+        """Flattens every frame once, then reuses the display lists.
+
+        Display lists of child movie clips are taken at the frame index
+        wrapped to their own timeline length. Matrices and color transforms
+        of all rows of the timeline are composed in one batch, and the
+        timeline sides are computed along the way.
+
+        Display lists are stored only once complete, so threads rendering
+        the same movie clip at once build them on their own instead of
+        seeing a half-built timeline.
+
+        :return: display list for every frame
+        """
+
+        if self._display_lists is None:
+            cut_ids: Set[int] = set()
+            display_lists, sides = self._build_display_lists(swf, {self.id}, cut_ids)
+            self._sides = sides
+            self._is_acyclic = not cut_ids
+            self._display_lists = display_lists
+        return self._display_lists
+
+    def _get_nested_display_lists(
+        self, swf: "SupercellSWF", visiting: Set[int], cut_ids: Set[int]
+    ) -> List[DisplayList]:
+        """Returns display lists of the movie clip inside another one.
+
+        Movie clips containing themselves are empty inside themselves. Lists
+        with such a cut cycle depend on the movie clips up the stack, so they
+        are stored only if no cycle was cut anywhere while building them.
+
+        :param visiting: ids of movie clips being flattened up the stack
+        :param cut_ids: ids of movie clips cut as cycles, filled in
+        :return: display list for every frame
+        """
+
+        if self.id in visiting:
+            cut_ids.add(self.id)
+            return [EMPTY_DISPLAY_LIST] * len(self.frames)
+
+        if self._display_lists is not None and self._is_acyclic:
+            return self._display_lists
+
+        subtree_cut_ids: Set[int] = set()
+        visiting.add(self.id)
+        try:
+            display_lists, sides = self._build_display_lists(
+                swf, visiting, subtree_cut_ids
+            )
+        finally:
+            visiting.remove(self.id)
+
+        if subtree_cut_ids:
+            cut_ids |= subtree_cut_ids
+        elif self._display_lists is None:
+            self._sides = sides
+            self._is_acyclic = True
+            self._display_lists = display_lists
+        return display_lists
+
+    def _build_display_lists(
+        self, swf: "SupercellSWF", visiting: Set[int], cut_ids: Set[int]
+    ) -> Tuple[List[DisplayList], Tuple[float, float, float, float]]:
 
-    def get_sides(self, swf: "SupercellSWF") -> Tuple[float, float, float, float]:
         matrix_bank: MatrixBank = swf.get_matrix_bank(self.matrix_bank_index)
-
-        left = 0
-        top = 0
-        right = 0
-        bottom = 0
-
-        for frame in self.frames:
-            for child_index, matrix_index, _ in frame.get_elements():
-                if matrix_index != 65535:
-                    matrix = matrix_bank.get_matrix(matrix_index)
-                else:
-                    matrix = None
-
-                display_object = swf.get_display_object(self.binds[child_index])
-                if isinstance(display_object, Shape):
-                    display_object.apply_matrix(matrix)
-
-                    (
-                        shape_left,
-                        shape_top,
-                        shape_right,
-                        shape_bottom,
-                    ) = display_object.get_sides()
-
-                    left = min(left, shape_left)
-                    top = min(top, shape_top)
-                    right = max(right, shape_right)
-                    bottom = max(bottom, shape_bottom)
-
-        return left, top, right, bottom
+        matrices = matrix_bank.get_matrices_array()
+        color_transforms = matrix_bank.get_color_transforms_array()
+
+        shape_lists: Dict[int, DisplayList] = {}
+        children_lists: List[DisplayList] = []
+        matrix_indices: List[int] = []
+        color_transform_indices: List[int] = []
+        bind_blends: List[int] = []
+        frames_rows_count: List[int] = []
+        for frame_index, frame in enumerate(self.frames):
+            frame_rows_count = 0
+            for (
+                child_index,
+                matrix_index,
+                color_transform_index,
+            ) in frame.get_elements():
+                child_list = self._get_child_display_list(
+                    swf, child_index, frame_index, shape_lists, visiting, cut_ids
+                )
+                if child_list is None or len(child_list) == 0:
+                    continue
+
+                if matrix_index == 65535:
+                    matrix_index = len(matrices) - 1
+                if color_transform_index == 65535:
+                    color_transform_index = len(color_transforms) - 1
+
+                children_lists.append(child_list)
+                matrix_indices.extend([matrix_index] * len(child_list))
+                color_transform_indices.extend(
+                    [color_transform_index] * len(child_list)
+                )
+                bind_blends.extend(
+                    [self.blends[child_index] if self.blends else NORMAL]
+                    * len(child_list)
+                )
+                frame_rows_count += len(child_list)
+            frames_rows_count.append(frame_rows_count)
+
+        rows = concatenate_display_lists(children_lists)
+        rows_blends = np.array(bind_blends, dtype=np.uint8)
+        rows = DisplayList(
+            rows.shape_ids,
+            multiply_matrices(matrices[matrix_indices], rows.matrices),
+            multiply_color_transforms(
+                color_transforms[color_transform_indices], rows.color_transforms
+            ),
+            np.where(rows.blends > NORMAL_ALTERNATIVE, rows.blends, rows_blends).astype(
+                np.uint8
+            ),
+            rows.local_sides,
+        )
+        rows_sides = rows.get_sides_array()
+
+        display_lists = []
+        row_offset = 0
+        for frame_rows_count in frames_rows_count:
+            frame_rows = slice(row_offset, row_offset + frame_rows_count)
+            row_offset = frame_rows.stop
+
+            display_lists.append(
+                DisplayList(
+                    rows.shape_ids[frame_rows],
+                    rows.matrices[frame_rows],
+                    rows.color_transforms[frame_rows],
+                    rows.blends[frame_rows],
+                    rows.local_sides[frame_rows],
+                )
+            )
+
+        return display_lists, _get_union_sides(rows_sides) or (0, 0, 0, 0)
+
+    def _get_child_display_list(
+        self,
+        swf: "SupercellSWF",
+        child_index: int,
+        frame_index: int,
+        shape_lists: Dict[int, DisplayList],
+        visiting: Set[int],
+        cut_ids: Set[int],
+    ) -> DisplayList | None:
+        display_object = swf.get_display_object(self.binds[child_index])
+        if isinstance(display_object, MovieClip):
+            if not display_object.frames:
+                return None
+            child_lists = display_object._get_nested_display_lists(
+                swf, visiting, cut_ids
+            )
+            return child_lists[frame_index % len(display_object.frames)]
+
+        if not isinstance(display_object, Shape):
+            return None
+
+        if display_object.id not in shape_lists:
+            shape_lists[display_object.id] = create_display_list(
+                [display_object.id],
+                np.array([[1, 0, 0], [0, 1, 0]], dtype=float),
+                IDENTITY_COLOR_TRANSFORM,
+                [NORMAL],
+                [display_object.get_local_sides()],
+            )
+        return shape_lists[display_object.id]
+
+
+def _get_union_sides(sides: np.ndarray) -> Tuple[float, float, float, float] | None:
+    if len(sides) == 0:
+        return None
+
+    left, top = sides[:, :2].min(axis=0).tolist()
+    right, bottom = sides[:, 2:].max(axis=0).tolist()
+    return left, top, right, bottom
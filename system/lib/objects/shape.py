@@ -1,12 +1,20 @@
 from math import atan2, ceil, degrees
 from typing import TYPE_CHECKING, List, Optional, Tuple
 
+import numpy as np
 from PIL import Image, ImageDraw
 
 from system.lib.helper import get_sides, get_size
 from system.lib.matrices.matrix2x3 import Matrix2x3
 from system.lib.objects.point import Point
 from system.lib.objects.texture import SWFTexture
+from system.lib.rendering import (
+    get_points_array_sides,
+    get_region_sides,
+    get_shape_sides,
+    render_region_image,
+    render_shape,
+)
 
 if TYPE_CHECKING:
     from system.lib.swf import SupercellSWF
@@ -17,6 +25,9 @@ class Shape:
         self.id = 0
         self.regions: List[Region] = []
 
+        self._xy_array: np.ndarray = np.empty((0, 2))
+        self._sides: Tuple[float, float, float, float] = (0, 0, 0, 0)
+
     def load(self, swf: "SupercellSWF", tag: int):
         self.id = swf.reader.read_ushort()
 
@@ -29,7 +40,7 @@ class Shape:
             region_length = swf.reader.read_uint()
 
             if region_tag == 0:
-                return
+                break
             elif region_tag in (4, 17, 22):
                 region = Region()
                 region.load(swf, region_tag)
@@ -37,58 +48,30 @@ class Shape:
             else:
                 swf.reader.read(region_length)
 
-    def render(self, matrix=None):
-        for region in self.regions:
-            region.apply_matrix(matrix)
-
-        shape_left, shape_top, shape_right, shape_bottom = self.get_sides()
-
-        width, height = get_size(shape_left, shape_top, shape_right, shape_bottom)
-        size = ceil(width), ceil(height)
-
-        image = Image.new("RGBA", size)
-
-        index = 0
-        for region in self.regions:
-            index += 1
-            rendered_region = region.render()
-
-            region_left, region_top = region.get_position()
-
-            x = int(abs(shape_left) + region_left)
-            y = int(abs(shape_top) + region_top)
-
-            image.paste(rendered_region, (x, y), rendered_region)
-
-        # image.save("{0}.image.png".format(index))
-        return image
-
-    def apply_matrix(self, matrix: Optional[Matrix2x3] = None) -> None:
-        """Calls apply_matrix method for all regions.
-
-        :param matrix: Affine matrix
-        """
+        if self.regions:
+            self._xy_array = np.concatenate(
+                [region.get_xy_array() for region in self.regions]
+            )
+        self._sides = get_points_array_sides(self._xy_array)
 
-        for region in self.regions:
-            region.apply_matrix(matrix)
+    def render(self, matrix: Optional[Matrix2x3] = None) -> Image.Image:
+        rendered_shape, _ = render_shape(self, matrix)
+        return rendered_shape
 
-    def get_position(self) -> Tuple[float, float]:
-        left, top, _, _ = self.get_sides()
+    def get_position(self, matrix: Optional[Matrix2x3] = None) -> Tuple[float, float]:
+        left, top, _, _ = self.get_sides(matrix)
         return left, top
 
-    def get_sides(self) -> Tuple[float, float, float, float]:
-        left = 0
-        top = 0
-        right = 0
-        bottom = 0
-        for region in self.regions:
-            region_left, region_top, region_right, region_bottom = region.get_sides()
-            left = min(left, region_left)
-            right = max(right, region_right)
-            top = min(top, region_top)
-            bottom = max(bottom, region_bottom)
+    def get_sides(
+        self, matrix: Optional[Matrix2x3] = None
+    ) -> Tuple[float, float, float, float]:
+        return get_shape_sides(self, matrix)
+
+    def get_local_sides(self) -> Tuple[float, float, float, float]:
+        return self._sides
 
-        return left, top, right, bottom
+    def get_xy_array(self) -> np.ndarray:
+        return self._xy_array
 
 
 class Region:
@@ -100,10 +83,19 @@ class Region:
         self._points_count = 0
         self._xy_points: List[Point] = []
         self._uv_points: List[Point] = []
-        self._transformed_points: List[Point] = []
+
+        self._xy_array: np.ndarray = np.empty((0, 2))
+        self._sides: Tuple[float, float, float, float] = (0, 0, 0, 0)
 
         self.texture: SWFTexture
 
+    def __getstate__(self) -> dict:
+        # Textures are too big to be pickled along with every region,
+        # receivers attach them again by texture_index
+        state = self.__dict__.copy()
+        state.pop("texture", None)
+        return state
+
     def load(self, swf: "SupercellSWF", tag: int):
         self.texture_index = swf.reader.read_uchar()
 
@@ -140,35 +132,13 @@ class Region:
 
             self._uv_points[i].position = (u_rounded, v_rounded)
 
-
-    def render(self, use_original_size: bool = False) -> Image.Image:
-        self.apply_matrix(None)
-
-        left, top, right, bottom = self.get_sides()
-        width, height = get_size(left, top, right, bottom)
-        width, height = max(width, 1), max(height, 1)
+        self._xy_array = np.array(self.get_xy_points(), dtype=float).reshape(-1, 2)
+        self._sides = get_points_array_sides(self._xy_array)
 
         self.rotation, self.is_mirrored = self.calculate_rotation(True)
 
-        rendered_region = self.get_image()
-        if sum(rendered_region.size) == 2:
-            fill_color = rendered_region.getpixel((0, 0))
-
-            # noinspection PyTypeChecker
-            rendered_polygon = Image.new(rendered_region.mode, (width, height))
-            drawable_image = ImageDraw.Draw(rendered_polygon)
-            drawable_image.polygon(
-                [(point.x - left, point.y - top) for point in self._transformed_points],
-                fill=fill_color,
-            )
-            return rendered_polygon
-
-        rendered_region = rendered_region.rotate(-self.rotation, expand=True)
-        if self.is_mirrored:
-            rendered_region = rendered_region.transpose(Image.FLIP_LEFT_RIGHT)
-        if use_original_size:
-            return rendered_region
-        return rendered_region.resize((width, height), Image.ANTIALIAS)
+    def render(self, use_original_size: bool = False) -> Image.Image:
+        return render_region_image(self, use_original_size)
 
     def get_image(self) -> Image.Image:
         left, top, right, bottom = get_sides(self._uv_points)
@@ -189,16 +159,17 @@ class Region:
 
         bbox = int(left), int(top), int(right), int(bottom)
 
+        # The mask covers only the bbox, not the whole texture
+        mask_left, mask_top, mask_right, mask_bottom = bbox
         color = 255
-        img_mask = Image.new("L", (self.texture.width, self.texture.height), 0)
+        img_mask = Image.new("L", (mask_right - mask_left, mask_bottom - mask_top), 0)
         ImageDraw.Draw(img_mask).polygon(
-            [point.position for point in self._uv_points], fill=color
+            [(point.x - mask_left, point.y - mask_top) for point in self._uv_points],
+            fill=color,
         )
 
         rendered_region = Image.new("RGBA", (width, height))
-        rendered_region.paste(
-            self.texture.image.crop(bbox), (0, 0), img_mask.crop(bbox)
-        )
+        rendered_region.paste(self.texture.get_region_image(bbox), (0, 0), img_mask)
 
         return rendered_region
 
@@ -223,30 +194,23 @@ class Region:
     def get_y(self, index: int):
         return self._xy_points[index].y
 
-    def get_position(self) -> Tuple[float, float]:
-        left, top, _, _ = get_sides(self._transformed_points)
-        return left, top
+    def get_xy_points(self) -> List[Tuple[float, float]]:
+        return [point.position for point in self._xy_points]
 
-    def get_sides(self) -> Tuple[float, float, float, float]:
-        return get_sides(self._transformed_points)
+    def get_position(self, matrix: Optional[Matrix2x3] = None) -> Tuple[float, float]:
+        left, top, _, _ = self.get_sides(matrix)
+        return left, top
 
-    def apply_matrix(self, matrix: Optional[Matrix2x3] = None) -> None:
-        """Applies affine matrix to shape (xy) points.
-        If matrix is none, copies the points.
+    def get_sides(
+        self, matrix: Optional[Matrix2x3] = None
+    ) -> Tuple[float, float, float, float]:
+        return get_region_sides(self, matrix)
 
-        :param matrix:  Affine matrix
-        """
+    def get_local_sides(self) -> Tuple[float, float, float, float]:
+        return self._sides
 
-        self._transformed_points = self._xy_points
-        if matrix is not None:
-            self._transformed_points = []
-            for point in self._xy_points:
-                self._transformed_points.append(
-                    Point(
-                        matrix.apply_x(point.x, point.y),
-                        matrix.apply_y(point.x, point.y),
-                    )
-                )
+    def get_xy_array(self) -> np.ndarray:
+        return self._xy_array
 
     def calculate_rotation(
         self,
@@ -1,17 +1,11 @@
 import os
-import struct
-import liblzfse
-from texture2ddecoder import decode_astc
-from system.bytestream import Reader, Writer
+from typing import Tuple
 
 from PIL import Image
 
-from system.lib.images import (
-    get_format_by_pixel_type,
-    join_image,
-    load_image_from_buffer,
-    load_texture,
-)
+from ktx import load_ktx, load_ktx_region
+from system.bytestream import Reader
+from system.lib.images import decode_texture_region, get_byte_count_by_pixel_type
 
 
 class SWFTexture:
@@ -19,11 +13,44 @@ class SWFTexture:
         self.width = 0
         self.height = 0
 
+        self.file_type = 0
         self.pixel_type = -1
 
-        self.image: Image.Image
+        self._image: Image.Image | None = None
+
+        # Undecoded texture data, views of the file buffer
+        self._pixel_data: memoryview | None = None
+        self._ktx_data: memoryview | None = None
+        self._is_tiled = False
+
+        # Whole tag of KTX textures, written back as it is if unchanged
+        self.tag_data: memoryview | None = None
+
+    @property
+    def image(self) -> Image.Image:
+        """The whole texture, decoded on first use."""
+
+        if self._image is None:
+            if self._ktx_data is not None:
+                self._image = load_ktx(bytes(self._ktx_data))
+            elif self._pixel_data is not None:
+                self._image = decode_texture_region(
+                    self._pixel_data,
+                    self.pixel_type,
+                    (self.width, self.height),
+                    (0, 0, self.width, self.height),
+                    self._is_tiled,
+                )
+            else:
+                raise AttributeError("Texture has no image data")
+        return self._image
+
+    @image.setter
+    def image(self, image: Image.Image) -> None:
+        self._image = image
 
     def load(self, swf, tag: int, has_texture: bool):
+        self.file_type = tag
         self.pixel_type = swf.reader.read_char()
         self.width, self.height = (
             swf.reader.read_ushort(),
@@ -31,71 +58,60 @@ class SWFTexture:
         )
 
         if has_texture:
-            img = Image.new(
-                get_format_by_pixel_type(self.pixel_type), (self.width, self.height)
+            self._is_tiled = tag in (27, 28, 29)
+            self._pixel_data = _read_data_view(
+                swf.reader,
+                self.width
+                * self.height
+                * get_byte_count_by_pixel_type(self.pixel_type),
             )
 
-            load_texture(swf.reader, self.pixel_type, img)
+    def load_ktx(self, swf, ktx_size: int):
+        self.file_type = 45
+        self.pixel_type = swf.reader.read_char()
+        self.width, self.height = (
+            swf.reader.read_ushort(),
+            swf.reader.read_ushort(),
+        )
 
-            if tag in (27, 28, 29):
-                join_image(img)
-            else:
-                load_image_from_buffer(img)
+        self._ktx_data = _read_data_view(swf.reader, ktx_size)
 
-            os.remove("pixel_buffer")
+    def get_region_image(self, bbox: Tuple[int, int, int, int]) -> Image.Image:
+        """Returns the texture part inside the bbox, like Image.crop.
 
-            self.image = img
+        If the whole texture is not decoded yet, only the pixel rows,
+        32x32 chunks or ASTC blocks covering the bbox are decoded.
 
-    def read_ktx(reader: Reader):
-        data = reader.read(64)
-        print("[*] load_ktx")
-        header = data[:64]
-        ktx_data = data[64:]
+        :param bbox: left, top, right, bottom
+        :return: image of the bbox size, transparent outside the texture
+        """
 
-        if header[12:16] == bytes.fromhex("01020304"):
-            endianness = "<"
+        if self._image is not None or (
+            self._ktx_data is None and self._pixel_data is None
+        ):
+            return self.image.crop(bbox)
 
+        if self._ktx_data is not None:
+            region_image = load_ktx_region(self._ktx_data, bbox)
         else:
-            endianness = ">"
-
-        if header[0:7] != b"\xabKTX 11":
-            raise TypeError(
-                "Unsupported or unknown KTX version: {}".format(header[0:7])
+            region_image = decode_texture_region(
+                self._pixel_data,  # type: ignore
+                self.pixel_type,
+                (self.width, self.height),
+                bbox,
+                self._is_tiled,
             )
 
-        (glInternalFormat,) = struct.unpack(endianness + "I", header[28:32])
-        pixelWidth, pixelHeight = struct.unpack(endianness + "2I", header[36:44])
-        (bytesOfKeyValueData,) = struct.unpack(endianness + "I", header[60:64])
+        left, top, right, bottom = bbox
+        if region_image.size == (right - left, bottom - top):
+            return region_image
 
-        if glInternalFormat not in (0x93B0, 0x93B4, 0x93B7):
-            raise TypeError(
-                "Unsupported texture format: {}".format(hex(glInternalFormat))
-            )
+        image = Image.new(region_image.mode, (right - left, bottom - top))
+        image.paste(region_image, (max(-left, 0), max(-top, 0)))
+        return image
 
-        if glInternalFormat == 0x93B0:
-            block_width, block_height = 4, 4
-
-        elif glInternalFormat == 0x93B4:
-            block_width, block_height = 6, 6
-
-        else:
-            block_width, block_height = 8, 8
-
-        ktx_data = reader.read(bytesOfKeyValueData)
-        image_data = ktx_data[4:]
-
-        decoded_data = decode_astc(
-            image_data, pixelWidth, pixelHeight, block_width, block_height
-        )
-        return (
-            Image.frombytes(
-                "RGBA", (pixelWidth, pixelHeight), decoded_data, "raw", ("BGRA")
-            ),
-            bytesOfKeyValueData + 64,
-        )
-
-    def load_ktx(self, swf, tag: int, has_texture: bool):
-        if has_texture:
-            img = self.read_ktx(swf.reader)
 
-            self.image = img
+def _read_data_view(reader: Reader, length: int) -> memoryview:
+    position = reader.tell()
+    reader.seek(length, os.SEEK_CUR)
+    return reader.getbuffer()[position : position + length]
@@ -0,0 +1,125 @@
+import io
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import List, Set, Tuple
+
+from system.lib.config import config
+
+ZIP = "zip"
+TAR = "tar"
+
+
+class OutputSink:
+    """Destination of output files, safe to write from several threads.
+
+    Paths are given as if files were written to disk, so a sink can keep
+    the directory layout under its own root.
+    """
+
+    def write(self, path: Path | str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "OutputSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class FolderSink(OutputSink):
+    """Writes loose files, creating their folders on first use."""
+
+    def __init__(self):
+        self._created_folders: Set[str] = set()
+
+    def write(self, path: Path | str, data: bytes) -> None:
+        folder = os.path.dirname(path)
+        if folder not in self._created_folders:
+            os.makedirs(folder or ".", exist_ok=True)
+            self._created_folders.add(folder)
+
+        with open(path, "wb") as file:
+            file.write(data)
+
+
+class MemorySink(OutputSink):
+    """Keeps written files in memory, to be passed to another sink."""
+
+    def __init__(self):
+        self.entries: List[Tuple[str, bytes]] = []
+        self._lock = threading.Lock()
+
+    def write(self, path: Path | str, data: bytes) -> None:
+        with self._lock:
+            self.entries.append((str(path), data))
+
+
+class ZipSink(OutputSink):
+    """Stores files uncompressed in a zip archive.
+
+    Stored entries can be read back one by one with zipfile, without
+    extracting the archive.
+    """
+
+    def __init__(self, archive_path: Path, root: Path):
+        self._root = root
+        self._archive = zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED)
+        self._lock = threading.Lock()
+
+    def write(self, path: Path | str, data: bytes) -> None:
+        with self._lock:
+            self._archive.writestr(_get_entry_name(path, self._root), data)
+
+    def close(self) -> None:
+        self._archive.close()
+
+
+class TarSink(OutputSink):
+    """Stores files in an uncompressed tar archive.
+
+    Entries keep their data offsets in the archive, so single entries
+    can be read with tarfile without extracting the archive.
+    """
+
+    def __init__(self, archive_path: Path, root: Path):
+        self._root = root
+        self._archive = tarfile.open(archive_path, "w")
+        self._lock = threading.Lock()
+
+    def write(self, path: Path | str, data: bytes) -> None:
+        entry_info = tarfile.TarInfo(_get_entry_name(path, self._root))
+        entry_info.size = len(data)
+        entry_info.mtime = int(time.time())
+
+        with self._lock:
+            self._archive.addfile(entry_info, io.BytesIO(data))
+
+    def close(self) -> None:
+        self._archive.close()
+
+
+def open_output_sink(output_folder: Path) -> OutputSink:
+    """Opens the configured sink for all output of a run.
+
+    Archives are created next to the output folder, named after it.
+
+    :param output_folder: folder the output would be written to
+    :return: output sink
+    """
+
+    if config.output_archive == ZIP:
+        return ZipSink(Path(f"{output_folder}.zip"), output_folder)
+    if config.output_archive == TAR:
+        return TarSink(Path(f"{output_folder}.tar"), output_folder)
+    return FolderSink()
+
+
+def _get_entry_name(path: Path | str, root: Path) -> str:
+    return Path(os.path.relpath(path, root)).as_posix()
@@ -1,11 +1,15 @@
 import struct
 from typing import Callable, TypeAlias
 
+import numpy as np
+
 from system.bytestream import Reader
 
 PixelChannels: TypeAlias = tuple[int, ...]
 WriteFunction: TypeAlias = Callable[[PixelChannels], bytes]
 ReadFunction: TypeAlias = Callable[[Reader], PixelChannels]
+# Takes (N, byte count) raw pixels, returns (N, channel count) channels
+DecodeFunction: TypeAlias = Callable[[np.ndarray], np.ndarray]
 
 
 def get_read_function(pixel_type: int) -> ReadFunction | None:
@@ -20,6 +24,12 @@ def get_write_function(pixel_type: int) -> WriteFunction | None:
     return None
 
 
+def get_decode_function(pixel_type: int) -> DecodeFunction | None:
+    if pixel_type in _decode_functions:
+        return _decode_functions[pixel_type]
+    return None
+
+
 def get_channel_count_by_pixel_type(pixel_type: int) -> int:
     if pixel_type == 4:
         return 3
@@ -99,6 +109,52 @@ def _write_luminance8(pixel: PixelChannels) -> bytes:
     return struct.pack("B", pixel)
 
 
+def _to_ushort(pixels: np.ndarray) -> np.ndarray:
+    return pixels[:, 0].astype(np.uint16) | pixels[:, 1].astype(np.uint16) << 8
+
+
+def _decode_rgba8(pixels: np.ndarray) -> np.ndarray:
+    return pixels
+
+
+def _decode_rgba4(pixels: np.ndarray) -> np.ndarray:
+    p = _to_ushort(pixels)
+    return (
+        np.stack((p >> 12 & 15, p >> 8 & 15, p >> 4 & 15, p & 15), axis=-1).astype(
+            np.uint8
+        )
+        << 4
+    )
+
+
+def _decode_rgb5a1(pixels: np.ndarray) -> np.ndarray:
+    p = _to_ushort(pixels)
+    return np.stack(
+        (
+            (p >> 11 & 31) << 3,
+            (p >> 6 & 31) << 3,
+            (p >> 1 & 31) << 3,
+            (p & 1) * 255,
+        ),
+        axis=-1,
+    ).astype(np.uint8)
+
+
+def _decode_rgb565(pixels: np.ndarray) -> np.ndarray:
+    p = _to_ushort(pixels)
+    return np.stack(
+        ((p >> 11 & 31) << 3, (p >> 5 & 63) << 2, (p & 31) << 3), axis=-1
+    ).astype(np.uint8)
+
+
+def _decode_luminance8_alpha8(pixels: np.ndarray) -> np.ndarray:
+    return pixels[:, ::-1]
+
+
+def _decode_luminance8(pixels: np.ndarray) -> np.ndarray:
+    return pixels
+
+
 _write_functions: dict[int, WriteFunction] = {
     0: _write_rgba8,
     1: _write_rgba8,
@@ -118,3 +174,13 @@ _read_functions: dict[int, ReadFunction] = {
     6: _read_luminance8_alpha8,
     10: _read_luminance8,
 }
+
+_decode_functions: dict[int, DecodeFunction] = {
+    0: _decode_rgba8,
+    1: _decode_rgba8,
+    2: _decode_rgba4,
+    3: _decode_rgb5a1,
+    4: _decode_rgb565,
+    6: _decode_luminance8_alpha8,
+    10: _decode_luminance8,
+}
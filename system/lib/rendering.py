@@ -0,0 +1,254 @@
+from math import ceil
+from typing import TYPE_CHECKING, Optional, Tuple, TypeAlias
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from system.lib.helper import get_size
+from system.lib.matrices.matrix2x3 import Matrix2x3
+
+if TYPE_CHECKING:
+    from system.lib.objects.movie_clip import MovieClip, RenderCache
+    from system.lib.objects.shape import Region, Shape
+    from system.lib.swf import SupercellSWF
+
+Sides: TypeAlias = Tuple[float, float, float, float]
+
+# Nothing in this module changes the objects it gets, so one loaded
+# SupercellSWF can be rendered from several threads at once.
+
+
+def transform_sides(sides: Sides, matrix: Optional[Matrix2x3] = None) -> Sides:
+    """Returns sides of the rect corners transformed by the matrix.
+
+    :param sides: left, top, right, bottom
+    :param matrix: affine matrix
+    :return: left, top, right, bottom
+    """
+
+    if matrix is None:
+        return sides
+
+    (transformed_sides,) = transform_sides_array(
+        np.array([sides], dtype=float), matrix.to_array()[np.newaxis]
+    )
+    return tuple(transformed_sides.tolist())  # type: ignore
+
+
+def transform_sides_array(sides: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """Transforms many rects at once, each by its own matrix.
+
+    :param sides: (K, 4) array of left, top, right, bottom
+    :param matrices: (K, 2, 3) array of affine matrices
+    :return: (K, 4) array of sides of the transformed rect corners
+    """
+
+    left, top, right, bottom = sides.T
+    corners = np.stack(
+        (
+            np.stack((left, top), axis=-1),
+            np.stack((right, top), axis=-1),
+            np.stack((right, bottom), axis=-1),
+            np.stack((left, bottom), axis=-1),
+        ),
+        axis=1,
+    )
+
+    transformed = np.einsum("kij,kcj->kci", matrices[:, :, :2], corners)
+    transformed += matrices[:, np.newaxis, :, 2]
+
+    return np.concatenate((transformed.min(axis=1), transformed.max(axis=1)), axis=1)
+
+
+def get_region_sides(region: "Region", matrix: Optional[Matrix2x3] = None) -> Sides:
+    if matrix is None:
+        return region.get_local_sides()
+
+    return _get_array_sides(region.get_xy_array(), matrix)
+
+
+def get_shape_sides(shape: "Shape", matrix: Optional[Matrix2x3] = None) -> Sides:
+    """Calculates sides of all shape regions transformed by the matrix.
+
+    :param shape: shape to measure
+    :param matrix: affine matrix
+    :return: left, top, right, bottom
+    """
+
+    if matrix is None:
+        return shape.get_local_sides()
+
+    return _get_array_sides(shape.get_xy_array(), matrix)
+
+
+def get_points_array_sides(points: np.ndarray) -> Sides:
+    """Calculates sides of an (N, 2) points array, zeros if it is empty.
+
+    :param points: polygon points
+    :return: left, top, right, bottom
+    """
+
+    if len(points) == 0:
+        return 0, 0, 0, 0
+
+    left, top = points.min(axis=0).tolist()
+    right, bottom = points.max(axis=0).tolist()
+    return left, top, right, bottom
+
+
+def _get_array_sides(points: np.ndarray, matrix: Matrix2x3) -> Sides:
+    matrix_array = matrix.to_array()
+    return get_points_array_sides(points @ matrix_array[:, :2].T + matrix_array[:, 2])
+
+
+def render_region_image(
+    region: "Region", use_original_size: bool = False
+) -> Image.Image:
+    """Renders region in its own coordinates, without any matrix.
+
+    :param region: region to render
+    :param use_original_size: keep texture resolution instead of resizing
+        the sprite to the region xy size
+    :return: rendered region
+    """
+
+    left, top, right, bottom = region.get_local_sides()
+    width, height = get_size(left, top, right, bottom)
+    width, height = max(width, 1), max(height, 1)
+
+    rendered_region = region.get_image()
+    if sum(rendered_region.size) == 2:
+        fill_color = rendered_region.getpixel((0, 0))
+
+        # noinspection PyTypeChecker
+        rendered_polygon = Image.new(rendered_region.mode, (width, height))
+        drawable_image = ImageDraw.Draw(rendered_polygon)
+        drawable_image.polygon(
+            [(x - left, y - top) for x, y in region.get_xy_points()],
+            fill=fill_color,
+        )
+        return rendered_polygon
+
+    rendered_region = rendered_region.rotate(-region.rotation, expand=True)
+    if region.is_mirrored:
+        rendered_region = rendered_region.transpose(Image.FLIP_LEFT_RIGHT)
+    if use_original_size:
+        return rendered_region
+    return rendered_region.resize((width, height), Image.ANTIALIAS)
+
+
+def render_region(
+    region: "Region", matrix: Optional[Matrix2x3] = None
+) -> Tuple[Image.Image, Sides]:
+    """Renders region transformed by the matrix.
+
+    :param region: region to render
+    :param matrix: affine matrix
+    :return: rendered region, its left, top, right, bottom
+    """
+
+    local_sides = region.get_local_sides()
+    rendered_region = render_region_image(region)
+    if matrix is None:
+        return rendered_region, local_sides
+
+    sides = get_region_sides(region, matrix)
+    return transform_image(rendered_region, local_sides, sides, matrix), sides
+
+
+def render_shape(
+    shape: "Shape", matrix: Optional[Matrix2x3] = None
+) -> Tuple[Image.Image, Sides]:
+    """Renders all shape regions transformed by the matrix.
+
+    :param shape: shape to render
+    :param matrix: affine matrix
+    :return: rendered shape, its left, top, right, bottom
+    """
+
+    sides = get_shape_sides(shape, matrix)
+    shape_left, shape_top, shape_right, shape_bottom = sides
+
+    width, height = get_size(shape_left, shape_top, shape_right, shape_bottom)
+    image = Image.new("RGBA", (max(ceil(width), 1), max(ceil(height), 1)))
+
+    for region in shape.regions:
+        rendered_region, (region_left, region_top, _, _) = render_region(region, matrix)
+
+        x = int(region_left - shape_left)
+        y = int(region_top - shape_top)
+
+        image.paste(rendered_region, (x, y), rendered_region)
+
+    return image, sides
+
+
+def render_movie_clip(
+    swf: "SupercellSWF",
+    movie_clip: "MovieClip",
+    matrix: Optional[Matrix2x3] = None,
+    frame_index: int = 0,
+    cache: Optional["RenderCache"] = None,
+) -> Tuple[Image.Image, Sides]:
+    """Renders one movie clip frame transformed by the matrix.
+
+    :param swf: file the movie clip belongs to
+    :param movie_clip: movie clip to render
+    :param matrix: affine matrix
+    :param frame_index: index of the frame to render
+    :param cache: caller owned cache of rendered children
+    :return: rendered frame, left, top, right, bottom of the whole timeline
+    """
+
+    sides = movie_clip.get_sides(swf, matrix)
+    return movie_clip.render_frame(swf, frame_index, sides, cache, matrix), sides
+
+
+def transform_image(
+    image: Image.Image, image_sides: Sides, sides: Sides, matrix: Matrix2x3
+) -> Image.Image:
+    """Draws image placed at image sides through the matrix onto a canvas of sides.
+
+    :param image: image to transform
+    :param image_sides: sides of the image before transformation
+    :param sides: sides of the output canvas
+    :param matrix: affine matrix
+    :return: transformed image
+    """
+
+    image_left, image_top, image_right, image_bottom = image_sides
+    left, top, right, bottom = sides
+
+    width, height = get_size(left, top, right, bottom)
+    size = max(ceil(width), 1), max(ceil(height), 1)
+
+    determinant = matrix.scale_x * matrix.scale_y - matrix.shear_y * matrix.shear_x
+    if determinant == 0:
+        return Image.new("RGBA", size)
+
+    # Pillow maps output pixels back to input ones, so the inverse matrix
+    # is needed, along with the scale between image and region sizes
+    scale_x = image.width / max(image_right - image_left, 1)
+    scale_y = image.height / max(image_bottom - image_top, 1)
+
+    inverse_a = matrix.scale_y / determinant
+    inverse_b = -matrix.shear_y / determinant
+    inverse_c = -matrix.shear_x / determinant
+    inverse_d = matrix.scale_x / determinant
+
+    offset_x = left - matrix.x
+    offset_y = top - matrix.y
+
+    return image.transform(
+        size,
+        Image.AFFINE,
+        (
+            inverse_a * scale_x,
+            inverse_b * scale_x,
+            ((inverse_a * offset_x + inverse_b * offset_y) - image_left) * scale_x,
+            inverse_c * scale_y,
+            inverse_d * scale_y,
+            ((inverse_c * offset_x + inverse_d * offset_y) - image_top) * scale_y,
+        ),
+        resample=Image.BILINEAR,
+    )
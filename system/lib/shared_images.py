@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+SHARED_MODE = "RGBA"
+
+
+@dataclass
+class SharedImageInfo:
+    name: str
+    size: Tuple[int, int]
+
+
+def share_images(
+    images: List[Image.Image],
+) -> Tuple[List[SharedMemory], List[SharedImageInfo]]:
+    """Copies images into shared memory blocks, once per image.
+
+    Images are stored as RGBA, the mode regions are rendered in anyway.
+    The caller owns the returned blocks and must close and unlink them.
+
+    :param images: images to share
+    :return: shared memory blocks, picklable descriptions of them
+    """
+
+    blocks = []
+    infos = []
+    for image in images:
+        if image.mode != SHARED_MODE:
+            image = image.convert(SHARED_MODE)
+
+        width, height = image.size
+        block = SharedMemory(create=True, size=max(width * height * 4, 1))
+        pixels = np.ndarray((height, width, 4), np.uint8, block.buf)
+        pixels[:] = np.asarray(image)
+        del pixels
+
+        blocks.append(block)
+        infos.append(SharedImageInfo(block.name, image.size))
+
+    return blocks, infos
+
+
+def attach_images(
+    infos: List[SharedImageInfo],
+) -> Tuple[List[SharedMemory], List[Image.Image]]:
+    """Opens images shared by another process without copying pixels.
+
+    :param infos: descriptions returned by share_images
+    :return: attached blocks that must outlive the images, images
+    """
+
+    blocks = []
+    images = []
+    for info in infos:
+        block = SharedMemory(info.name)
+        blocks.append(block)
+        images.append(
+            Image.frombuffer(
+                SHARED_MODE, info.size, block.buf, "raw", SHARED_MODE, 0, 1
+            )
+        )
+
+    return blocks, images
+
+
+def release_images(blocks: List[SharedMemory], unlink: bool = False) -> None:
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
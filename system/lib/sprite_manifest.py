@@ -0,0 +1,85 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, TypeAlias
+
+from system.lib.helper import get_sides, get_size
+from system.lib.image_writer import ImageWriter
+from system.lib.objects import Shape
+from system.lib.objects.shape import Region
+
+MANIFEST_FILENAME = "sprites.json"
+
+# Sprite names of every region, mapped to the sprite really written for it.
+# Names have no extension, files are written in the configured image format.
+SpriteManifest: TypeAlias = Dict[str, str]
+
+
+def get_region_name(shape_id: int, region_index: int) -> str:
+    return f"shape_{shape_id}_{region_index}"
+
+
+def get_region_key(region: Region) -> tuple:
+    """Returns what a region sprite depends on, equal for identical sprites.
+
+    Sprites are cut from the texture by UV polygon, then rotated and
+    mirrored. Single pixel sprites are drawn with the XY polygon instead,
+    so its shape is a part of their key.
+
+    :param region: region to describe
+    :return: hashable key
+    """
+
+    uv_points = tuple(
+        region.get_uv(i).position for i in range(region.get_points_count())
+    )
+    key = region.texture_index, uv_points, region.rotation, region.is_mirrored
+
+    width, height = get_size(*get_sides(list(uv_points)))
+    if max(width, 1) + max(height, 1) == 2:
+        left, top, _, _ = region.get_local_sides()
+        key += (tuple((x - left, y - top) for x, y in region.get_xy_points()),)
+    return key
+
+
+def create_sprite_manifest(shapes: List[Shape]) -> SpriteManifest:
+    """Maps every region to the first region with an identical sprite.
+
+    :param shapes: shapes to cut sprites from
+    :return: manifest, unique sprites are mapped to themselves
+    """
+
+    manifest = {}
+    stored_names: Dict[tuple, str] = {}
+    for shape in shapes:
+        for region_index, region in enumerate(shape.regions):
+            name = get_region_name(shape.id, region_index)
+            manifest[name] = stored_names.setdefault(get_region_key(region), name)
+    return manifest
+
+
+def is_stored(manifest: SpriteManifest, name: str) -> bool:
+    return manifest.get(name, name) == name
+
+
+def write_sprite_manifest(
+    manifest: SpriteManifest, folder: Path, writer: ImageWriter
+) -> None:
+    writer.write_data(
+        folder / MANIFEST_FILENAME, json.dumps(manifest, indent=4).encode()
+    )
+
+
+def load_sprite_manifest(folder: Path) -> SpriteManifest:
+    """Loads the manifest of a sprites folder, empty if there is none.
+
+    :param folder: folder with cut sprites
+    :return: manifest
+    """
+
+    manifest_path = folder / MANIFEST_FILENAME
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
@@ -1,5 +1,5 @@
 import os
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 from loguru import logger
 import os
@@ -106,6 +106,8 @@ class SupercellSWF:
         self._matrix_banks: List[MatrixBank] = []
         self._matrix_bank: MatrixBank
 
+        self._display_objects: Dict[int, Shape | MovieClip] = {}
+
     def load(self, filepath: str | os.PathLike) -> Tuple[bool, bool]:
         self._filepath = str(filepath)
 
@@ -275,6 +277,13 @@ class SupercellSWF:
 
         loaded = self._load_tags(is_texture_file)
 
+        if not is_texture_file:
+            # Shapes win over movie clips with the same id, as in a linear search
+            self._display_objects = {
+                display_object.id: display_object
+                for display_object in [*self.movie_clips, *self.shapes]
+            }
+
         for i in range(self._export_count):
             export_id = self._export_ids[i]
             export_name = self._export_names[i]
@@ -296,6 +305,7 @@ class SupercellSWF:
         movie_clips_loaded = 0
         shapes_loaded = 0
         matrices_loaded = 0
+        color_transforms_loaded = 0
 
         tag_cout_dict = {}
         tag_count = 0
@@ -331,6 +341,11 @@ class SupercellSWF:
             elif tag == 8 or tag == 36:  # Matrix
                 self._matrix_bank.get_matrix(matrices_loaded).load(self.reader, tag)
                 matrices_loaded += 1
+            elif tag == 9:  # ColorTransform
+                self._matrix_bank.load_color_transform(
+                    color_transforms_loaded, self.reader
+                )
+                color_transforms_loaded += 1
             elif tag == 26:
                 has_texture = False
             elif tag == 30:
@@ -361,25 +376,19 @@ class SupercellSWF:
                 self._matrix_banks.append(self._matrix_bank)
 
                 matrices_loaded = 0
+                color_transforms_loaded = 0
             elif tag == 45:
-                # print("ktx=>", length)
-                # self.reader.read_uint()
-                file_size = self.reader.read_uint()
-
-                subType = self.reader.read_char()
-                width = self.reader.read_ushort()
-                height = self.reader.read_ushort()
-
-                data = self.reader.read(file_size)
-                image = load_ktx(data)
+                tag_start = self.reader.tell() - 5
+                ktx_size = self.reader.read_uint()
 
                 if texture_id >= len(self.textures):
                     self.textures.append(SWFTexture())
 
                 texture = self.textures[texture_id]
-                texture.height = height
-                texture.width = width
-                texture.image = image
+                texture.load_ktx(self, ktx_size)
+                texture.tag_data = self.reader.getbuffer()[
+                    tag_start : self.reader.tell()
+                ]
                 texture_id += 1
             else:
                 self.reader.read(length)
@@ -387,13 +396,8 @@ class SupercellSWF:
     def get_display_object(
         self, target_id: int, name: str | None = None, *, raise_error: bool = False
     ) -> Shape | MovieClip | None:
-        for shape in self.shapes:
-            if shape.id == target_id:
-                return shape
-
-        for movie_clip in self.movie_clips:
-            if movie_clip.id == target_id:
-                return movie_clip
+        if target_id in self._display_objects:
+            return self._display_objects[target_id]
 
         if raise_error:
             exception_text = (
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import json
 import os
+import struct
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Tuple
@@ -46,6 +48,12 @@ class FileInfo:
     use_lzham: bool
     sheets: list[SheetInfo]
     shapes: list[ShapeInfo]
+    # Compression settings picked by the tuner, see system.lib.compression
+    compression: dict | None = None
+
+
+# Trailer with compression settings: JSON, its uint16 length and the magic
+COMPRESSION_MAGIC = b"XCMP"
 
 
 def parse_info(metadata_file_path: Path, has_detailed_info: bool) -> FileInfo:
@@ -53,11 +61,13 @@ def parse_info(metadata_file_path: Path, has_detailed_info: bool) -> FileInfo:
     print()
 
     with open(metadata_file_path, "rb") as file:
-        reader = Reader(file.read(), "big")
+        data, compression = _split_compression_trailer(file.read())
+        reader = Reader(data, "big")
 
     ensure_magic_known(reader)
 
     file_info = FileInfo(os.path.splitext(metadata_file_path.name)[0], False, [], [])
+    file_info.compression = compression
     parse_base_info(file_info, reader)
 
     if has_detailed_info:
@@ -102,6 +112,36 @@ def parse_detailed_info(file_info: FileInfo, reader: Reader) -> None:
         file_info.shapes.append(ShapeInfo(shape_id, regions))
 
 
+def write_compression_info(metadata_file_path: Path, compression: dict) -> None:
+    """Stores compression settings at the end of a .xcod file.
+
+    :param metadata_file_path: .xcod file path
+    :param compression: settings to reuse on later encodes
+    """
+
+    with open(metadata_file_path, "rb") as file:
+        data, _ = _split_compression_trailer(file.read())
+
+    encoded = json.dumps(compression).encode()
+    with open(metadata_file_path, "wb") as file:
+        file.write(data)
+        file.write(encoded)
+        file.write(struct.pack(">H", len(encoded)))
+        file.write(COMPRESSION_MAGIC)
+
+
+def _split_compression_trailer(data: bytes) -> Tuple[bytes, dict | None]:
+    if not data.endswith(COMPRESSION_MAGIC):
+        return data, None
+
+    length_offset = len(data) - len(COMPRESSION_MAGIC) - 2
+    (length,) = struct.unpack_from(">H", data, length_offset)
+    return (
+        data[: length_offset - length],
+        json.loads(data[length_offset - length : length_offset]),
+    )
+
+
 def ensure_magic_known(reader: Reader) -> None:
     magic = reader.read(4)
     if magic != b"XCOD":
@@ -66,7 +66,6 @@ class Locale:
         self.saved: str = DEFAULT_STRING
         self.xcod_not_found: str = DEFAULT_STRING
         self.illegal_size: str = DEFAULT_STRING
-        self.resize_qu: str = DEFAULT_STRING
         self.resizing: str = DEFAULT_STRING
         self.split_pic: str = DEFAULT_STRING
         self.writing_pic: str = DEFAULT_STRING
@@ -74,10 +73,20 @@ class Locale:
         self.compressing_with: str = DEFAULT_STRING
         self.compression_error: str = DEFAULT_STRING
         self.compression_done: str = DEFAULT_STRING
+        self.compression_stats: str = DEFAULT_STRING
+        self.compression_tuned: str = DEFAULT_STRING
         self.dir_empty: str = DEFAULT_STRING
         self.not_found: str = DEFAULT_STRING
         self.cut_sprites_process: str = DEFAULT_STRING
         self.place_sprites_process: str = DEFAULT_STRING
+        self.repacking_sheet: str = DEFAULT_STRING
+        self.ktx_sheet_changed: str = DEFAULT_STRING
+        self.batch_started: str = DEFAULT_STRING
+        self.batch_columns: str = DEFAULT_STRING
+        self.batch_ok: str = DEFAULT_STRING
+        self.batch_failed: str = DEFAULT_STRING
+        self.batch_summary: str = DEFAULT_STRING
+        self.render_movie_clips_process: str = DEFAULT_STRING
         self.not_implemented: str = DEFAULT_STRING
         self.error: str = DEFAULT_STRING
 
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Every module is imported in a fresh interpreter, as import cycles only
+# show up depending on which module is imported first
+MODULES = [
+    "system.lib.helper",
+    "system.lib.objects",
+    "system.lib.features.sc.decode",
+    "system.lib.features.sc.encode",
+    "system.lib.features.movie_clips",
+    "system.lib.sprite_manifest",
+    # Entry scripts
+    "decode_sc",
+    "decode_tex",
+    "decode_csv",
+]
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_module_imports(module: str, tmp_path: Path) -> None:
+    _assert_imports(f"import {module}", tmp_path)
+
+
+def test_menu_imports(tmp_path: Path) -> None:
+    _assert_imports("import system.lib; import system.lib.features.sc.decode", tmp_path)
+
+
+def _assert_imports(code: str, cwd: Path) -> None:
+    # Config, languages and logs are found relative to the working folder
+    os.symlink(ROOT / "system", cwd / "system")
+
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
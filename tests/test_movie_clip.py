@@ -0,0 +1,87 @@
+from typing import List, Tuple
+
+import pytest
+
+from system.lib.matrices.matrix_bank import MatrixBank
+from system.lib.objects import MovieClip, Shape
+from system.lib.objects.movie_clip import MovieClipFrame
+from system.lib.swf import SupercellSWF
+
+NO_TRANSFORM = 65535
+
+SHAPE_SIDES = {1: (0, 0, 10, 10), 2: (20, 0, 30, 10)}
+
+
+def create_swf(clips: List[Tuple[int, List[int]]]) -> SupercellSWF:
+    """Creates a file with two shapes and one frame movie clips.
+
+    :param clips: movie clip ids and ids of their children
+    :return: file
+    """
+
+    swf = SupercellSWF()
+
+    matrix_bank = MatrixBank()
+    matrix_bank.init(0, 0)
+    swf._matrix_banks.append(matrix_bank)
+
+    for shape_id, sides in SHAPE_SIDES.items():
+        shape = Shape()
+        shape.id = shape_id
+        shape._sides = sides
+        swf.shapes.append(shape)
+        swf._display_objects[shape_id] = shape
+
+    for clip_id, binds in clips:
+        frame = MovieClipFrame()
+        frame._elements_count = len(binds)
+        frame.set_elements(
+            [
+                (child_index, NO_TRANSFORM, NO_TRANSFORM)
+                for child_index in range(len(binds))
+            ]
+        )
+
+        movie_clip = MovieClip()
+        movie_clip.id = clip_id
+        movie_clip.binds = binds
+        movie_clip.frames.append(frame)
+        swf.movie_clips.append(movie_clip)
+        swf._display_objects[clip_id] = movie_clip
+
+    return swf
+
+
+def get_shape_ids(swf: SupercellSWF, clip_id: int) -> List[int]:
+    movie_clip = swf.get_display_object(clip_id)
+    return movie_clip.get_display_list(swf, 0).shape_ids.tolist()
+
+
+def test_self_referencing_clip_is_empty_inside_itself():
+    swf = create_swf([(10, [1, 10])])
+    movie_clip = swf.get_display_object(10)
+
+    assert get_shape_ids(swf, 10) == [1]
+    assert movie_clip.get_sides(swf) == SHAPE_SIDES[1]
+
+
+def test_self_referencing_clip_inside_another_clip():
+    swf = create_swf([(10, [1, 10]), (11, [10, 2])])
+
+    assert get_shape_ids(swf, 11) == [1, 2]
+    assert get_shape_ids(swf, 10) == [1]
+
+
+@pytest.mark.parametrize("first_clip_id", [20, 22])
+def test_clip_cut_by_a_cycle_is_not_reused(first_clip_id: int):
+    # 20 and 21 contain each other, 22 contains 21
+    clips = [(20, [1, 21]), (21, [2, 20]), (22, [21])]
+    expected_swf = create_swf(clips)
+    expected_shape_ids = get_shape_ids(expected_swf, 21)
+
+    swf = create_swf(clips)
+    get_shape_ids(swf, first_clip_id)
+
+    assert expected_shape_ids == [2, 1]
+    assert get_shape_ids(swf, 21) == expected_shape_ids
+    assert swf.get_display_object(21).get_sides(swf) == (0, 0, 30, 10)